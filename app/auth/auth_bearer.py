@@ -4,9 +4,9 @@ from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 
-from app.config.config import Settings
+from app.config.config import get_settings
 
-app_settings = Settings()
+app_settings = get_settings()
 
 
 class JWTBearer(HTTPBearer):
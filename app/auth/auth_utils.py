@@ -2,14 +2,14 @@ import jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer
 from app.auth.auth_bearer import JWTBearer
-from app.config.config import Settings
+from app.config.config import get_settings
 from app.models.goal import UserRoles
 from bson import ObjectId
 
 from datetime import datetime
 
 oauth2_scheme = HTTPBearer()
-app_settings = Settings()
+app_settings = get_settings()
 
 
 class ObjectIdPydantic(str):
@@ -40,6 +40,33 @@ def get_user_id(token: str = Depends(JWTBearer())) -> ObjectId:
         )
 
 
+def get_trainer_id(token: str = Depends(JWTBearer())) -> ObjectId:
+    try:
+        payload = jwt.decode(
+            token, app_settings.JWT_SECRET, algorithms=app_settings.JWT_ALGORITHM
+        )
+        user_id, role = ObjectId(payload["id"]), payload.get("role")
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid token"
+        )
+    if role != UserRoles.TRAINER.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Only trainers allowed"
+        )
+    return user_id
+
+
+def is_admin_token(token: str) -> bool:
+    try:
+        payload = jwt.decode(
+            token, app_settings.JWT_SECRET, algorithms=app_settings.JWT_ALGORITHM
+        )
+    except Exception:
+        return False
+    return payload.get("role") == UserRoles.ADMIN.value
+
+
 def generate_token_with_role(id: str, role: UserRoles) -> str:
     utcnow = datetime.utcnow()
     expires = utcnow + app_settings.EXPIRES
@@ -1,18 +1,29 @@
 from dotenv import load_dotenv
-from logging.config import dictConfig
 from os import environ
 from pydantic import BaseSettings
-from app.config.log_config import logconfig
+from app.config.log_config import setup_logging
 from datetime import timedelta
+from functools import lru_cache
 import logging
 
 load_dotenv()
-dictConfig(logconfig)
+log_listener = setup_logging(
+    level=environ.get("LOG_LEVEL", "INFO"),
+    fmt=environ.get("LOG_FORMAT", "json"),
+    sample_rate=float(environ.get("LOG_SAMPLE_RATE", 1.0)),
+    rate_limit=float(environ.get("LOG_RATE_LIMIT", 100)),
+)
 logger = logging.getLogger('app')
 
 
 class Settings(BaseSettings):
     MONGODB_URI: str = environ.get("MONGODB_URI", "mongodb:27017")
+    MONGODB_READ_PREFERENCE: str = environ.get(
+        "MONGODB_READ_PREFERENCE", "secondaryPreferred"
+    )
+    MONGODB_MAX_STALENESS_SECONDS: int = int(
+        environ.get("MONGODB_MAX_STALENESS_SECONDS", -1)
+    )
     JWT_SECRET: str = environ.get("JWT_SECRET", "123456")
     JWT_ALGORITHM: str = environ.get("JWT_ALGORITHM", "HS256")
     RESET_PASSWORD_EXPIRATION_MINUTES = environ.get(
@@ -25,11 +36,89 @@ class Settings(BaseSettings):
     TRAINING_SERVICE_URL = environ.get(
         'TRAINING_SERVICE_URL', 'http://training-microservice:7501'
     )
+    CACHE_MAX_ENTRIES: int = int(environ.get("CACHE_MAX_ENTRIES", 10000))
+    TRAINING_CACHE_TTL_SECONDS: float = float(
+        environ.get("TRAINING_CACHE_TTL_SECONDS", 30)
+    )
+    TRAINING_CACHE_NEGATIVE_TTL_SECONDS: float = float(
+        environ.get("TRAINING_CACHE_NEGATIVE_TTL_SECONDS", 10)
+    )
+    CALIBRATION_CACHE_TTL_SECONDS: float = float(
+        environ.get("CALIBRATION_CACHE_TTL_SECONDS", 30)
+    )
+    GOALS_STORAGE_MODE: str = environ.get("GOALS_STORAGE_MODE", "document")
+    GOALS_BUCKET_SIZE: int = int(environ.get("GOALS_BUCKET_SIZE", 200))
+    GOALS_ARCHIVE_AFTER_DAYS: int = int(environ.get("GOALS_ARCHIVE_AFTER_DAYS", 90))
+    GOALS_ARCHIVE_TTL_DAYS: int = int(environ.get("GOALS_ARCHIVE_TTL_DAYS", 0))
+    GOALS_TOMBSTONE_TTL_DAYS: int = int(environ.get("GOALS_TOMBSTONE_TTL_DAYS", 30))
+    GOALS_SYNC_LAG_SECONDS: float = float(environ.get("GOALS_SYNC_LAG_SECONDS", 5))
+    GOALS_BULK_CHUNK_SIZE: int = int(environ.get("GOALS_BULK_CHUNK_SIZE", 500))
+    GOAL_PACE_TAU_HOURS: float = float(environ.get("GOAL_PACE_TAU_HOURS", 168))
+    REMINDERS_ENABLED: bool = (
+        environ.get("REMINDERS_ENABLED", "false").lower() == "true"
+    )
+    REMINDER_OFFSETS_HOURS: str = environ.get("REMINDER_OFFSETS_HOURS", "24,1")
+    REMINDER_WINDOW_SECONDS: int = int(environ.get("REMINDER_WINDOW_SECONDS", 3600))
+    REMINDER_RESOLUTION_SECONDS: int = int(
+        environ.get("REMINDER_RESOLUTION_SECONDS", 60)
+    )
+    REMINDER_INTERVAL_SECONDS: int = int(environ.get("REMINDER_INTERVAL_SECONDS", 30))
+    REMINDER_BATCH_SIZE: int = int(environ.get("REMINDER_BATCH_SIZE", 100))
+    TRAINING_COMPLETIONS_BATCH_ENABLED: bool = (
+        environ.get("TRAINING_COMPLETIONS_BATCH_ENABLED", "false").lower() == "true"
+    )
+    TRAINING_COMPLETIONS_BATCH_SIZE: int = int(
+        environ.get("TRAINING_COMPLETIONS_BATCH_SIZE", 100)
+    )
+    TRAINING_COMPLETIONS_FLUSH_SECONDS: float = float(
+        environ.get("TRAINING_COMPLETIONS_FLUSH_SECONDS", 1)
+    )
+    TRAINING_COMPLETIONS_MAX_BUFFER: int = int(
+        environ.get("TRAINING_COMPLETIONS_MAX_BUFFER", 10000)
+    )
+    TRAINING_SERVICE_TOKEN: str = environ.get("TRAINING_SERVICE_TOKEN", "")
+    PROGRESS_HISTORY_ENABLED: bool = (
+        environ.get("PROGRESS_HISTORY_ENABLED", "true").lower() == "true"
+    )
+    PROGRESS_HISTORY_FLUSH_SECONDS: float = float(
+        environ.get("PROGRESS_HISTORY_FLUSH_SECONDS", 5)
+    )
+    PROGRESS_HISTORY_MAX_BUFFER: int = int(
+        environ.get("PROGRESS_HISTORY_MAX_BUFFER", 10000)
+    )
+    GOAL_EVENTS_FEED: str = environ.get("GOAL_EVENTS_FEED", "none")
+    GOAL_EVENTS_POLL_SECONDS: float = float(environ.get("GOAL_EVENTS_POLL_SECONDS", 1))
+    GOAL_EVENTS_QUEUE_SIZE: int = int(environ.get("GOAL_EVENTS_QUEUE_SIZE", 100))
+    GOAL_EVENTS_MAX_PER_USER: int = int(environ.get("GOAL_EVENTS_MAX_PER_USER", 5))
+    GOAL_EVENTS_KEEPALIVE_SECONDS: float = float(
+        environ.get("GOAL_EVENTS_KEEPALIVE_SECONDS", 15)
+    )
+    LOOP_WATCHDOG_ENABLED: bool = (
+        environ.get("LOOP_WATCHDOG_ENABLED", "true").lower() == "true"
+    )
+    LOOP_WATCHDOG_INTERVAL_SECONDS: float = float(
+        environ.get("LOOP_WATCHDOG_INTERVAL_SECONDS", 0.1)
+    )
+    LOOP_WATCHDOG_THRESHOLD_SECONDS: float = float(
+        environ.get("LOOP_WATCHDOG_THRESHOLD_SECONDS", 0.25)
+    )
+    PROFILING_SAMPLE_RATE: float = float(environ.get("PROFILING_SAMPLE_RATE", 0))
+    PROFILING_INTERVAL_MS: float = float(environ.get("PROFILING_INTERVAL_MS", 1))
+    PROFILING_DIR: str = environ.get("PROFILING_DIR", "profiles")
+    TRACING_EXPORTER: str = environ.get("TRACING_EXPORTER", "none")
+    TRACING_SAMPLE_RATIO: float = float(environ.get("TRACING_SAMPLE_RATIO", 0.05))
+    TRACING_FILE_PATH: str = environ.get("TRACING_FILE_PATH", "traces.jsonl")
+    TRACING_OTLP_ENDPOINT: str = environ.get(
+        "TRACING_OTLP_ENDPOINT", "http://localhost:4318"
+    )
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
+# Una sola lectura del entorno y del .env por proceso: todos los modulos
+# comparten el mismo objeto
+@lru_cache()
 def get_settings() -> Settings:
     return Settings()
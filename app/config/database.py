@@ -0,0 +1,60 @@
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+DATABASE_NAME = "goals_microservice"
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def build_read_preference(name, max_staleness=-1):
+    if name not in READ_PREFERENCES:
+        raise ValueError(f'Unknown MongoDB read preference: {name}')
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness)
+
+
+def get_read_database(client, settings):
+    read_preference = build_read_preference(
+        settings.MONGODB_READ_PREFERENCE, settings.MONGODB_MAX_STALENESS_SECONDS
+    )
+    return client.get_database(DATABASE_NAME, read_preference=read_preference)
+
+
+def get_write_collection(request, name="goals"):
+    """Collection bound to the primary.
+
+    Marks the request as a writer: its later reads go to the primary too,
+    so a request always reads its own writes.
+    """
+    request.state.mongo_wrote = True
+    return request.app.database[name]
+
+
+def get_primary_collection(request, name):
+    """Collection bound to the primary, for reads that must see the writes
+    of earlier requests (e.g. a calibration saved just before)."""
+    return request.app.database[name]
+
+
+def get_read_collection(request, name="goals"):
+    """Collection routed with the configured read preference.
+
+    A secondary can be behind by up to MONGODB_MAX_STALENESS_SECONDS: the
+    routes that need the writes of earlier requests read the primary.
+    """
+    read_database = getattr(request.app, "read_database", None)
+    if read_database is None or getattr(request.state, "mongo_wrote", False):
+        return request.app.database[name]
+    return read_database[name]
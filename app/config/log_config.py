@@ -1,5 +1,20 @@
 # log_config.py
 
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var: ContextVar = ContextVar("request_id", default=None)
+
 logconfig = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -9,6 +24,9 @@ logconfig = {
             "fmt": "%(levelprefix)s %(asctime)s [%(filename)s:%(lineno)-d] %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
+        "json": {
+            "()": "app.config.log_config.JsonFormatter",
+        },
     },
     "handlers": {
         "default": {
@@ -21,3 +39,110 @@ logconfig = {
         "app": {"handlers": ["default"], "level": "DEBUG"},
     },
 }
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        log = {
+            "timestamp": datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f'{record.filename}:{record.lineno}',
+            "request_id": getattr(record, "request_id", None),
+        }
+        if record.exc_info:
+            log["exception"] = self.formatException(record.exc_info)
+        return json.dumps(log, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG/INFO records; warnings and errors always pass."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site (file and line) for DEBUG/INFO records."""
+
+    def __init__(self, rate=100.0, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hands records to a background listener instead of writing them inline.
+
+    Only the message is resolved on the caller thread (the args may be
+    mutated after the call); JSON formatting and I/O happen in the listener.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(
+    level="INFO", fmt="json", sample_rate=1.0, rate_limit=100.0, queue_size=10000
+):
+    config = copy.deepcopy(logconfig)
+    config["handlers"]["default"]["formatter"] = fmt
+    config["loggers"]["app"]["level"] = level
+    logging.config.dictConfig(config)
+
+    logger = logging.getLogger("app")
+    handlers = logger.handlers[:]
+    for handler in handlers:
+        logger.removeHandler(handler)
+
+    queue_handler = AsyncQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    queue_handler.addFilter(RateLimitFilter(rate_limit))
+    queue_handler.addFilter(RequestIdFilter())
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,146 @@
+"""Move old goals in a terminal state from `goals` to `goals_archive`.
+
+    $ python -m app.jobs.archive_goals --older-than-days 90 --ttl-days 365
+
+A goal is archived when it is COMPLETE, STOP or EXPIRED and its terminal
+date (`date_complete`, `date_stop` or `limit`) is older than the cutoff;
+goals without that date fall back to the creation time of their `_id`.
+Each batch is copied first and deleted after, so the job can be stopped
+and re-run. With `--ttl-days` the archive gets a TTL index on
+`archived_at` and Mongo drops archived goals on its own.
+
+Only the document layout is supported: buckets already keep the goals of
+a user together and are not scanned by `_id`.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import pymongo
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from app.config.config import logger, get_settings
+from app.config.database import DATABASE_NAME
+from app.jobs.migrate_goal_layout import insert_ignoring_duplicates
+from app.models.goal import State
+from app.repositories.goals import (
+    ARCHIVE_COLLECTION,
+    DOCUMENT_MODE,
+    TOMBSTONES_COLLECTION,
+    next_seq,
+    utcnow,
+)
+
+app_settings = get_settings()
+
+# Fecha en la que cada estado terminal dejo de cambiar
+TERMINAL_DATE_FIELDS = {
+    State.COMPLETE.value: "date_complete",
+    State.STOP.value: "date_stop",
+    State.EXPIRED.value: "limit",
+}
+
+
+def archivable(cutoff):
+    created_before = {"_id": {"$lt": ObjectId.from_datetime(cutoff)}}
+    return {
+        "$or": [
+            {
+                "state": state,
+                "$or": [
+                    {field: {"$lt": cutoff}},
+                    {field: None, **created_before},
+                ],
+            }
+            for state, field in TERMINAL_DATE_FIELDS.items()
+        ]
+    }
+
+
+def create_archive_indexes(database, ttl_days=0):
+    archive = database[ARCHIVE_COLLECTION]
+    archive.create_index([("user_id", ASCENDING)])
+    archive.create_index([("training_id", ASCENDING)], sparse=True)
+    if ttl_days:
+        archive.create_index(
+            [("archived_at", ASCENDING)],
+            expireAfterSeconds=int(timedelta(days=ttl_days).total_seconds()),
+        )
+
+
+def archive_goals(database, older_than, batch_size=500, pause=0.0, now=None):
+    goals, archive = database["goals"], database[ARCHIVE_COLLECTION]
+    now = now or datetime.now(timezone.utc)
+    query = archivable(now - older_than)
+    archived = 0
+
+    while True:
+        batch = list(goals.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        ids = [goal["_id"] for goal in batch]
+        insert_ignoring_duplicates(
+            archive, [{**goal, "archived_at": now} for goal in batch]
+        )
+        # Solo se borran las que siguen cumpliendo el filtro
+        deleted = goals.delete_many({"_id": {"$in": ids}, **query}).deleted_count
+        kept = set()
+        if deleted < len(ids):
+            kept = {
+                goal["_id"] for goal in goals.find({"_id": {"$in": ids}}, {"_id": 1})
+            }
+            archive.delete_many({"_id": {"$in": list(kept)}})
+
+        if deleted:
+            # Para el sync, una meta archivada desaparece como una borrada
+            seq, deleted_at = next_seq(database), utcnow()
+            insert_ignoring_duplicates(
+                database[TOMBSTONES_COLLECTION],
+                [
+                    {
+                        "_id": goal["_id"],
+                        "user_id": goal.get("user_id"),
+                        "seq": seq,
+                        "deleted_at": deleted_at,
+                    }
+                    for goal in batch
+                    if goal["_id"] not in kept
+                ],
+            )
+
+        archived += deleted
+        logger.info(f'Archived {archived} goals up to {ids[-1]}')
+        if pause:
+            time.sleep(pause)
+
+    return archived
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument(
+        "--older-than-days", type=int, default=app_settings.GOALS_ARCHIVE_AFTER_DAYS
+    )
+    arg_parser.add_argument(
+        "--ttl-days", type=int, default=app_settings.GOALS_ARCHIVE_TTL_DAYS
+    )
+    arg_parser.add_argument("--batch-size", type=int, default=500)
+    arg_parser.add_argument("--pause", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    if app_settings.GOALS_STORAGE_MODE != DOCUMENT_MODE:
+        arg_parser.error('Archiving is only supported with the document layout')
+
+    database = pymongo.MongoClient(app_settings.MONGODB_URI)[DATABASE_NAME]
+    create_archive_indexes(database, args.ttl_days)
+    archived = archive_goals(
+        database, timedelta(days=args.older_than_days), args.batch_size, args.pause
+    )
+    logger.info(f'Goal archival finished: {archived} goals archived')
+
+
+if __name__ == "__main__":
+    main()
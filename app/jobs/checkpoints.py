@@ -0,0 +1,20 @@
+from datetime import datetime, timezone
+
+CHECKPOINTS_COLLECTION = "job_checkpoints"
+
+
+def load_checkpoint(database, job, default=None):
+    checkpoint = database[CHECKPOINTS_COLLECTION].find_one({"_id": job})
+    return checkpoint["value"] if checkpoint else default
+
+
+def save_checkpoint(database, job, value):
+    database[CHECKPOINTS_COLLECTION].update_one(
+        {"_id": job},
+        {"$set": {"value": value, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def clear_checkpoint(database, job):
+    database[CHECKPOINTS_COLLECTION].delete_one({"_id": job})
@@ -0,0 +1,112 @@
+"""Convert stored goals between the document and bucket layouts.
+
+    $ python -m app.jobs.migrate_goal_layout --to bucket --bucket-size 200 --downtime
+    $ python -m app.jobs.migrate_goal_layout --to document --downtime
+
+Goals are moved one user at a time (insert first, delete after), so the
+job can be stopped and re-run: it continues with what is left.
+
+There is no lock nor dual write: a goal written through the API while its
+user is being moved is lost or left in the old layout. The API must be
+stopped during the migration and started again with the new
+GOALS_STORAGE_MODE; `--downtime` confirms that it is.
+"""
+
+import argparse
+
+import pymongo
+from pymongo.errors import BulkWriteError
+
+from app.config.config import logger, get_settings
+from app.config.database import DATABASE_NAME
+from app.repositories.goals import BucketGoalRepository, DocumentGoalRepository
+
+app_settings = get_settings()
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def insert_ignoring_duplicates(collection, docs):
+    # Al reanudar, lo ya insertado en la corrida anterior se ignora
+    try:
+        collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+def documents_to_buckets(database, bucket_size, batch_size=1000):
+    goals = database[DocumentGoalRepository.collection_name]
+    buckets = database[BucketGoalRepository.collection_name]
+    moved = 0
+
+    for user_id in goals.distinct("user_id"):
+        user_goals = list(
+            goals.find({"user_id": user_id}).sort("_id", 1).limit(batch_size)
+        )
+        while user_goals:
+            insert_ignoring_duplicates(
+                buckets,
+                [
+                    {
+                        "_id": group[0]["_id"],
+                        "user_id": user_id,
+                        "count": len(group),
+                        "goals": group,
+                    }
+                    for group in chunks(user_goals, bucket_size)
+                ],
+            )
+            goals.delete_many({"_id": {"$in": [goal["_id"] for goal in user_goals]}})
+            moved += len(user_goals)
+            user_goals = list(
+                goals.find({"user_id": user_id}).sort("_id", 1).limit(batch_size)
+            )
+        logger.info(f'Goals of user {user_id} moved to buckets')
+
+    return moved
+
+
+def buckets_to_documents(database, batch_size=100):
+    goals = database[DocumentGoalRepository.collection_name]
+    buckets = database[BucketGoalRepository.collection_name]
+    moved = 0
+
+    while batch := list(buckets.find().sort("_id", 1).limit(batch_size)):
+        docs = [goal for bucket in batch for goal in bucket["goals"]]
+        if docs:
+            insert_ignoring_duplicates(goals, docs)
+        buckets.delete_many({"_id": {"$in": [bucket["_id"] for bucket in batch]}})
+        moved += len(docs)
+        logger.info(f'{moved} goals moved to documents')
+
+    return moved
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--to", choices=["bucket", "document"], required=True)
+    arg_parser.add_argument(
+        "--bucket-size", type=int, default=app_settings.GOALS_BUCKET_SIZE
+    )
+    arg_parser.add_argument("--batch-size", type=int, default=1000)
+    arg_parser.add_argument("--downtime", action="store_true")
+    args = arg_parser.parse_args()
+    if not args.downtime:
+        arg_parser.error("stop the API before migrating, then pass --downtime")
+
+    database = pymongo.MongoClient(app_settings.MONGODB_URI)[DATABASE_NAME]
+    if args.to == "bucket":
+        BucketGoalRepository.create_indexes(database)
+        moved = documents_to_buckets(database, args.bucket_size, args.batch_size)
+    else:
+        DocumentGoalRepository.create_indexes(database)
+        moved = buckets_to_documents(database, args.batch_size)
+    logger.info(f'Migration to {args.to} layout finished: {moved} goals moved')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Backfill goal dates to BSON UTC datetimes under their canonical names.
+
+    $ python -m app.jobs.normalize_goal_dates --batch-size 500
+
+Fixes string-typed `limit`, `date_init` and `date_complete` values and
+renames the legacy `limit_time` field to `limit`. It walks `goals` in
+`_id` order and saves the last processed `_id` after every batch, so it
+can run online and be resumed. Each update is conditioned on the value
+it read, so a concurrent write from the API is never overwritten.
+"""
+
+import argparse
+import time
+
+import pymongo
+from pymongo import UpdateOne
+
+from app.config.config import logger, get_settings
+from app.config.database import DATABASE_NAME
+from app.jobs.checkpoints import clear_checkpoint, load_checkpoint, save_checkpoint
+from app.models.goal import GOAL_DATE_FIELDS, to_utc
+
+app_settings = get_settings()
+
+JOB_NAME = "normalize_goal_dates"
+
+NEEDS_FIX = {
+    "$or": [{field: {"$type": "string"}} for field in GOAL_DATE_FIELDS]
+    + [{"limit_time": {"$exists": True}}]
+}
+
+
+def goal_date_fixes(goal):
+    """Return (condition, update) for a goal, or None if it is already canonical."""
+    condition, to_set, to_unset = {"_id": goal["_id"]}, {}, {}
+
+    if "limit_time" in goal:
+        condition["limit_time"] = goal["limit_time"]
+        to_unset["limit_time"] = ""
+        if goal.get("limit") is None and goal["limit_time"] is not None:
+            to_set["limit"] = to_utc(goal["limit_time"])
+
+    for field in GOAL_DATE_FIELDS:
+        if isinstance(goal.get(field), str):
+            condition[field] = goal[field]
+            to_set[field] = to_utc(goal[field])
+
+    update = {}
+    if to_set:
+        update["$set"] = to_set
+    if to_unset:
+        update["$unset"] = to_unset
+    return (condition, update) if update else None
+
+
+def normalize_goal_dates(database, batch_size=500, pause=0.0, restart=False):
+    goals = database["goals"]
+    if restart:
+        clear_checkpoint(database, JOB_NAME)
+    last_id = load_checkpoint(database, JOB_NAME)
+    fixed = 0
+
+    while True:
+        query = dict(NEEDS_FIX)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(goals.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne(*fix) for goal in batch if (fix := goal_date_fixes(goal))
+        ]
+        if operations:
+            fixed += goals.bulk_write(operations, ordered=False).modified_count
+
+        last_id = batch[-1]["_id"]
+        save_checkpoint(database, JOB_NAME, last_id)
+        logger.info(f'Goal dates normalized up to {last_id} ({fixed} fixed)')
+        if pause:
+            # Deja respirar al primario cuando corre con trafico
+            time.sleep(pause)
+
+    return fixed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--batch-size", type=int, default=500)
+    arg_parser.add_argument("--pause", type=float, default=0.0)
+    arg_parser.add_argument("--restart", action="store_true")
+    args = arg_parser.parse_args()
+
+    database = pymongo.MongoClient(app_settings.MONGODB_URI)[DATABASE_NAME]
+    fixed = normalize_goal_dates(database, args.batch_size, args.pause, args.restart)
+    logger.info(f'Goal dates backfill finished: {fixed} goals fixed')
+
+
+if __name__ == "__main__":
+    main()
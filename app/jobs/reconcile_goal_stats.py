@@ -0,0 +1,128 @@
+"""Recompute the `goal_stats` documents from the goals and report drift.
+
+    $ python -m app.jobs.reconcile_goal_stats          # report only
+    $ python -m app.jobs.reconcile_goal_stats --fix    # also overwrite
+
+The stats are rebuilt with one aggregation over the goals of the current
+layout plus `goals_archive`, then compared with the stored documents.
+"""
+
+import argparse
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import pymongo
+from pymongo import DeleteOne, UpdateOne
+
+from app.config.config import logger, get_settings
+from app.config.database import DATABASE_NAME
+from app.repositories.goal_stats import (
+    STATS_COLLECTION,
+    StatsDelta,
+    goal_metric,
+    state_name,
+)
+from app.repositories.goals import (
+    ARCHIVE_COLLECTION,
+    BUCKET_MODE,
+    get_goal_repository_class,
+)
+
+app_settings = get_settings()
+
+GROUP_BY_USER_STATE_METRIC = {
+    "$group": {
+        "_id": {"user_id": "$user_id", "state": "$state", "metric": "$metric"},
+        "count": {"$sum": 1},
+        "progress": {"$sum": "$progress_steps"},
+    }
+}
+UNWIND_BUCKETS = [{"$unwind": "$goals"}, {"$replaceRoot": {"newRoot": "$goals"}}]
+
+
+def compute_stats(database, mode=None):
+    mode = mode or app_settings.GOALS_STORAGE_MODE
+    goals = database[get_goal_repository_class(mode).collection_name]
+    sources = [
+        (goals, UNWIND_BUCKETS if mode == BUCKET_MODE else []),
+        (database[ARCHIVE_COLLECTION], []),
+    ]
+
+    stats = defaultdict(StatsDelta)
+    for collection, prefix in sources:
+        for row in collection.aggregate(prefix + [GROUP_BY_USER_STATE_METRIC]):
+            key = row["_id"]
+            user_stats = stats[str(key["user_id"])]
+            user_stats.states[state_name(key.get("state"))] += row["count"]
+            user_stats.progress[goal_metric(key)] += row["progress"] or 0
+    return stats
+
+
+def as_counts(values):
+    return {key: value for key, value in (values or {}).items() if value}
+
+
+def drifted(stored, computed):
+    if as_counts(stored.get("states")) != as_counts(computed.states):
+        return True
+    stored_progress, computed_progress = stored.get("progress") or {}, computed.progress
+    return any(
+        not math.isclose(
+            stored_progress.get(metric, 0),
+            computed_progress.get(metric, 0),
+            abs_tol=1e-6,
+        )
+        for metric in set(stored_progress) | set(computed_progress)
+    )
+
+
+def reconcile_goal_stats(database, fix=False, mode=None):
+    """Return the ids of the users whose stored stats drifted."""
+    computed = compute_stats(database, mode)
+    stored = {doc["_id"]: doc for doc in database[STATS_COLLECTION].find()}
+    now = datetime.now(timezone.utc)
+
+    drift, operations = [], []
+    for user_id in set(computed) | set(stored):
+        user_stats = computed.get(user_id)
+        if user_stats is None:
+            # Stats de un usuario sin metas: solo es drift si no esta en cero
+            if drifted(stored[user_id], StatsDelta()):
+                drift.append(user_id)
+                operations.append(DeleteOne({"_id": user_id}))
+        elif user_id not in stored or drifted(stored[user_id], user_stats):
+            drift.append(user_id)
+            operations.append(
+                UpdateOne(
+                    {"_id": user_id},
+                    {
+                        "$set": {
+                            "states": as_counts(user_stats.states),
+                            "progress": as_counts(user_stats.progress),
+                            "updated_at": now,
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+
+    for user_id in drift[:20]:
+        logger.warning(f'Goal stats drift for user {user_id}')
+    logger.info(f'Goal stats drift in {len(drift)} of {len(computed)} users')
+    if fix and operations:
+        database[STATS_COLLECTION].bulk_write(operations, ordered=False)
+    return drift
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--fix", action="store_true")
+    args = arg_parser.parse_args()
+
+    database = pymongo.MongoClient(app_settings.MONGODB_URI)[DATABASE_NAME]
+    reconcile_goal_stats(database, args.fix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Repair goals left inconsistent by old bugs, in parallel over `_id` ranges.
+
+    $ python -m app.jobs.repair_goals --workers 8 --dry-run
+    $ python -m app.jobs.repair_goals --workers 8 --processes
+
+A goal is repaired when:
+- its `limit` is a string: it is stored as a UTC datetime;
+- it is past its `limit` and NOT_INIT, INIT or STOP: it becomes EXPIRED,
+  through `state_transition` like in `update_state_goal`.
+
+Goals that reached their quantity are not completed here: completing a
+goal also completes its training and notifies the user, and that is done
+by the progress routes with the user's token.
+
+`goals` is split into `_id` ranges by creation time, several per worker
+so that a dense range does not hold back the pool. Each range is walked
+in `_id` order with bulk writes conditioned on the values read, and its
+last `_id` is checkpointed after every batch; a re-run resumes the same
+ranges (`--restart` plans them again). `--dry-run` only counts the
+repairs. Goal stats are not touched: run `reconcile_goal_stats --fix`
+after a repair.
+
+Only the document layout is supported.
+"""
+
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pymongo
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.config.config import logger, get_settings
+from app.config.database import DATABASE_NAME
+from app.jobs.checkpoints import clear_checkpoint, load_checkpoint, save_checkpoint
+from app.models.goal import FINISHED_STATES, State, state_transition, to_utc
+from app.repositories.goals import DOCUMENT_MODE, next_seq, utcnow
+
+app_settings = get_settings()
+
+JOB_NAME = "repair_goals"
+
+STRING_LIMIT = "string_limit"
+EXPIRED = "expired"
+MODIFIED = "modified"
+
+REPAIR_FIELDS = {"state": 1, "limit": 1}
+# Estados que pueden vencer
+EXPIRABLE = [state.value for state in State if state.value not in FINISHED_STATES]
+
+
+def needs_repair(now):
+    return {
+        "$or": [
+            {"limit": {"$type": "string"}},
+            {"state": {"$in": EXPIRABLE}, "limit": {"$lt": now}},
+        ]
+    }
+
+
+def goal_repair(goal, now):
+    """Return (condition, changes, rules) for a goal, or None if it is consistent."""
+    condition, changes, rules = {"_id": goal["_id"], "state": goal.get("state")}, {}, []
+
+    if isinstance(goal.get("limit"), str):
+        condition["limit"] = goal["limit"]
+        changes["limit"] = to_utc(goal["limit"])
+        rules.append(STRING_LIMIT)
+
+    state = goal.get("state")
+    if state in EXPIRABLE:
+        transition, _ = state_transition(goal, state, now)
+        if transition["state"] == State.EXPIRED.value:
+            changes.update(transition)
+            rules.append(EXPIRED)
+
+    return (condition, changes, rules) if changes else None
+
+
+def connect():
+    # Cada proceso del pool abre su propio cliente: pymongo no sobrevive a un fork
+    return pymongo.MongoClient(app_settings.MONGODB_URI, tz_aware=True)[DATABASE_NAME]
+
+
+def plan_ranges(goals, count):
+    """Split the `_id`s of `goals` in `count` ranges of equal creation time."""
+    first = goals.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+    last = goals.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if first is None:
+        return []
+    start = first["_id"].generation_time.timestamp()
+    span = last["_id"].generation_time.timestamp() - start + 1
+    bounds = [
+        ObjectId.from_datetime(
+            datetime.fromtimestamp(start + span * index / count, timezone.utc)
+        )
+        for index in range(1, count)
+    ]
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def repair_range(connect, index, lower, upper, now, batch_size, dry_run):
+    database = connect()
+    goals = database["goals"]
+    job = f'{JOB_NAME}:{index}'
+    checkpoint = load_checkpoint(database, job, {})
+    report = Counter()
+    if checkpoint.get("done"):
+        return report
+
+    last_id = checkpoint.get("last_id")
+    query = needs_repair(now)
+    while True:
+        id_range = {}
+        if last_id is not None:
+            id_range["$gt"] = last_id
+        elif lower is not None:
+            id_range["$gte"] = lower
+        if upper is not None:
+            id_range["$lt"] = upper
+        batch = list(
+            goals.find({**query, "_id": id_range} if id_range else query, REPAIR_FIELDS)
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        repairs = [repair for goal in batch if (repair := goal_repair(goal, now))]
+        for _, _, rules in repairs:
+            report.update(rules)
+        if repairs and not dry_run:
+            # Un seq por lote: el sync y los eventos ven las metas reparadas
+            # updated_at es la hora del seq y no la del inicio del job: el
+            # watermark del sync la usa para saber que la escritura termino
+            stamp = {"seq": next_seq(database), "updated_at": utcnow()}
+            operations = [
+                UpdateOne(condition, {"$set": {**changes, **stamp}})
+                for condition, changes, _ in repairs
+            ]
+            report[MODIFIED] += goals.bulk_write(
+                operations, ordered=False
+            ).modified_count
+
+        last_id = batch[-1]["_id"]
+        if not dry_run:
+            save_checkpoint(database, job, {"last_id": last_id})
+
+    if not dry_run:
+        save_checkpoint(database, job, {"last_id": last_id, "done": True})
+    return report
+
+
+def repair_goals(
+    connect,
+    workers=4,
+    batch_size=1000,
+    dry_run=False,
+    restart=False,
+    processes=False,
+    now=None,
+):
+    database = connect()
+    now = now or datetime.now(timezone.utc)
+
+    ranges = None if restart else load_checkpoint(database, JOB_NAME)
+    if ranges is None:
+        ranges = plan_ranges(database["goals"], workers * 4)
+        if not dry_run:
+            for index in range(len(ranges)):
+                clear_checkpoint(database, f'{JOB_NAME}:{index}')
+            save_checkpoint(database, JOB_NAME, [list(bounds) for bounds in ranges])
+
+    started = time.monotonic()
+    report = Counter()
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                repair_range, connect, index, lower, upper, now, batch_size, dry_run
+            )
+            for index, (lower, upper) in enumerate(ranges)
+        ]
+        for future in futures:
+            report.update(future.result())
+
+    if not dry_run:
+        # Terminado: la proxima corrida planifica rangos nuevos
+        clear_checkpoint(database, JOB_NAME)
+        for index in range(len(ranges)):
+            clear_checkpoint(database, f'{JOB_NAME}:{index}')
+
+    logger.info(
+        f'Goal repair {"dry run " if dry_run else ""}over {len(ranges)} ranges '
+        f'in {time.monotonic() - started:.1f}s: {dict(report)}'
+    )
+    return report
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--workers", type=int, default=4)
+    arg_parser.add_argument("--batch-size", type=int, default=1000)
+    arg_parser.add_argument("--dry-run", action="store_true")
+    arg_parser.add_argument("--restart", action="store_true")
+    arg_parser.add_argument("--processes", action="store_true")
+    args = arg_parser.parse_args()
+
+    if app_settings.GOALS_STORAGE_MODE != DOCUMENT_MODE:
+        arg_parser.error('Repair is only supported with the document layout')
+
+    repair_goals(
+        connect,
+        args.workers,
+        args.batch_size,
+        args.dry_run,
+        args.restart,
+        args.processes,
+    )
+
+
+if __name__ == "__main__":
+    main()
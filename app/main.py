@@ -1,29 +1,151 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+import asyncio
 import pymongo
-from app.config.config import logger, Settings
+from datetime import timezone
+import uuid
+from app.config.config import logger, get_settings
+from app.config.log_config import request_id_var
+from app.config.database import DATABASE_NAME, get_read_database
+from app.repositories.goals import get_goal_repository_class
 from app.routes.urls import api_router
+from app.services.goal_events import start_goal_events_feed
+from app.services.loop_watchdog import LoopWatchdogMiddleware, loop_watchdog
+from app.services.profiling import ProfilingMiddleware
+from app.services.progress_history import progress_history
+from app.services.reminders import reminder_scheduler
+from app.services.training_completions import training_completions
+from app.services.tracing import (
+    SPAN_KIND_SERVER,
+    MongoCommandTracer,
+    configure_tracing,
+    get_current_span,
+    tracer,
+)
 
 app = FastAPI()
-app_settings = Settings()
+app_settings = get_settings()
+# Se agrega antes que los middlewares http: queda adentro de ellos y corre
+# en la misma tarea que la ruta, asi el perfil incluye sus awaits
+app.add_middleware(
+    ProfilingMiddleware,
+    sample_rate=app_settings.PROFILING_SAMPLE_RATE,
+    interval=app_settings.PROFILING_INTERVAL_MS / 1000,
+    output_dir=app_settings.PROFILING_DIR,
+)
+app.add_middleware(LoopWatchdogMiddleware, watchdog=loop_watchdog)
 
 
 @app.on_event("startup")
 async def startup_db_client():
+    configure_tracing(app_settings)
     try:
-        app.mongodb_client = pymongo.MongoClient(app_settings.MONGODB_URI)
+        app.mongodb_client = pymongo.MongoClient(
+            app_settings.MONGODB_URI,
+            tz_aware=True,
+            tzinfo=timezone.utc,
+            event_listeners=[MongoCommandTracer()],
+        )
         logger.info("Connected successfully MongoDB")
     except Exception as e:
         logger.error(e)
         logger.error("Could not connect to MongoDB")
 
     app.logger = logger
-    app.database = app.mongodb_client["goals_microservice"]
+    app.database = app.mongodb_client[DATABASE_NAME]
+    app.read_database = get_read_database(app.mongodb_client, app_settings)
+    try:
+        get_goal_repository_class().create_indexes(app.database)
+        progress_history.create_collections(app.database)
+    except Exception as e:
+        logger.error(f'Could not create indexes: {e}')
+
+    if app_settings.LOOP_WATCHDOG_ENABLED:
+        app.loop_watchdog_task = asyncio.create_task(loop_watchdog.run())
+
+    if app_settings.PROGRESS_HISTORY_ENABLED:
+        app.progress_history_task = asyncio.create_task(
+            progress_history.run(
+                lambda: app.database, app_settings.PROGRESS_HISTORY_FLUSH_SECONDS
+            )
+        )
+
+    if app_settings.TRAINING_COMPLETIONS_BATCH_ENABLED:
+        app.training_completions_task = asyncio.create_task(
+            training_completions.run(
+                app_settings.TRAINING_COMPLETIONS_FLUSH_SECONDS, lambda: app.database
+            )
+        )
+
+    if app_settings.GOAL_EVENTS_FEED != "none":
+        try:
+            app.goal_events_feed = start_goal_events_feed(app.database, app_settings)
+        except ValueError as e:
+            logger.error(e)
+
+    if app_settings.REMINDERS_ENABLED:
+        repository_class = get_goal_repository_class()
+        app.reminder_task = asyncio.create_task(
+            reminder_scheduler.run(
+                lambda: repository_class(
+                    app.database[repository_class.collection_name]
+                ),
+                app_settings.REMINDER_INTERVAL_SECONDS,
+            )
+        )
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if reminder_task := getattr(app, "reminder_task", None):
+        reminder_task.cancel()
+    if loop_watchdog_task := getattr(app, "loop_watchdog_task", None):
+        loop_watchdog_task.cancel()
+    if goal_events_feed := getattr(app, "goal_events_feed", None):
+        goal_events_feed.stop()
+    if progress_history_task := getattr(app, "progress_history_task", None):
+        progress_history_task.cancel()
+        try:
+            progress_history.flush(app.database)
+        except Exception as e:
+            logger.error(f'Could not flush progress history: {e}')
+    if training_completions_task := getattr(app, "training_completions_task", None):
+        training_completions_task.cancel()
+        # Ultimo intento: lo que no se envia ahora se pierde con el proceso
+        await training_completions.flush(database=app.database)
     app.mongodb_client.close()
+    tracer.shutdown()
     logger.info("Shutdown APP")
 
 
+@app.middleware("http")
+async def set_request_id(request: Request, call_next):
+    span = get_current_span()
+    request_id = request.headers.get("x-request-id") or (
+        span.trace_id if span is not None else uuid.uuid4().hex
+    )
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    with tracer.start_as_current_span(
+        f'{request.method} {request.url.path}',
+        kind=SPAN_KIND_SERVER,
+        traceparent=request.headers.get("traceparent"),
+    ) as span:
+        span.set_attribute("http.method", request.method)
+        span.set_attribute("http.target", request.url.path)
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+        if route := request.scope.get("route"):
+            span.name = f'{request.method} {route.path}'
+        return response
+
+
 app.include_router(api_router)
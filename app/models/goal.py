@@ -1,7 +1,14 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
 from pydantic import BaseModel, Field
+import dateutil.parser as parser
+import math
+
+from app.config.config import get_settings
+
+app_settings = get_settings()
 
 
 class GoalTypes(str, Enum):
@@ -45,6 +52,33 @@ class GoalCreate(BaseModel):
         }
 
 
+class GoalTemplate(BaseModel):
+    title: str
+    description: str
+    quantity_steps: float = Field(1500, gt=0)
+    metric: GoalTypes = GoalTypes.STEPS.value
+    limit_time: Optional[datetime] = None
+
+
+class GoalAssignment(BaseModel):
+    goal: GoalTemplate
+    athlete_ids: Optional[List[str]] = Field(None, max_items=10000)
+    training_id: Optional[str]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "goal": {
+                    "title": "Nice goal",
+                    "description": "Ready to walking",
+                    "quantity_steps": 1500,
+                    "metric": GoalTypes.STEPS.value,
+                },
+                "training_id": "6480f1e7e5a1c0a1b2c3d4e5",
+            }
+        }
+
+
 class GoalResponse(BaseModel):
     id: str
     user_id: Optional[str]
@@ -58,24 +92,233 @@ class GoalResponse(BaseModel):
     state: Optional[int]
     quantity_steps: Optional[float]
     progress_steps: Optional[float]
+    eta: Optional[datetime]
+    on_track: Optional[bool]
 
     @classmethod
     def from_mongo(cls, goal):
         if not goal:
             return goal
+        eta, on_track = goal_pace(goal, datetime.now(timezone.utc))
         id_goal = str(goal.pop('_id', None))
         title = goal.pop('title', None)
         description = goal.pop('description', None)
+        limit_time = goal.pop('limit', None)
 
         goal_dict = {
             **goal,
             'id': id_goal,
             'title': title,
             'description': description,
+            'limit_time': limit_time,
+            'eta': eta,
+            'on_track': on_track,
         }
         return cls(**goal_dict)
 
 
+# Fechas que se guardan en Mongo como datetime BSON en UTC
+GOAL_DATE_FIELDS = ("limit", "date_init", "date_complete", "date_stop")
+
+
+def to_utc(value):
+    """Return `value` as an aware UTC datetime (naive values are taken as UTC)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # Solo para documentos viejos, guardados como string
+        value = parser.parse(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def is_overdue(goal, now):
+    limit = to_utc(goal.get("limit"))
+    return limit is not None and limit < now
+
+
+# Estados que ya no cambian al vencer: una meta completada sigue completada
+FINISHED_STATES = (State.COMPLETE.value, State.EXPIRED.value)
+
+
+def expires(goal, now):
+    return goal.get("state") not in FINISHED_STATES and is_overdue(goal, now)
+
+
+ALREADY_COMPLETED = "already completed"
+NOT_STARTED = "not started"
+
+
+def state_transition(goal, state, now):
+    """Return (changes, None) that move `goal` to `state`, or (None, reason).
+
+    An overdue goal becomes EXPIRED whatever the state asked for, unless it
+    is already COMPLETE: a completed goal stays completed, and is not
+    started again.
+    """
+    state, current = State(state).value, goal.get("state")
+    if expires(goal, now):
+        return {"state": State.EXPIRED.value}, None
+    if state == State.INIT.value and current == State.COMPLETE.value:
+        return None, ALREADY_COMPLETED
+    if state == State.INIT.value and current != State.INIT.value:
+        return {"date_init": now, "state": state, **reset_pace(now)}, None
+    if state == State.STOP.value and current == State.COMPLETE.value:
+        return None, ALREADY_COMPLETED
+    if state == State.COMPLETE.value and current != State.COMPLETE.value:
+        return {"date_complete": now, "state": state}, None
+    if state == State.STOP.value and current == State.NOT_INIT.value:
+        return None, NOT_STARTED
+    if state == State.STOP.value and current != State.STOP.value:
+        return {"date_stop": now, "state": state}, None
+    return {"state": state}, None
+
+
+PACE_TAU_SECONDS = app_settings.GOAL_PACE_TAU_HOURS * 3600
+# exp(700) es casi el mayor float: las metas no duran tanto, pero no explota
+MAX_PACE_EXPONENT = 700
+# Mas alla de esto la ETA no entra en un datetime
+MAX_ETA = timedelta(days=365 * 1000)
+# Las metas que empiezan su ritmo en este lapso comparten la referencia de los pesos
+PACE_EPOCH_SECONDS = PACE_TAU_SECONDS * 20
+
+
+def pace_weight(since, at):
+    """Weight of a progress sample taken at `at` in a pace kept since `since`.
+
+    The pace of a goal is the sum of its progress samples weighted by
+    exp((at - since) / tau). The weight depends only on the sample time, so
+    every progress write adds to it with a plain $inc.
+    """
+    exponent = (at - since).total_seconds() / PACE_TAU_SECONDS
+    return math.exp(min(exponent, MAX_PACE_EXPONENT))
+
+
+def pace_epoch(now):
+    """Reference time of the weights of a pace that starts at `now`.
+
+    It is shared by all the paces started in the same PACE_EPOCH_SECONDS,
+    so the goals of a metric get the same progress update.
+    """
+    start = now.timestamp() // PACE_EPOCH_SECONDS * PACE_EPOCH_SECONDS
+    return datetime.fromtimestamp(start, timezone.utc)
+
+
+def reset_pace(now):
+    """Changes that start a new pace, for a goal whose date_init changes:
+    the progress of an earlier start does not count for the new one."""
+    return {"pace.since": pace_epoch(now), "pace.sum": 0, "pace.samples": 0}
+
+
+def pace_rate(goal, now):
+    """Exponentially weighted progress per second of a goal at `now`, or
+    None before its first progress sample.
+
+    The weighted sum is decayed to `now` and divided by the weight of the
+    time elapsed since the goal started, so a young pace is not biased low.
+    """
+    pace = goal.get("pace") or {}
+    if not pace.get("samples"):
+        return None
+    since = to_utc(pace.get("since"))
+    start = to_utc(goal.get("date_init")) or since
+    if since is None:
+        return None
+    elapsed = (now - start).total_seconds()
+    if elapsed <= 0:
+        return None
+    decayed = (pace.get("sum") or 0) / pace_weight(since, now)
+    window = PACE_TAU_SECONDS * -math.expm1(-elapsed / PACE_TAU_SECONDS)
+    return max(decayed / window, 0.0)
+
+
+def goal_pace(goal, now):
+    """Return the (eta, on_track) of a goal from its stored pace, in O(1)."""
+    state = goal.get("state")
+    if state == State.COMPLETE.value:
+        return to_utc(goal.get("date_complete")), True
+    if state == State.EXPIRED.value:
+        return None, False
+    if state != State.INIT.value:
+        return None, None
+
+    remaining = (goal.get("quantity_steps") or 0) - (goal.get("progress_steps") or 0)
+    if remaining <= 0:
+        return now, True
+    rate = pace_rate(goal, now)
+    if rate is None:
+        return None, None
+    eta = None
+    if rate > 0 and remaining / rate < MAX_ETA.total_seconds():
+        eta = now + timedelta(seconds=remaining / rate)
+    limit = to_utc(goal.get("limit"))
+    on_track = None if limit is None else eta is not None and eta <= limit
+    return eta, on_track
+
+
+def normalize_goal_dates(goal):
+    for field in GOAL_DATE_FIELDS:
+        if goal.get(field) is not None:
+            goal[field] = to_utc(goal[field])
+    return goal
+
+
+# Campos de GoalResponse que se guardan con otro nombre en Mongo
+GOAL_MONGO_FIELDS = {"id": "_id", "limit_time": "limit"}
+# Campos de GoalResponse que se calculan al leer, con lo que necesitan
+GOAL_PACE_FIELDS = ("eta", "on_track")
+GOAL_PACE_SOURCES = (
+    "state",
+    "limit",
+    "date_init",
+    "date_complete",
+    "quantity_steps",
+    "progress_steps",
+    "pace",
+)
+
+
+def parse_goal_fields(fields: str) -> tuple:
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - GoalResponse.__fields__.keys()
+    if not requested or unknown:
+        raise ValueError(f'Invalid fields: {", ".join(sorted(unknown)) or fields}')
+    return tuple(sorted(requested))
+
+
+@lru_cache(maxsize=64)
+def compile_goal_serializer(fields: tuple):
+    """Return the Mongo projection and a serializer for a set of fields.
+
+    Compiled once per field set, so partial responses skip building a full
+    GoalResponse for every document.
+    """
+    pace_fields = [field for field in fields if field in GOAL_PACE_FIELDS]
+    sources = tuple(
+        (field, GOAL_MONGO_FIELDS.get(field, field))
+        for field in fields
+        if field not in GOAL_PACE_FIELDS
+    )
+    projection = {source: 1 for _, source in sources}
+    if pace_fields:
+        projection.update({source: 1 for source in GOAL_PACE_SOURCES})
+    projection.setdefault("_id", 0)
+
+    def serialize(goal):
+        res = {field: goal.get(source) for field, source in sources}
+        if "id" in res:
+            res["id"] = str(res["id"])
+        if pace_fields:
+            pace = dict(
+                zip(GOAL_PACE_FIELDS, goal_pace(goal, datetime.now(timezone.utc)))
+            )
+            res.update({field: pace[field] for field in pace_fields})
+        return res
+
+    return projection, serialize
+
+
 class UpdateGoal(BaseModel):
     title: Optional[str]
     description: Optional[str]
@@ -88,16 +331,68 @@ class UpdateProgressGoal(BaseModel):
     progress_steps: float
 
 
+class ProgressSample(BaseModel):
+    progress_steps: float
+    ts: Optional[datetime]
+
+
+class UpdateProgressGoalBatch(BaseModel):
+    samples: List[ProgressSample] = Field(..., min_items=1, max_items=10000)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "samples": [
+                    {"progress_steps": 1200, "ts": "2023-06-01T10:00:00Z"},
+                    {"progress_steps": 800, "ts": "2023-06-01T11:00:00Z"},
+                ]
+            }
+        }
+
+
+class Calibration(BaseModel):
+    """Per-user parameters of the conversions from steps."""
+
+    stride_length_m: float = Field(0.76, gt=0, le=3)
+    weight_kg: float = Field(70, gt=0, le=500)
+
+
 class UpdateGoalState(BaseModel):
     state: State
 
 
+class UpdateGoalsState(BaseModel):
+    ids: List[str] = Field(..., min_items=1, max_items=1000)
+    state: State
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "ids": ["6480f1e7e5a1c0a1b2c3d4e5", "6480f1e7e5a1c0a1b2c3d4e6"],
+                "state": State.INIT.value,
+            }
+        }
+
+
 class QueryParamFilterGoal(BaseModel):
     title: Optional[str]
     description: Optional[str]
 
 
 class Goal:
+    __slots__ = (
+        "user_id",
+        "training_id",
+        "title",
+        "description",
+        "metric",
+        "limit",
+        "state",
+        "quantity_steps",
+        "progress_steps",
+        "date_init",
+    )
+
     def __init__(
         self,
         user_id,
@@ -120,3 +415,46 @@ class Goal:
         self.quantity_steps = quantity_steps
         self.progress_steps = 0
         self.date_init = date_init
+
+    def to_document(self):
+        """BSON-ready dict, with the dates as UTC datetimes."""
+        return {
+            "user_id": self.user_id,
+            "training_id": self.training_id,
+            "title": self.title,
+            "description": self.description,
+            "metric": GoalTypes(self.metric).value,
+            "limit": to_utc(self.limit),
+            "state": self.state,
+            "quantity_steps": self.quantity_steps,
+            "progress_steps": self.progress_steps,
+            "date_init": to_utc(self.date_init),
+        }
+
+
+def goal_response_content(goal):
+    """JSON content of a GoalResponse built straight from a stored goal."""
+
+    def iso(value):
+        return value.isoformat() if value is not None else None
+
+    def number(value):
+        return float(value) if value is not None else None
+
+    eta, on_track = goal_pace(goal, datetime.now(timezone.utc))
+    return {
+        "id": str(goal["_id"]),
+        "user_id": goal.get("user_id"),
+        "training_id": goal.get("training_id"),
+        "title": goal.get("title"),
+        "description": goal.get("description"),
+        "metric": goal.get("metric"),
+        "limit_time": iso(goal.get("limit")),
+        "date_init": iso(goal.get("date_init")),
+        "date_complete": iso(goal.get("date_complete")),
+        "state": goal.get("state"),
+        "quantity_steps": number(goal.get("quantity_steps")),
+        "progress_steps": number(goal.get("progress_steps")),
+        "eta": iso(eta),
+        "on_track": on_track,
+    }
@@ -0,0 +1,268 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.config.config import logger
+from app.config.database import get_read_collection, get_write_collection
+from app.models.goal import GoalTypes, State
+
+STATS_COLLECTION = "goal_stats"
+TRAINING_STATS_COLLECTION = "training_stats"
+
+# Deciles de progreso; el ultimo bucket son las metas que llegaron al 100%
+PROGRESS_BUCKETS = 10
+
+METRICS = [metric.value for metric in GoalTypes]
+
+
+def state_name(state):
+    try:
+        return State(state).name
+    except ValueError:
+        return str(state)
+
+
+def goal_metric(goal):
+    # Igual que metric_filter: sin una metrica conocida, la meta es de pasos
+    metric = goal.get("metric")
+    return GoalTypes(metric).value if metric in METRICS else GoalTypes.STEPS.value
+
+
+# Campos que necesita StatsDelta.add_training_goal
+TRAINING_STATS_FIELDS = {
+    "user_id": 1,
+    "training_id": 1,
+    "state": 1,
+    "metric": 1,
+    "progress_steps": 1,
+    "quantity_steps": 1,
+    "seq": 1,
+}
+
+
+def progress_bucket(goal):
+    if goal.get("state") == State.COMPLETE.value:
+        return PROGRESS_BUCKETS
+    quantity = goal.get("quantity_steps") or 0
+    if quantity <= 0:
+        return 0
+    ratio = (goal.get("progress_steps") or 0) / quantity
+    return min(max(int(ratio * PROGRESS_BUCKETS), 0), PROGRESS_BUCKETS)
+
+
+class StatsDelta:
+    """Changes to apply to the stats of a user and of its trainings.
+
+    `seq` is the seq of the goal write that produced them.
+    """
+
+    def __init__(self, seq=None):
+        self.seq = seq
+        self.states = Counter()
+        self.progress = Counter()
+        self.trainings = defaultdict(Counter)
+
+    def __bool__(self):
+        return any(self.states.values()) or any(self.progress.values())
+
+    def add_goal(self, goal, sign=1):
+        if goal:
+            self.states[state_name(goal.get("state"))] += sign
+            self.progress[goal_metric(goal)] += sign * (goal.get("progress_steps") or 0)
+            self.add_training_goal(goal, sign)
+        return self
+
+    def add_training_goal(self, goal, sign=1):
+        if goal and goal.get("training_id") is not None:
+            training = self.trainings[str(goal["training_id"])]
+            training["goals"] += sign
+            training[f'states.{state_name(goal.get("state"))}'] += sign
+            training[f'athletes.{goal.get("user_id")}'] += sign
+            training[f'buckets.{progress_bucket(goal)}'] += sign
+        return self
+
+    @classmethod
+    def change(cls, before, after, seq=None):
+        return cls(seq).add_goal(after).add_goal(before, sign=-1)
+
+    def to_update(self, now):
+        inc = {f'states.{name}': n for name, n in self.states.items() if n}
+        inc.update(
+            {f'progress.{metric}': v for metric, v in self.progress.items() if v}
+        )
+        return {"$inc": inc, "$set": {"updated_at": now}}
+
+    def training_updates(self, now):
+        for training_id, counts in self.trainings.items():
+            inc = {field: n for field, n in counts.items() if n}
+            if inc:
+                query = {"_id": training_id}
+                if self.seq is not None:
+                    # Las escrituras hasta la marca ya estan en la reconstruccion
+                    query["seq"] = {"$not": {"$gte": self.seq}}
+                # Sin upsert: el documento se arma completo en la primera lectura
+                yield UpdateOne(query, {"$inc": inc, "$set": {"updated_at": now}})
+
+
+class GoalStatsRepository:
+    """One `goal_stats` document per user, kept with `$inc` on every write.
+
+    The same deltas keep the `training_stats` documents of the trainings
+    that were already materialized by a read.
+    """
+
+    def __init__(self, collection, trainings_collection=None):
+        self.collection = collection
+        self.trainings_collection = trainings_collection
+
+    def apply(self, user_id, delta):
+        self.apply_many({user_id: delta})
+
+    def apply_many(self, deltas):
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne({"_id": str(user_id)}, delta.to_update(now), upsert=True)
+            for user_id, delta in deltas.items()
+            if delta
+        ]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+        training_operations = [
+            operation
+            for delta in deltas.values()
+            for operation in delta.training_updates(now)
+        ]
+        if training_operations and self.trainings_collection is not None:
+            self.trainings_collection.bulk_write(training_operations, ordered=False)
+
+    def get(self, user_id):
+        return self.collection.find_one({"_id": str(user_id)})
+
+
+class TrainingStatsRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, training_id):
+        return self.collection.find_one({"_id": str(training_id)})
+
+    def rebuild(self, training_id, read_goals, last_seq, replace=False, attempts=3):
+        """Materialize the stats of a training from all of its goals.
+
+        `read_goals()` returns the goals of the training and `last_seq()`
+        the last goal seq handed out, read after the goals: the document
+        keeps it in `seq`, and only the deltas of later writes are applied
+        on top. The goals are read again after the write; if any changed in
+        between (a write whose delta may be lost or already counted), the
+        stats are rebuilt. If they never settle the document is dropped and
+        the next read builds it again.
+
+        Without `replace` an existing document is returned as is; `replace`
+        overwrites it, for an explicit refresh.
+        """
+        for _ in range(attempts):
+            if not replace and (stats := self.get(training_id)) is not None:
+                return stats
+            goals = list(read_goals())
+            watermark = last_seq()
+            stats = self.store(training_id, goals, watermark)
+            seqs = {goal["_id"]: goal.get("seq", 0) for goal in goals}
+            if seqs == {goal["_id"]: goal.get("seq", 0) for goal in read_goals()}:
+                return stats
+            replace = True
+
+        logger.warning(f'Stats of training {training_id} kept changing while built')
+        self.collection.delete_one({"_id": str(training_id), "seq": watermark})
+        return stats
+
+    def store(self, training_id, goals, watermark):
+        delta = StatsDelta()
+        for goal in goals:
+            delta.add_training_goal(goal)
+        stats = {
+            field: n for field, n in delta.trainings[str(training_id)].items() if n
+        }
+        doc = {"seq": watermark, "updated_at": datetime.now(timezone.utc)}
+        for field, n in stats.items():
+            parent, _, key = field.partition(".")
+            if key:
+                doc.setdefault(parent, {})[key] = n
+            else:
+                doc[parent] = n
+        try:
+            # Nunca se pisa un documento armado con una marca posterior
+            self.collection.replace_one(
+                {"_id": str(training_id), "seq": {"$not": {"$gt": watermark}}},
+                doc,
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return self.get(training_id)
+        return {"_id": str(training_id), **doc}
+
+
+def format_stats(stats):
+    stats = stats or {}
+    states = {state.name: stats.get("states", {}).get(state.name, 0) for state in State}
+    total = sum(states.values())
+    return {
+        "total": total,
+        "states": states,
+        "completion_rate": states[State.COMPLETE.name] / total if total else 0,
+        "progress": {
+            metric: stats.get("progress", {}).get(metric, 0) for metric in METRICS
+        },
+    }
+
+
+def percentile(buckets, total, rank):
+    # Interpolacion lineal dentro del decil
+    target, seen = rank * total, 0
+    for bucket, count in enumerate(buckets):
+        if count and seen + count >= target:
+            if bucket == PROGRESS_BUCKETS:
+                return 1.0
+            return (bucket + (target - seen) / count) / PROGRESS_BUCKETS
+        seen += count
+    return 0
+
+
+def format_training_stats(stats):
+    states = stats.get("states", {})
+    goals = stats.get("goals", 0)
+    buckets = [
+        stats.get("buckets", {}).get(str(bucket), 0)
+        for bucket in range(PROGRESS_BUCKETS + 1)
+    ]
+    return {
+        "training_id": stats["_id"],
+        "athletes": sum(1 for n in stats.get("athletes", {}).values() if n > 0),
+        "goals": goals,
+        "completion_ratio": states.get(State.COMPLETE.name, 0) / goals if goals else 0,
+        "states": {state.name: states.get(state.name, 0) for state in State},
+        "distribution": [
+            {"from": bucket * 10, "to": min(bucket * 10 + 10, 100), "goals": count}
+            for bucket, count in enumerate(buckets)
+        ],
+        "percentiles": {
+            f'p{rank}': percentile(buckets, goals, rank / 100)
+            for rank in (25, 50, 75, 90)
+        },
+    }
+
+
+def get_goal_stats_repository(request, read_only=False):
+    get_collection = get_read_collection if read_only else get_write_collection
+    return GoalStatsRepository(
+        get_collection(request, STATS_COLLECTION),
+        get_collection(request, TRAINING_STATS_COLLECTION),
+    )
+
+
+def get_training_stats_repository(request):
+    return TrainingStatsRepository(
+        get_write_collection(request, TRAINING_STATS_COLLECTION)
+    )
@@ -0,0 +1,576 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config.config import get_settings
+from app.config.database import (
+    get_primary_collection,
+    get_read_collection,
+    get_write_collection,
+)
+from app.repositories.goal_stats import (
+    TRAINING_STATS_FIELDS,
+    StatsDelta,
+    goal_metric,
+    state_name,
+)
+from app.models.goal import (
+    FINISHED_STATES,
+    State,
+    normalize_goal_dates,
+    pace_epoch,
+    pace_weight,
+    to_utc,
+)
+
+app_settings = get_settings()
+
+DOCUMENT_MODE = "document"
+BUCKET_MODE = "bucket"
+ARCHIVE_COLLECTION = "goals_archive"
+COUNTERS_COLLECTION = "counters"
+TOMBSTONES_COLLECTION = "goal_tombstones"
+
+# Campos para el delta de stats y el pace de las metas que avanzan
+PROGRESS_FIELDS = {**TRAINING_STATS_FIELDS, "pace": 1}
+
+
+class GoalRepository:
+    """Sequence numbers and tombstones shared by both layouts.
+
+    Every write stamps the goals it touches with the next value of a global
+    `seq` counter (one per operation) and `updated_at`; deletes leave a
+    tombstone with the same stamp. A client that knows the last `seq` it
+    saw can then ask only for what changed after it.
+
+    The seq is taken before the write commits, so with several workers
+    seq N+1 can be visible before seq N: the sync watermark trails the
+    writes of the last GOALS_SYNC_LAG_SECONDS. All writes increment the
+    same `counters` document, a known write bottleneck.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def create_sync_indexes(database):
+        tombstones = database[TOMBSTONES_COLLECTION]
+        tombstones.create_index([("user_id", ASCENDING), ("seq", ASCENDING)])
+        tombstones.create_index([("seq", ASCENDING)])
+        tombstones.create_index(
+            [("deleted_at", ASCENDING)],
+            expireAfterSeconds=int(
+                timedelta(days=app_settings.GOALS_TOMBSTONE_TTL_DAYS).total_seconds()
+            ),
+        )
+
+    def stamp(self, now=None):
+        return {
+            "seq": next_seq(self.collection.database),
+            "updated_at": now or utcnow(),
+        }
+
+    def tombstone(self, id_goal, user_id, stamp):
+        self.collection.database[TOMBSTONES_COLLECTION].update_one(
+            {"_id": id_goal},
+            {
+                "$set": {
+                    "user_id": user_id,
+                    "seq": stamp["seq"],
+                    "deleted_at": stamp["updated_at"],
+                }
+            },
+            upsert=True,
+        )
+
+    def find_deleted_since(self, user_id, seq):
+        return self.collection.database[TOMBSTONES_COLLECTION].find(
+            {"user_id": user_id, "seq": {"$gt": seq}}, {"seq": 1, "deleted_at": 1}
+        )
+
+    def find_all_deleted_since(self, seq):
+        return (
+            self.collection.database[TOMBSTONES_COLLECTION]
+            .find({"seq": {"$gt": seq}})
+            .sort("seq", ASCENDING)
+        )
+
+    def last_seq(self):
+        counter = self.collection.database[COUNTERS_COLLECTION].find_one(
+            {"_id": "goals"}
+        )
+        return counter["seq"] if counter else 0
+
+    def last_deleted_seq(self, user_id, deleted_before=None):
+        query = {"user_id": user_id}
+        if deleted_before is not None:
+            query["deleted_at"] = {"$lte": deleted_before}
+        last = self.collection.database[TOMBSTONES_COLLECTION].find_one(
+            query, {"seq": 1}, sort=[("seq", DESCENDING)]
+        )
+        return last["seq"] if last else 0
+
+
+class DocumentGoalRepository(GoalRepository):
+    """Storage layout with one document per goal in the `goals` collection."""
+
+    collection_name = "goals"
+
+    @staticmethod
+    def create_indexes(database):
+        database["goals"].create_index([("user_id", ASCENDING)])
+        database["goals"].create_index([("limit", ASCENDING)])
+        database["goals"].create_index([("training_id", ASCENDING)], sparse=True)
+        database["goals"].create_index([("user_id", ASCENDING), ("seq", ASCENDING)])
+        database["goals"].create_index([("seq", ASCENDING)])
+        GoalRepository.create_sync_indexes(database)
+
+    def insert(self, goal):
+        goal.update(self.stamp())
+        return self.collection.insert_one(normalize_goal_dates(goal)).inserted_id
+
+    def insert_many(self, goals, chunk_size=None):
+        """Insert the goals with unordered insert_many calls of `chunk_size`.
+
+        Every goal gets its `_id` before the write; returns {index: error}
+        for the goals that could not be inserted.
+        """
+        chunk_size = chunk_size or app_settings.GOALS_BULK_CHUNK_SIZE
+        stamp = self.stamp()
+        errors = {}
+        for start in range(0, len(goals), chunk_size):
+            chunk = goals[start : start + chunk_size]
+            for goal in chunk:
+                goal.setdefault("_id", ObjectId())
+                goal.update(stamp)
+                normalize_goal_dates(goal)
+            try:
+                self.collection.insert_many(chunk, ordered=False)
+            except BulkWriteError as e:
+                errors.update(write_errors(e, start))
+        return errors
+
+    def find(self, id_goal, projection=None):
+        return self.collection.find_one({"_id": id_goal}, projection)
+
+    def find_by_user(self, user_id, projection=None, limit=0):
+        return self.collection.find({"user_id": user_id}, projection).limit(limit)
+
+    def find_many(self, user_id, ids, projection=None):
+        return self.collection.find(
+            {"_id": {"$in": ids}, "user_id": user_id}, projection
+        )
+
+    def find_by_training(self, training_id, projection=None):
+        return self.collection.find({"training_id": training_id}, projection)
+
+    def find_changed_since(self, user_id, seq):
+        return self.collection.find({"user_id": user_id, "seq": {"$gt": seq}})
+
+    def find_all_changed_since(self, seq):
+        return self.collection.find({"seq": {"$gt": seq}}).sort("seq", ASCENDING)
+
+    def find_by_limit_range(self, start, end, states):
+        return self.collection.find(
+            {"limit": {"$gte": start, "$lt": end}, "state": {"$in": states}},
+            {"user_id": 1, "title": 1, "limit": 1, "state": 1},
+        ).sort("limit", ASCENDING)
+
+    def update(self, id_goal, changes, expected_state=None, stamp=None):
+        changes = normalize_goal_dates(changes)
+        query = {"_id": id_goal, **changed(changes)}
+        if expected_state is not None:
+            query["state"] = expected_state
+        return self.collection.update_one(
+            query, {"$set": {**changes, **(stamp or self.stamp())}}
+        ).modified_count
+
+    def update_many(self, ids, changes, expected_state=None, stamp=None):
+        """Apply the same changes to several goals; returns the goals modified."""
+        changes = normalize_goal_dates(changes)
+        query = {"_id": {"$in": ids}, **changed(changes)}
+        if expected_state is not None:
+            query["state"] = expected_state
+        return self.collection.update_many(
+            query, {"$set": {**changes, **(stamp or self.stamp())}}
+        ).modified_count
+
+    def delete(self, id_goal, stamp=None):
+        goal = self.collection.find_one_and_delete({"_id": id_goal}, {"user_id": 1})
+        if goal is None:
+            return 0
+        self.tombstone(id_goal, goal.get("user_id"), stamp or self.stamp())
+        return 1
+
+    def apply_progress(self, user_id, increments, now):
+        """Expire overdue goals and add progress to the started ones.
+
+        Returns the started goals that reached their quantity_steps and the
+        StatsDelta of the changes.
+        """
+        stamp = self.stamp(now)
+        delta = StatsDelta(stamp["seq"])
+        overdue = {
+            "user_id": user_id,
+            "limit": {"$lt": now},
+            "state": {"$nin": list(FINISHED_STATES)},
+        }
+        expiring = list(self.collection.find(overdue, TRAINING_STATS_FIELDS))
+        if expiring:
+            self.collection.update_many(
+                {**overdue, "_id": {"$in": [goal["_id"] for goal in expiring]}},
+                {"$set": {"state": State.EXPIRED.value, **stamp}},
+            )
+            for goal in expiring:
+                delta.states[state_name(goal["state"])] -= 1
+                delta.states[State.EXPIRED.name] += 1
+                delta.add_training_goal(goal, -1)
+                delta.add_training_goal({**goal, "state": State.EXPIRED.value})
+
+        started = {"user_id": user_id, "state": State.INIT.value}
+        progressing = list(self.collection.find(started, PROGRESS_FIELDS))
+        for goal in progressing:
+            delta.add_training_goal(goal, -1)
+            delta.add_training_goal(with_progress(goal, increments))
+
+        for (metric, since), ids in pace_groups(progressing, increments, now).items():
+            amount = increments[metric]
+            inc, pace = progress_update(amount, since, now)
+            progressed = self.collection.update_many(
+                {**started, "_id": {"$in": ids}},
+                {"$inc": inc, "$set": {**pace, **stamp}},
+            ).modified_count
+            delta.progress[metric] += amount * progressed
+
+        reached = list(
+            self.collection.find(
+                {**started, "$expr": {"$gte": ["$progress_steps", "$quantity_steps"]}}
+            )
+        )
+        return reached, delta
+
+
+class BucketGoalRepository(GoalRepository):
+    """Storage layout with the goals of a user grouped in bucket documents.
+
+    Each document of `goal_buckets` holds up to GOALS_BUCKET_SIZE goals of
+    one user in its `goals` array; a full bucket spills over to a new one.
+    A progress sync is a single update with array filters per bucket.
+    """
+
+    collection_name = "goal_buckets"
+
+    def __init__(self, collection, bucket_size=None):
+        super().__init__(collection)
+        self.bucket_size = bucket_size or app_settings.GOALS_BUCKET_SIZE
+
+    @staticmethod
+    def create_indexes(database):
+        database["goal_buckets"].create_index(
+            [("user_id", ASCENDING), ("count", ASCENDING)]
+        )
+        database["goal_buckets"].create_index([("goals._id", ASCENDING)])
+        database["goal_buckets"].create_index([("goals.limit", ASCENDING)])
+        database["goal_buckets"].create_index([("goals.training_id", ASCENDING)])
+        database["goal_buckets"].create_index([("goals.seq", ASCENDING)])
+        GoalRepository.create_sync_indexes(database)
+
+    def _push(self, goal):
+        return (
+            {"user_id": goal["user_id"], "count": {"$lt": self.bucket_size}},
+            {"$push": {"goals": goal}, "$inc": {"count": 1}},
+        )
+
+    def insert(self, goal):
+        goal.update(self.stamp())
+        goal = normalize_goal_dates({"_id": ObjectId(), **goal})
+        self.collection.update_one(*self._push(goal), upsert=True)
+        return goal["_id"]
+
+    def insert_many(self, goals, chunk_size=None):
+        chunk_size = chunk_size or app_settings.GOALS_BULK_CHUNK_SIZE
+        stamp = self.stamp()
+        errors = {}
+        for start in range(0, len(goals), chunk_size):
+            operations = []
+            for goal in goals[start : start + chunk_size]:
+                goal.setdefault("_id", ObjectId())
+                goal.update(stamp)
+                normalize_goal_dates(goal)
+                operations.append(UpdateOne(*self._push(goal), upsert=True))
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                errors.update(write_errors(e, start))
+        return errors
+
+    def find(self, id_goal, projection=None):
+        bucket = self.collection.find_one(
+            {"goals._id": id_goal}, {"goals": {"$elemMatch": {"_id": id_goal}}}
+        )
+        if not bucket or not bucket.get("goals"):
+            return None
+        return project(bucket["goals"][0], projection)
+
+    def find_by_user(self, user_id, projection=None, limit=0):
+        goals = []
+        for bucket in self.collection.find({"user_id": user_id}, {"goals": 1}):
+            goals.extend(project(goal, projection) for goal in bucket["goals"])
+            if limit and len(goals) >= limit:
+                return goals[:limit]
+        return goals
+
+    def find_many(self, user_id, ids, projection=None):
+        ids = set(ids)
+        return [
+            project(goal, projection)
+            for goal in self.find_by_user(user_id)
+            if goal["_id"] in ids
+        ]
+
+    def find_by_training(self, training_id, projection=None):
+        for bucket in self.collection.find(
+            {"goals.training_id": training_id}, {"goals": 1}
+        ):
+            for goal in bucket["goals"]:
+                if goal.get("training_id") == training_id:
+                    yield project(goal, projection)
+
+    def find_changed_since(self, user_id, seq):
+        return [goal for goal in self.find_by_user(user_id) if goal.get("seq", 0) > seq]
+
+    def find_all_changed_since(self, seq):
+        for bucket in self.collection.find({"goals.seq": {"$gt": seq}}, {"goals": 1}):
+            for goal in bucket["goals"]:
+                if goal.get("seq", 0) > seq:
+                    yield dict(goal)
+
+    def find_by_limit_range(self, start, end, states):
+        for bucket in self.collection.find(
+            {"goals.limit": {"$gte": start, "$lt": end}}, {"goals": 1}
+        ):
+            for goal in bucket["goals"]:
+                limit = goal.get("limit")
+                if (
+                    limit is not None
+                    and start <= to_utc(limit) < end
+                    and goal.get("state") in states
+                ):
+                    yield dict(goal)
+
+    def update(self, id_goal, changes, expected_state=None, stamp=None):
+        changes = normalize_goal_dates(changes)
+        element = {"_id": id_goal, **changed(changes)}
+        if expected_state is not None:
+            element["state"] = expected_state
+        changes = {**changes, **(stamp or self.stamp())}
+        return self.collection.update_one(
+            {"goals": {"$elemMatch": element}},
+            {"$set": {f'goals.$.{key}': value for key, value in changes.items()}},
+        ).modified_count
+
+    def update_many(self, ids, changes, expected_state=None, stamp=None):
+        """Apply the same changes to several goals; returns the buckets modified."""
+        changes = normalize_goal_dates(changes)
+        element = {"_id": {"$in": ids}, **changed(changes)}
+        if expected_state is not None:
+            element["state"] = expected_state
+        changes = {**changes, **(stamp or self.stamp())}
+        return self.collection.update_many(
+            {"goals": {"$elemMatch": element}},
+            {"$set": {f'goals.$[goal].{key}': value for key, value in changes.items()}},
+            array_filters=[array_filter(element, "goal")],
+        ).modified_count
+
+    def delete(self, id_goal, stamp=None):
+        bucket = self.collection.find_one_and_update(
+            {"goals._id": id_goal},
+            {"$pull": {"goals": {"_id": id_goal}}, "$inc": {"count": -1}},
+            {"user_id": 1},
+        )
+        if bucket is None:
+            return 0
+        self.tombstone(id_goal, bucket["user_id"], stamp or self.stamp())
+        return 1
+
+    def apply_progress(self, user_id, increments, now):
+        # El delta y los grupos se calculan antes, con los mismos filtros que el update
+        delta, progressing = StatsDelta(), []
+        for goal in self.find_by_user(user_id):
+            limit = goal.get("limit")
+            if limit is not None and to_utc(limit) < now:
+                if goal.get("state") not in FINISHED_STATES:
+                    delta.states[state_name(goal.get("state"))] -= 1
+                    delta.states[State.EXPIRED.name] += 1
+                    delta.add_training_goal(goal, -1)
+                    delta.add_training_goal({**goal, "state": State.EXPIRED.value})
+            elif goal.get("state") == State.INIT.value:
+                metric = goal_metric(goal)
+                delta.progress[metric] += increments.get(metric, 0)
+                delta.add_training_goal(goal, -1)
+                delta.add_training_goal(with_progress(goal, increments))
+                progressing.append(goal)
+
+        stamp = self.stamp(now)
+        delta.seq = stamp["seq"]
+        update = {
+            "$set": {
+                "goals.$[expired].state": State.EXPIRED.value,
+                **{f'goals.$[expired].{key}': value for key, value in stamp.items()},
+            }
+        }
+        array_filters = [
+            {
+                "expired.limit": {"$lt": now},
+                "expired.state": {"$nin": list(FINISHED_STATES)},
+            }
+        ]
+        groups = pace_groups(progressing, increments, now).items()
+        for index, ((metric, since), ids) in enumerate(groups):
+            name = f'p{index}'
+            inc, pace = progress_update(increments[metric], since, now)
+            update.setdefault("$inc", {}).update(
+                {f'goals.$[{name}].{key}': value for key, value in inc.items()}
+            )
+            update["$set"].update(
+                {
+                    f'goals.$[{name}].{key}': value
+                    for key, value in {**pace, **stamp}.items()
+                }
+            )
+            array_filters.append(
+                {
+                    f'{name}._id': {"$in": ids},
+                    f'{name}.state': State.INIT.value,
+                    "$or": [{f'{name}.limit': None}, {f'{name}.limit': {"$gte": now}}],
+                }
+            )
+
+        self.collection.update_many(
+            {"user_id": user_id}, update, array_filters=array_filters
+        )
+
+        reached = [
+            goal
+            for goal in self.find_by_user(user_id)
+            if goal.get("state") == State.INIT.value
+            and goal.get("progress_steps", 0) >= goal.get("quantity_steps", 0)
+        ]
+        return reached, delta
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def next_seq(database):
+    counter = database[COUNTERS_COLLECTION].find_one_and_update(
+        {"_id": "goals"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"]
+
+
+def is_settled(doc, settled_before):
+    # Un cambio es firme cuando ya no puede haber uno anterior sin escribir
+    stamped_at = to_utc(doc.get("updated_at") or doc.get("deleted_at"))
+    return stamped_at is None or stamped_at <= settled_before
+
+
+def changed(changes):
+    # Solo si algo cambia, asi un update sin cambios no gasta un seq
+    if not changes:
+        return {}
+    return {"$or": [{key: {"$ne": value}} for key, value in changes.items()]}
+
+
+def array_filter(element, name):
+    # El mismo filtro de $elemMatch, sobre el identificador de un array filter
+    condition = {}
+    for key, value in element.items():
+        if key.startswith("$"):
+            condition[key] = [array_filter(item, name) for item in value]
+        else:
+            condition[f'{name}.{key}'] = value
+    return condition
+
+
+def with_progress(goal, increments):
+    amount = increments.get(goal_metric(goal), 0)
+    return {**goal, "progress_steps": (goal.get("progress_steps") or 0) + amount}
+
+
+def pace_since(goal, now):
+    return to_utc((goal.get("pace") or {}).get("since")) or pace_epoch(now)
+
+
+def pace_groups(goals, increments, now):
+    """Ids of the goals that get the same progress update, by (metric, pace
+    epoch): usually one group per metric."""
+    groups = defaultdict(list)
+    for goal in goals:
+        metric = goal_metric(goal)
+        if increments.get(metric):
+            groups[(metric, pace_since(goal, now))].append(goal["_id"])
+    return groups
+
+
+def progress_update(amount, since, now):
+    """$inc and $set of a progress write: progress and pace in the same update."""
+    return (
+        {
+            "progress_steps": amount,
+            "pace.sum": amount * pace_weight(since, now),
+            "pace.samples": 1,
+        },
+        {"pace.since": since, "pace.at": now},
+    )
+
+
+def write_errors(error, offset=0):
+    return {
+        offset + write_error["index"]: write_error.get("errmsg")
+        for write_error in error.details.get("writeErrors", [])
+    }
+
+
+def project(goal, projection):
+    # Siempre una copia: los callers (ej. GoalResponse.from_mongo) modifican el dict
+    if not projection:
+        return dict(goal)
+    included = {key for key, value in projection.items() if value}
+    if not included:
+        return {k: v for k, v in goal.items() if projection.get(k, 1)}
+    if projection.get("_id", 1):
+        included.add("_id")
+    return {k: v for k, v in goal.items() if k in included}
+
+
+REPOSITORIES = {
+    DOCUMENT_MODE: DocumentGoalRepository,
+    BUCKET_MODE: BucketGoalRepository,
+}
+
+
+def get_goal_repository_class(mode=None):
+    mode = mode or app_settings.GOALS_STORAGE_MODE
+    if mode not in REPOSITORIES:
+        raise ValueError(f'Unknown goals storage mode: {mode}')
+    return REPOSITORIES[mode]
+
+
+def get_goal_repository(request, read_only=False):
+    repository_class = get_goal_repository_class()
+    get_collection = get_read_collection if read_only else get_write_collection
+    return repository_class(get_collection(request, repository_class.collection_name))
+
+
+def get_archive_repository(request, primary=False):
+    # El archivo siempre guarda un documento por meta, sin importar el layout
+    get_collection = get_primary_collection if primary else get_read_collection
+    return DocumentGoalRepository(get_collection(request, ARCHIVE_COLLECTION))
@@ -1,16 +1,34 @@
 from bson import ObjectId
+from typing import Optional
 from fastapi import APIRouter, Depends, Request, Query
-from fastapi.encoders import jsonable_encoder
 from starlette import status
 from starlette.responses import JSONResponse
-from datetime import datetime, timezone
-import dateutil.parser as parser
-
-from app.models.goal import GoalCreate, GoalResponse, Goal, UpdateGoal, State
+from datetime import datetime, timedelta, timezone
+
+from app.models.goal import (
+    GoalCreate,
+    GoalResponse,
+    Goal,
+    UpdateGoal,
+    State,
+    compile_goal_serializer,
+    goal_response_content,
+    parse_goal_fields,
+    reset_pace,
+    to_utc,
+)
 from app.auth.auth_utils import get_user_id, ObjectIdPydantic
-from app.config.config import logger
+from app.config.config import logger, get_settings
+from app.repositories.goal_stats import StatsDelta, get_goal_stats_repository
+from app.repositories.goals import (
+    get_archive_repository,
+    get_goal_repository,
+    is_settled,
+)
+from app.services.reminders import reminder_scheduler
 
 router_goal_crud = APIRouter()
+app_settings = get_settings()
 
 
 @router_goal_crud.post("/", response_model=GoalResponse)
@@ -19,7 +37,9 @@ async def create_goal(
     goal: GoalCreate,
     user_id: ObjectId = Depends(get_user_id),
 ):
-    goals = request.app.database["goals"]
+    goals = get_goal_repository(request)
+    time_now = datetime.now(timezone.utc)
+
     # Crear un nuevo desafío en la base de datos
     new_goal = Goal(
         user_id=str(user_id),
@@ -31,74 +51,157 @@ async def create_goal(
         quantity_steps=goal.quantity_steps,
     )
 
-    time_now = datetime.now(timezone.utc)
-
     if goal.training_id is not None:
         new_goal.training_id = goal.training_id
         new_goal.state = State.INIT.value
         new_goal.date_init = time_now
 
-    res_json = jsonable_encoder(new_goal)
-
-    if res_json["limit"] is not None:
-        res_json["limit"] = parser.parse(res_json["limit"]).replace(tzinfo=timezone.utc)
-        if res_json["limit"] < time_now:
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={"message": "Limit date is before current date"},
-            )
-
-    if res_json["date_init"]:
-        res_json["date_init"] = parser.parse(res_json["date_init"]).replace(
-            tzinfo=timezone.utc
+    # El mismo dict se guarda y se usa para la respuesta
+    doc = new_goal.to_document()
+    if doc["limit"] is not None and doc["limit"] < time_now:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "Limit date is before current date"},
         )
 
-    goal_id = goals.insert_one(res_json)
-
-    # Construir la respuesta del desafío creado
-    response = GoalResponse(
-        id=str(goal_id.inserted_id),
-        user_id=new_goal.user_id,
-        training_id=new_goal.training_id,
-        title=new_goal.title,
-        description=new_goal.description,
-        metric=new_goal.metric,
-        limit_time=new_goal.limit,
-        date_init=new_goal.date_init,
-        date_complete=None,
-        state=new_goal.state,
-        quantity_steps=new_goal.quantity_steps,
-        progress_steps=new_goal.progress_steps,
+    doc["_id"] = goals.insert(doc)
+    reminder_scheduler.schedule(doc)
+    get_goal_stats_repository(request).apply(
+        user_id, StatsDelta(doc["seq"]).add_goal(doc)
     )
 
-    return response
+    return JSONResponse(
+        status_code=status.HTTP_200_OK, content=goal_response_content(doc)
+    )
 
 
 @router_goal_crud.get("/", status_code=status.HTTP_200_OK)
 async def get_my_goals(
     request: Request,
     limit: int = Query(128, ge=1, le=1024),
+    fields: Optional[str] = Query(None),
+    include_archived: bool = Query(False),
     user_id: ObjectId = Depends(get_user_id),
 ):
-    goals = request.app.database["goals"]
+    goals = get_goal_repository(request, read_only=True)
+
+    projection = None
+    if fields:
+        try:
+            projection, serialize = compile_goal_serializer(parse_goal_fields(fields))
+        except ValueError as e:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"message": str(e)},
+            )
 
-    # Filtrar por el user_id específico
-    query = {"user_id": str(user_id)}
+    found = list(goals.find_by_user(str(user_id), projection, limit))
+    if include_archived and len(found) < limit:
+        archive = get_archive_repository(request)
+        found.extend(archive.find_by_user(str(user_id), projection, limit - len(found)))
+
+    if fields:
+        return [serialize(goal) for goal in found]
 
     all_goals = []
-    for goal in goals.find(query).limit(limit):
-        logger.info(goal)
+    for goal in found:
+        logger.debug('Goal found: %s', goal)
         if res := GoalResponse.from_mongo(goal):
             all_goals.append(res)
 
     return all_goals
 
 
+def make_watermark(seq, issued_at):
+    return f'{seq}.{int(issued_at.timestamp())}'
+
+
+def parse_watermark(watermark, time_now):
+    """Return the last seq the client saw, or None if it needs a full sync."""
+    if not watermark:
+        return None
+    try:
+        seq, issued_at = (int(part) for part in watermark.split("."))
+    except ValueError:
+        raise ValueError(f'Invalid watermark: {watermark}')
+    # Los tombstones mas viejos ya expiraron: no se pueden informar los borrados
+    ttl = timedelta(days=app_settings.GOALS_TOMBSTONE_TTL_DAYS)
+    if datetime.fromtimestamp(issued_at, timezone.utc) < time_now - ttl:
+        return None
+    return seq
+
+
+@router_goal_crud.get("/sync", status_code=status.HTTP_200_OK)
+async def sync_my_goals(
+    request: Request,
+    watermark: Optional[str] = Query(None),
+    user_id: ObjectId = Depends(get_user_id),
+):
+    # Del primario: un secundario atrasado haria avanzar el watermark de mas
+    goals = get_goal_repository(request)
+    time_now = datetime.now(timezone.utc)
+    try:
+        since = parse_watermark(watermark, time_now)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": str(e)},
+        )
+
+    settled_before = time_now - timedelta(seconds=app_settings.GOALS_SYNC_LAG_SECONDS)
+    if since is None:
+        changed = list(goals.find_by_user(str(user_id)))
+        deleted = []
+        last_seq = goals.last_deleted_seq(str(user_id), settled_before)
+    else:
+        changed = list(goals.find_changed_since(str(user_id), since))
+        deleted = list(goals.find_deleted_since(str(user_id), since))
+        last_seq = since
+
+    # El seq se toma antes de escribir: con varios workers el N+1 puede verse
+    # antes que el N. El watermark solo pasa los cambios de hace mas de
+    # GOALS_SYNC_LAG_SECONDS; los mas nuevos se vuelven a enviar en el proximo
+    last_seq = max(
+        [last_seq]
+        + [
+            goal.get("seq", 0)
+            for goal in changed + deleted
+            if is_settled(goal, settled_before)
+        ]
+    )
+    return {
+        "watermark": make_watermark(last_seq, time_now),
+        "full": since is None,
+        "goals": [GoalResponse.from_mongo(goal) for goal in changed],
+        "deleted": [str(goal["_id"]) for goal in deleted],
+    }
+
+
 @router_goal_crud.get("/{id_goal}", status_code=status.HTTP_200_OK)
-async def get_goal(id_goal: ObjectIdPydantic, request: Request):
-    goals = request.app.database["goals"]
-    goal = goals.find_one({"_id": id_goal})
+async def get_goal(
+    id_goal: ObjectIdPydantic,
+    request: Request,
+    fields: Optional[str] = Query(None),
+    include_archived: bool = Query(False),
+):
+    goals = get_goal_repository(request, read_only=True)
+
+    projection = None
+    if fields:
+        try:
+            projection, serialize = compile_goal_serializer(parse_goal_fields(fields))
+        except ValueError as e:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"message": str(e)},
+            )
+
+    goal = goals.find(id_goal, projection)
+    if goal is None and include_archived:
+        goal = get_archive_repository(request).find(id_goal, projection)
 
+    if goal is not None and fields:
+        return serialize(goal)
     if goal:
         return GoalResponse.from_mongo(goal)
     else:
@@ -122,8 +225,8 @@ async def update_goal(
             content='No values specified to update',
         )
 
-    goals = request.app.database["goals"]
-    goal = goals.find_one({"_id": id_goal})
+    goals = get_goal_repository(request)
+    goal = goals.find(id_goal)
 
     if not goal:
         logger.info(f'Goal {id_goal} not found to update')
@@ -134,34 +237,41 @@ async def update_goal(
 
     time_now = datetime.now(timezone.utc)
     if to_change.get("limit_time"):
-        to_change["limit_time"] = parser.parse(str(to_change["limit_time"])).replace(
-            tzinfo=timezone.utc
-        )
-        if to_change["limit_time"] < time_now:
+        to_change["limit"] = to_utc(to_change.pop("limit_time"))
+        if to_change["limit"] < time_now:
             return JSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content={"message": "Limit date is before current date"},
             )
 
-        to_change["limit"] = to_change["limit_time"]
-        to_change.pop("limit_time")
-
     if goal["state"] == State.EXPIRED.value:
         to_change["state"] = State.NOT_INIT.value
         to_change["progress_steps"] = 0
         to_change["date_init"] = None
-
-    goals.update_one({"_id": id_goal}, {"$set": to_change})
+        to_change.update(reset_pace(time_now))
+
+    stamp = goals.stamp(time_now)
+    if goals.update(id_goal, to_change, stamp=stamp) > 0:
+        reminder_scheduler.schedule({**goal, **to_change})
+        get_goal_stats_repository(request).apply(
+            goal["user_id"],
+            StatsDelta.change(goal, {**goal, **to_change}, stamp["seq"]),
+        )
 
     return {"message": "All goals have been successfully updated"}
 
 
 @router_goal_crud.delete("/{id_goal}", status_code=status.HTTP_200_OK)
 async def delete_goal(id_goal: ObjectIdPydantic, request: Request):
-    goals = request.app.database["goals"]
-    result = goals.delete_one({"_id": ObjectId(id_goal)})
-
-    if result.deleted_count == 1:
+    goals = get_goal_repository(request)
+    goal = goals.find(id_goal)
+
+    stamp = goals.stamp() if goal else None
+    if goal and goals.delete(ObjectId(id_goal), stamp) == 1:
+        reminder_scheduler.cancel(id_goal)
+        get_goal_stats_repository(request).apply(
+            goal["user_id"], StatsDelta.change(goal, None, stamp["seq"])
+        )
         logger.info(f'Deleting Goal {id_goal}')
         return JSONResponse(
             status_code=status.HTTP_200_OK,
@@ -0,0 +1,41 @@
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Request
+from starlette import status
+from starlette.responses import JSONResponse, StreamingResponse
+
+from app.auth.auth_utils import get_user_id
+from app.config.config import logger, get_settings
+from app.services.goal_events import goal_event_broker, sse_stream
+
+router_goal_events = APIRouter()
+app_settings = get_settings()
+
+
+@router_goal_events.get("/events", status_code=status.HTTP_200_OK)
+async def stream_my_goal_events(
+    request: Request, user_id: ObjectId = Depends(get_user_id)
+):
+    if app_settings.GOAL_EVENTS_FEED == "none":
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"message": "Goal events are disabled"},
+        )
+
+    subscription = goal_event_broker.subscribe(str(user_id))
+    if subscription is None:
+        logger.info(f'Too many goal event connections for user {user_id}')
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"message": "Too many open goal event connections"},
+        )
+
+    return StreamingResponse(
+        sse_stream(
+            goal_event_broker,
+            subscription,
+            request.is_disconnected,
+            app_settings.GOAL_EVENTS_KEEPALIVE_SECONDS,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,31 +1,76 @@
 from bson import ObjectId
-from fastapi import APIRouter, Depends, Request
+from collections import defaultdict
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
 from starlette import status
 from starlette.responses import JSONResponse
 from datetime import datetime, timezone
-import dateutil.parser as parser
 
-from app.config.config import logger
+from app.config.config import logger, get_settings
+from app.config.database import (
+    get_primary_collection,
+    get_read_collection,
+    get_write_collection,
+)
+from app.repositories.goal_stats import (
+    StatsDelta,
+    get_goal_stats_repository,
+    goal_metric,
+)
+from app.repositories.goals import get_goal_repository
 from app.models.goal import (
+    Calibration,
     GoalTypes,
     State,
+    UpdateGoalsState,
     UpdateProgressGoal,
+    UpdateProgressGoalBatch,
+    state_transition,
+    to_utc,
 )
 from app.auth.auth_utils import get_user_id, ObjectIdPydantic
+from app.services.conversions import (
+    CALIBRATIONS_COLLECTION,
+    conversions,
+    get_calibration,
+    save_calibration,
+)
+from app.services.progress_history import (
+    ROLLUPS_COLLECTION,
+    SAMPLES_COLLECTION,
+    progress_history,
+)
+from app.services.reminders import reminder_scheduler
 from app.services.services import NotificationService, ServiceTrainers
+from app.services.training_completions import training_completions
+
+app_settings = get_settings()
 
 router_goal_states = APIRouter()
 
 
 def step_to_calorie(step):
-    calories = step * 0.04
-    return calories
+    return conversions.convert(GoalTypes.CALORIES.value, step)
 
 
 def step_to_kilometer(step):
-    meters = step * 0.76
-    kilometers = meters / 1000
-    return kilometers
+    return conversions.convert(GoalTypes.KILOMETERS.value, step)
+
+
+async def apply_steps(request, user_id, samples, time_now):
+    """Convert the (steps, ts) samples of a user and apply them to its goals."""
+    calibration = await get_calibration(
+        get_primary_collection(request, CALIBRATIONS_COLLECTION), str(user_id)
+    )
+    goals = get_goal_repository(request)
+    increments = conversions.totals([steps for steps, _ in samples], calibration)
+
+    for steps, ts in samples:
+        progress_history.record(str(user_id), steps, ts or time_now)
+    reached, delta = goals.apply_progress(str(user_id), increments, time_now)
+    get_goal_stats_repository(request).apply(user_id, delta)
+    for goal in reached:
+        await complete_goal(request, goal["_id"], user_id)
 
 
 @router_goal_states.patch("/progress_steps", status_code=status.HTTP_200_OK)
@@ -34,38 +79,210 @@ async def progress_steps_all_goal(
     update_data: UpdateProgressGoal,
     user_id: ObjectId = Depends(get_user_id),
 ):
-    goals = request.app.database["goals"]
-    query = {"user_id": str(user_id)}
-
-    for goal in goals.find(query):
-        if goal["limit"]:
-            if (
-                parser.parse(str(goal["limit"])).replace(tzinfo=timezone.utc)
-                < datetime.now(timezone.utc)
-                and goal["state"] != State.EXPIRED.value
-            ):
-                goals.update_one(
-                    {"_id": goal["_id"]}, {"$set": {"state": State.EXPIRED.value}}
-                )
+    time_now = datetime.now(timezone.utc)
+    await apply_steps(request, user_id, [(update_data.progress_steps, None)], time_now)
+    return {"message": "All goals have been successfully updated"}
+
+
+@router_goal_states.patch("/progress_steps/batch", status_code=status.HTTP_200_OK)
+async def progress_steps_batch(
+    request: Request,
+    update_data: UpdateProgressGoalBatch,
+    user_id: ObjectId = Depends(get_user_id),
+):
+    # Todas las muestras se convierten juntas y se aplican en una sola pasada
+    time_now = datetime.now(timezone.utc)
+    samples = [
+        (sample.progress_steps, to_utc(sample.ts)) for sample in update_data.samples
+    ]
+    await apply_steps(request, user_id, samples, time_now)
+    return {"message": f'{len(samples)} samples applied to all goals'}
+
+
+@router_goal_states.get("/calibration", status_code=status.HTTP_200_OK)
+async def get_my_calibration(
+    request: Request, user_id: ObjectId = Depends(get_user_id)
+):
+    return await get_calibration(
+        get_primary_collection(request, CALIBRATIONS_COLLECTION), str(user_id)
+    )
+
+
+@router_goal_states.put("/calibration", status_code=status.HTTP_200_OK)
+async def update_my_calibration(
+    request: Request,
+    calibration: Calibration,
+    user_id: ObjectId = Depends(get_user_id),
+):
+    save_calibration(
+        get_write_collection(request, CALIBRATIONS_COLLECTION),
+        str(user_id),
+        calibration,
+    )
+    return calibration
+
+
+# Los estados que se pueden aplicar en lote: completar avisa al entrenamiento
+BULK_STATES = (State.INIT.value, State.STOP.value)
+
+
+@router_goal_states.patch("/state", status_code=status.HTTP_200_OK)
+async def update_state_goals(
+    request: Request,
+    update_data: UpdateGoalsState,
+    user_id: ObjectId = Depends(get_user_id),
+):
+    state = update_data.state.value
+    if state not in BULK_STATES:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "Only INIT and STOP can be applied in bulk"},
+        )
+
+    goals = get_goal_repository(request)
+    ids = list(
+        dict.fromkeys(
+            str(ObjectId(id_goal)) if ObjectId.is_valid(id_goal) else id_goal
+            for id_goal in update_data.ids
+        )
+    )
+    valid_ids = [ObjectId(id_goal) for id_goal in ids if ObjectId.is_valid(id_goal)]
+    found = {goal["_id"]: goal for goal in goals.find_many(str(user_id), valid_ids)}
+
+    # Las metas con el mismo estado actual y los mismos cambios van en un update
+    time_now = datetime.now(timezone.utc)
+    results, groups = {}, defaultdict(list)
+    for id_goal in ids:
+        goal = found.get(ObjectId(id_goal)) if ObjectId.is_valid(id_goal) else None
+        if goal is None:
+            results[id_goal] = "not_found"
+            continue
+        changes, error = state_transition(goal, state, time_now)
+        expired = changes is not None and changes["state"] == State.EXPIRED.value
+        if changes is None or (
+            not expired and all(goal.get(k) == v for k, v in changes.items())
+        ):
+            results[id_goal] = "invalid_transition"
+            continue
+        results[id_goal] = "expired" if expired else "updated"
+        if goal.get("state") != changes["state"]:
+            groups[(goal.get("state"), tuple(changes.items()))].append(goal["_id"])
+
+    pending = [id_goal for ids_group in groups.values() for id_goal in ids_group]
+    stamp = goals.stamp(time_now) if pending else None
+    modified = sum(
+        goals.update_many(group_ids, dict(changes), expected_state, stamp)
+        for (expected_state, changes), group_ids in groups.items()
+    )
+    applied = set(pending)
+    if modified != len(pending):
+        # Algunas cambiaron en el medio (o el layout cuenta buckets): se mira el seq
+        applied = {
+            goal["_id"]
+            for goal in goals.find_many(str(user_id), pending, {"seq": 1})
+            if goal.get("seq") == stamp["seq"]
+        }
+
+    delta = StatsDelta(stamp["seq"] if stamp else None)
+    for (_, changes), group_ids in groups.items():
+        for id_goal in group_ids:
+            goal = found[id_goal]
+            if id_goal not in applied:
+                results[str(id_goal)] = "not_updated"
                 continue
+            reminder_scheduler.schedule({**goal, **dict(changes)})
+            delta.add_goal({**goal, **dict(changes)}).add_goal(goal, -1)
+    get_goal_stats_repository(request).apply(user_id, delta)
 
-        if goal["state"] == State.INIT:
-            if goal["metric"] == GoalTypes.KILOMETERS.value:
-                goal["progress_steps"] += step_to_kilometer(update_data.progress_steps)
-            elif goal["metric"] == GoalTypes.CALORIES.value:
-                goal["progress_steps"] += step_to_calorie(update_data.progress_steps)
-            else:
-                goal["progress_steps"] += update_data.progress_steps
+    logger.info(f'Bulk state {State(state).name}: {len(applied)} goals updated')
+    return {
+        "updated": len(applied),
+        "results": [
+            {"id": id_goal, "status": outcome} for id_goal, outcome in results.items()
+        ],
+    }
 
-            if goal["progress_steps"] >= goal["quantity_steps"]:
-                await complete_goal(request, goal["_id"], user_id)
 
-            goals.update_one(
-                {"_id": goal["_id"]},
-                {"$set": {"progress_steps": goal["progress_steps"]}},
-            )
+def goal_active_period(goal, now):
+    """(start, end) of the last period in which the goal was started, or
+    None if it was never started: the steps of its user in that period are
+    the ones that counted for it."""
+    start = to_utc(goal.get("date_init"))
+    if start is None:
+        return None
+    state = goal.get("state")
+    end = None
+    if state == State.COMPLETE.value:
+        end = to_utc(goal.get("date_complete"))
+    elif state == State.STOP.value:
+        end = to_utc(goal.get("date_stop"))
+    elif state == State.EXPIRED.value:
+        end = to_utc(goal.get("limit"))
+    return start, min(end or now, now)
 
-    return {"message": "All goals have been successfully updated"}
+
+@router_goal_states.get("/{id_goal}/history", status_code=status.HTTP_200_OK)
+async def get_goal_history(
+    request: Request,
+    id_goal: ObjectIdPydantic,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    user_id: ObjectId = Depends(get_user_id),
+):
+    goals = get_goal_repository(request, read_only=True)
+    goal = goals.find(id_goal)
+    # La meta de otro usuario no se distingue de una que no existe
+    if not goal or goal.get("user_id") != str(user_id):
+        logger.info(f'Goal {id_goal} not found to get history')
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content=f'Goal {id_goal} not found',
+        )
+
+    time_now = datetime.now(timezone.utc)
+    start, end = to_utc(start), to_utc(end)
+    if start is not None and end is not None and start >= end:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "Start date must be before end date"},
+        )
+
+    response = {
+        "id": str(goal["_id"]),
+        "metric": goal.get("metric"),
+        "granularity": None,
+        "points": [],
+    }
+    period = goal_active_period(goal, time_now)
+    if period is None:
+        return response
+    # Solo los pasos del periodo en que la meta avanzaba
+    start = max(start or period[0], period[0])
+    end = min(end or period[1], period[1])
+    if start >= end:
+        return response
+
+    granularity, points = progress_history.query(
+        get_read_collection(request, SAMPLES_COLLECTION),
+        get_read_collection(request, ROLLUPS_COLLECTION),
+        goal["user_id"],
+        start,
+        end,
+    )
+    calibration = await get_calibration(
+        get_primary_collection(request, CALIBRATIONS_COLLECTION), goal["user_id"]
+    )
+    metric = goal_metric(goal)
+
+    response["granularity"] = granularity
+    response["points"] = [
+        {
+            "start": point_start,
+            "progress": conversions.convert(metric, steps, calibration),
+        }
+        for point_start, steps in points
+    ]
+    return response
 
 
 @router_goal_states.patch("/{id_goal}/start", status_code=status.HTTP_200_OK)
@@ -74,18 +291,26 @@ async def start_goal(request: Request, id_goal: ObjectIdPydantic):
 
 
 async def complete_goal(request, id_goal, id_user):
-    goals = request.app.database["goals"]
-    goal = goals.find_one({"_id": id_goal})
+    goals = get_goal_repository(request)
+    goal = goals.find(id_goal)
     res = await update_state_goal(id_goal, request, State.COMPLETE)
     logger.info(f'Goal completed: {res.status_code}')
     headers = request.headers
 
     if training_id := goal.get('training_id'):
-        await ServiceTrainers.patch(
-            f'/athletes/me/trainings/{training_id}/complete',
-            json={},
-            headers={"authorization": headers["authorization"]},
-        )
+        if app_settings.TRAINING_COMPLETIONS_BATCH_ENABLED:
+            training_completions.add(
+                id_user,
+                training_id,
+                id_goal,
+                datetime.now(timezone.utc),
+            )
+        else:
+            await ServiceTrainers.patch(
+                f'/athletes/me/trainings/{training_id}/complete',
+                json={},
+                headers={"authorization": headers["authorization"]},
+            )
 
     await NotificationService.send_notification_completed(request, id_user, goal)
     return {"message": "Goal completed successfully"}
@@ -98,8 +323,8 @@ async def stop_goal(request: Request, id_goal: ObjectIdPydantic):
 
 
 async def update_state_goal(id_goal, request, state):
-    goals = request.app.database["goals"]
-    goal = goals.find_one({"_id": id_goal})
+    goals = get_goal_repository(request)
+    goal = goals.find(id_goal)
     if not goal:
         logger.info(f'Goal state {id_goal} not found to update')
         return JSONResponse(
@@ -109,35 +334,20 @@ async def update_state_goal(id_goal, request, state):
     logger.info(f'Updating goal state: {state.name}')
 
     now_time = datetime.now(timezone.utc)
-    if (
-        goal["limit"] is not None
-        and parser.parse(str(goal["limit"])).replace(tzinfo=timezone.utc) < now_time
-    ):
-        result_update = goals.update_one(
-            {"_id": goal["_id"]}, {"$set": {"state": State.EXPIRED.value}}
-        )
-    elif state == State.INIT.value and goal["state"] != State.INIT.value:
-        result_update = goals.update_one(
-            {"_id": id_goal}, {"$set": {"date_init": now_time, "state": state}}
-        )
-    elif state == State.STOP.value and goal["state"] == State.COMPLETE.value:
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content=f'Goal {id_goal} already completed',
-        )
-    elif state == State.COMPLETE.value and goal["state"] != State.COMPLETE.value:
-        result_update = goals.update_one(
-            {"_id": id_goal}, {"$set": {"date_complete": now_time, "state": state}}
-        )
-    elif state == State.STOP.value and goal["state"] == State.NOT_INIT.value:
+    changes, error = state_transition(goal, state, now_time)
+    if error is not None:
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
-            content=f'Goal {id_goal} not started',
+            content=f'Goal {id_goal} {error}',
         )
-    else:
-        result_update = goals.update_one({"_id": id_goal}, {"$set": {"state": state}})
 
-    if result_update.modified_count > 0:
+    stamp = goals.stamp(now_time)
+    if goals.update(goal["_id"], changes, stamp=stamp) > 0:
+        reminder_scheduler.schedule({**goal, **changes})
+        get_goal_stats_repository(request).apply(
+            goal["user_id"],
+            StatsDelta.change(goal, {**goal, **changes}, stamp["seq"]),
+        )
         logger.info(f'Updating goal {id_goal} to state {state} successfully')
         return JSONResponse(
             status_code=status.HTTP_200_OK,
@@ -0,0 +1,14 @@
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Request
+from starlette import status
+
+from app.auth.auth_utils import get_user_id
+from app.repositories.goal_stats import format_stats, get_goal_stats_repository
+
+router_goal_stats = APIRouter()
+
+
+@router_goal_stats.get("/stats", status_code=status.HTTP_200_OK)
+async def get_my_goal_stats(request: Request, user_id: ObjectId = Depends(get_user_id)):
+    stats = get_goal_stats_repository(request, read_only=True)
+    return format_stats(stats.get(user_id))
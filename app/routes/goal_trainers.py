@@ -0,0 +1,172 @@
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Query, Request
+from starlette import status
+from starlette.responses import JSONResponse
+from datetime import datetime, timezone
+
+from app.models.goal import GoalAssignment, State, to_utc
+from app.auth.auth_utils import get_trainer_id
+from app.config.config import logger
+from app.repositories.goal_stats import (
+    TRAINING_STATS_FIELDS,
+    StatsDelta,
+    format_training_stats,
+    get_goal_stats_repository,
+    get_training_stats_repository,
+)
+from app.repositories.goals import get_archive_repository, get_goal_repository
+from app.services.reminders import reminder_scheduler
+from app.services.services import ServiceTrainers
+
+router_goal_trainers = APIRouter()
+
+
+async def get_training_athletes(request, training_id):
+    response = await ServiceTrainers.get(
+        f'/trainers/me/trainings/{training_id}/athletes',
+        headers={"Authorization": request.headers.get("authorization")},
+    )
+    if response.status_code != 200:
+        logger.info(f'Athletes of training {training_id} not found')
+        return None
+    # Acepta una lista de ids o de atletas con su "id"
+    return [
+        athlete["id"] if isinstance(athlete, dict) else athlete
+        for athlete in response.json()
+    ]
+
+
+@router_goal_trainers.post("/assign", status_code=status.HTTP_200_OK)
+async def assign_goal(
+    request: Request,
+    assignment: GoalAssignment,
+    trainer_id: ObjectId = Depends(get_trainer_id),
+):
+    if assignment.training_id is None:
+        # Sin entrenamiento no hay contra que validar a los atletas
+        return JSONResponse(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            content={"message": "A training_id is required to assign a goal"},
+        )
+    enrolled = await get_training_athletes(request, assignment.training_id)
+    if enrolled is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content=f'Training {assignment.training_id} not found',
+        )
+
+    athlete_ids = assignment.athlete_ids or enrolled
+    enrolled_ids = set(enrolled)
+    unknown = [
+        athlete_id for athlete_id in athlete_ids if athlete_id not in enrolled_ids
+    ]
+    if unknown:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={
+                "message": "Athletes not enrolled in the training",
+                "athlete_ids": unknown,
+            },
+        )
+    if not athlete_ids:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "No athletes specified to assign the goal"},
+        )
+
+    time_now = datetime.now(timezone.utc)
+    template = assignment.goal
+    limit = to_utc(template.limit_time)
+    if limit is not None and limit < time_now:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "Limit date is before current date"},
+        )
+
+    # Mismos campos que create_goal, armados una sola vez para todo el lote
+    template_doc = {
+        "training_id": assignment.training_id,
+        "trainer_id": str(trainer_id),
+        "title": template.title,
+        "description": template.description,
+        "metric": template.metric.value,
+        "limit": limit,
+        "state": State.INIT.value,
+        "quantity_steps": template.quantity_steps,
+        "progress_steps": 0,
+        "date_init": time_now,
+    }
+
+    results, new_goals = [], []
+    for athlete_id in dict.fromkeys(athlete_ids):
+        if ObjectId.is_valid(athlete_id):
+            new_goals.append({**template_doc, "user_id": athlete_id})
+            results.append({"athlete_id": athlete_id, "id": None, "status": "created"})
+        else:
+            results.append({"athlete_id": athlete_id, "status": "invalid_athlete_id"})
+
+    goals = get_goal_repository(request)
+    errors = goals.insert_many(new_goals)
+
+    created = [result for result in results if result["status"] == "created"]
+    deltas = {}
+    for index, (result, goal) in enumerate(zip(created, new_goals)):
+        if index in errors:
+            result["status"] = "error"
+            result["message"] = errors[index]
+            continue
+        result["id"] = str(goal["_id"])
+        reminder_scheduler.schedule(goal, time_now)
+        deltas[goal["user_id"]] = StatsDelta(goal["seq"]).add_goal(goal)
+
+    get_goal_stats_repository(request).apply_many(deltas)
+
+    assigned = len(new_goals) - len(errors)
+    logger.info(f'Trainer {trainer_id} assigned a goal to {assigned} athletes')
+    return {"assigned": assigned, "results": results}
+
+
+@router_goal_trainers.get(
+    "/trainings/{training_id}/stats", status_code=status.HTTP_200_OK
+)
+async def get_training_stats(
+    request: Request,
+    training_id: str,
+    refresh: bool = Query(False),
+    trainer_id: ObjectId = Depends(get_trainer_id),
+):
+    # Solo el entrenador del entrenamiento ve sus atletas en el servicio
+    if await get_training_athletes(request, training_id) is None:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content=f'Training {training_id} does not belong to the trainer',
+        )
+
+    trainings = get_training_stats_repository(request)
+    stats = None if refresh else trainings.get(training_id)
+    if stats is None:
+        # Primera lectura (o refresh): se arma desde las metas del entrenamiento,
+        # leidas del primario para no partir de una foto atrasada
+        goals = get_goal_repository(request)
+        archive = get_archive_repository(request, primary=True)
+        stats = trainings.rebuild(
+            training_id,
+            lambda: training_goals(goals, archive, training_id),
+            goals.last_seq,
+            replace=refresh,
+        )
+    return format_training_stats(stats)
+
+
+def training_goals(goals, archive, training_id):
+    # Las archivadas siguen contando, como en las stats de cada usuario; una
+    # meta que se esta archivando esta en las dos colecciones
+    found = {
+        goal["_id"]: goal
+        for goal in archive.find_by_training(training_id, TRAINING_STATS_FIELDS)
+    }
+    found.update(
+        (goal["_id"], goal)
+        for goal in goals.find_by_training(training_id, TRAINING_STATS_FIELDS)
+    )
+    return found.values()
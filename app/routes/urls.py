@@ -1,10 +1,26 @@
 from fastapi import APIRouter
 
 from app.routes.goal_crud import router_goal_crud
+from app.routes.goal_events import router_goal_events
 from app.routes.goal_states import router_goal_states
+from app.routes.goal_stats import router_goal_stats
+from app.routes.goal_trainers import router_goal_trainers
+from app.routes.metrics import router_metrics
 
 api_router = APIRouter()
 
+api_router.include_router(
+    router_goal_events,
+    tags=["Goals for Athletes - Goals microservice"],
+    prefix="/athletes/me/goals",
+)
+
+api_router.include_router(
+    router_goal_stats,
+    tags=["Goals for Athletes - Goals microservice"],
+    prefix="/athletes/me/goals",
+)
+
 api_router.include_router(
     router_goal_states,
     tags=["Goals for Athletes - Goals microservice"],
@@ -16,3 +32,11 @@ api_router.include_router(
     tags=["CRUD for Athletes - Goals microservice"],
     prefix="/athletes/me/goals",
 )
+
+api_router.include_router(
+    router_goal_trainers,
+    tags=["Goals for Trainers - Goals microservice"],
+    prefix="/trainers/me/goals",
+)
+
+api_router.include_router(router_metrics, tags=["Metrics - Goals microservice"])
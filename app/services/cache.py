@@ -0,0 +1,133 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from app.config.config import logger
+from app.services.metrics import metrics
+
+cache_requests = metrics.counter(
+    "cache_requests_total", "Lookups of the service caches by result"
+)
+cache_entries = metrics.gauge("cache_entries", "Entries held by the service caches")
+
+HIT = "hit"
+MISS = "miss"
+COALESCED = "coalesced"
+STALE = "stale"
+NEGATIVE_HIT = "negative_hit"
+
+
+class CacheEntry:
+    __slots__ = ("value", "negative", "fresh_until", "stale_until")
+
+    def __init__(self, value, negative, fresh_until, stale_until):
+        self.value = value
+        self.negative = negative
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class SingleFlightCache:
+    """Bounded TTL cache whose misses share one in-flight fetch per key.
+
+    Only the values accepted by `is_cacheable` are stored; the ones flagged
+    by `is_negative` (e.g. a 404) live `negative_ttl` seconds. A positive
+    value past its TTL is still served for `stale_ttl` seconds while a
+    single background fetch refreshes it.
+    """
+
+    def __init__(
+        self,
+        name,
+        ttl,
+        stale_ttl=0,
+        negative_ttl=0,
+        max_entries=10000,
+        is_cacheable=lambda value: True,
+        is_negative=lambda value: False,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.is_cacheable = is_cacheable
+        self.is_negative = is_negative
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.in_flight = {}
+
+    def count(self, result):
+        cache_requests.inc(cache=self.name, result=result)
+
+    def store(self, key, value):
+        if not self.is_cacheable(value):
+            return
+        negative = self.is_negative(value)
+        # Las respuestas negativas no se sirven vencidas
+        ttl, stale_ttl = (
+            (self.negative_ttl, 0) if negative else (self.ttl, self.stale_ttl)
+        )
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        now = self.clock()
+        self.entries[key] = CacheEntry(
+            value, negative, now + ttl, now + ttl + stale_ttl
+        )
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        cache_entries.set(len(self.entries), cache=self.name)
+
+    async def _fetch(self, key, fetch):
+        try:
+            value = await fetch()
+            self.store(key, value)
+            return value
+        finally:
+            del self.in_flight[key]
+
+    def _start_fetch(self, key, fetch):
+        task = asyncio.ensure_future(self._fetch(key, fetch))
+        self.in_flight[key] = task
+        return task
+
+    def _refreshed(self, key, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(
+                f'Could not refresh {self.name} cache entry {key}: {task.exception()}'
+            )
+
+    async def get(self, key, fetch):
+        entry = self.entries.get(key)
+        now = self.clock()
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.entries.move_to_end(key)
+                self.count(NEGATIVE_HIT if entry.negative else HIT)
+                return entry.value
+            if now < entry.stale_until:
+                self.count(STALE)
+                if key not in self.in_flight:
+                    task = self._start_fetch(key, fetch)
+                    task.add_done_callback(lambda task: self._refreshed(key, task))
+                return entry.value
+            del self.entries[key]
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.count(COALESCED)
+        else:
+            self.count(MISS)
+            task = self._start_fetch(key, fetch)
+        # shield: si un cliente se desconecta no cancela la consulta compartida
+        return await asyncio.shield(task)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+        cache_entries.set(len(self.entries), cache=self.name)
+
+    def clear(self):
+        self.entries.clear()
+        cache_entries.set(0, cache=self.name)
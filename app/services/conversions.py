@@ -0,0 +1,122 @@
+import inspect
+from functools import lru_cache
+
+from app.config.config import get_settings
+from app.models.goal import Calibration, GoalTypes
+from app.services.cache import SingleFlightCache
+
+app_settings = get_settings()
+
+CALIBRATIONS_COLLECTION = "user_calibrations"
+DEFAULT_CALIBRATION = Calibration()
+
+CALORIES_PER_STEP = 0.04
+# Peso para el que vale CALORIES_PER_STEP
+REFERENCE_WEIGHT_KG = 70
+
+calibration_cache = SingleFlightCache(
+    "user-calibration",
+    ttl=app_settings.CALIBRATION_CACHE_TTL_SECONDS,
+    max_entries=app_settings.CACHE_MAX_ENTRIES,
+)
+
+
+@lru_cache()
+def load_numpy():
+    # NumPy es opcional y pesado: se importa recien con el primer lote
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class ConversionRegistry:
+    """Conversions from steps to the metric of each goal.
+
+    A conversion is a function of the steps and of the `Calibration`
+    fields named by its other parameters. It only does arithmetic, so the
+    same function converts one value or, when NumPy is installed, whole
+    arrays of samples in one call.
+    """
+
+    def __init__(self):
+        self.conversions = {}
+
+    def register(self, metric):
+        def decorator(convert):
+            fields = list(inspect.signature(convert).parameters)[1:]
+            self.conversions[metric] = (convert, fields)
+            return convert
+
+        return decorator
+
+    def convert(self, metric, steps, calibration=DEFAULT_CALIBRATION):
+        convert, fields = self.conversions[metric]
+        return convert(steps, *(getattr(calibration, field) for field in fields))
+
+    def convert_many(self, metric, steps, calibrations=DEFAULT_CALIBRATION):
+        """Convert a sequence of samples, with one calibration for all of them
+        or one per sample (e.g. the calibration of the user of each sample)."""
+        convert, fields = self.conversions[metric]
+        shared = isinstance(calibrations, Calibration)
+        numpy = load_numpy()
+        if numpy is None:
+            if shared:
+                return [self.convert(metric, value, calibrations) for value in steps]
+            return [
+                self.convert(metric, value, calibration)
+                for value, calibration in zip(steps, calibrations)
+            ]
+
+        if shared:
+            parameters = [getattr(calibrations, field) for field in fields]
+        else:
+            parameters = [
+                numpy.array(
+                    [getattr(calibration, field) for calibration in calibrations]
+                )
+                for field in fields
+            ]
+        return convert(numpy.asarray(steps, dtype=float), *parameters)
+
+    def totals(self, steps, calibrations=DEFAULT_CALIBRATION):
+        """Increments of every metric for a batch of samples."""
+        numpy = load_numpy()
+        total = sum if numpy is None else numpy.sum
+        return {
+            metric: float(total(self.convert_many(metric, steps, calibrations)))
+            for metric in self.conversions
+        }
+
+
+conversions = ConversionRegistry()
+
+
+@conversions.register(GoalTypes.STEPS.value)
+def step_to_step(steps):
+    return steps
+
+
+@conversions.register(GoalTypes.KILOMETERS.value)
+def step_to_kilometer(steps, stride_length_m):
+    meters = steps * stride_length_m
+    return meters / 1000
+
+
+@conversions.register(GoalTypes.CALORIES.value)
+def step_to_calorie(steps, weight_kg):
+    return steps * CALORIES_PER_STEP * (weight_kg / REFERENCE_WEIGHT_KG)
+
+
+async def get_calibration(collection, user_id):
+    async def fetch():
+        document = collection.find_one({"_id": user_id}, {"_id": 0})
+        return Calibration(**document) if document else DEFAULT_CALIBRATION
+
+    return await calibration_cache.get(user_id, fetch)
+
+
+def save_calibration(collection, user_id, calibration):
+    collection.replace_one({"_id": user_id}, calibration.dict(), upsert=True)
+    calibration_cache.invalidate(user_id)
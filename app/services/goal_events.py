@@ -0,0 +1,276 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import PyMongoError
+
+from app.config.config import logger, get_settings
+from app.models.goal import GoalResponse
+from app.repositories.goals import (
+    TOMBSTONES_COLLECTION,
+    BucketGoalRepository,
+    get_goal_repository_class,
+    is_settled,
+)
+
+app_settings = get_settings()
+
+GOAL_EVENT = "goal"
+DELETED_EVENT = "deleted"
+# La cola del cliente se lleno: debe pedir /sync con su ultimo watermark
+RESYNC_EVENT = "resync"
+
+
+class Subscription:
+    """Bounded queue of the events of one connection."""
+
+    def __init__(self, user_id, max_queue):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def push(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Un cliente lento no acumula memoria: se vacia y se le pide un resync
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((RESYNC_EVENT, {}))
+            self.overflowed = True
+
+    async def next(self, timeout):
+        event = await asyncio.wait_for(self.queue.get(), timeout)
+        if event[0] == RESYNC_EVENT:
+            self.overflowed = False
+        return event
+
+
+class GoalEventBroker:
+    """In-process pub/sub of goal events by user."""
+
+    def __init__(self, max_queue=100, max_per_user=5):
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, user_id):
+        if len(self.subscriptions[user_id]) >= self.max_per_user:
+            return None
+        subscription = Subscription(user_id, self.max_queue)
+        self.subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self.subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event, data):
+        for subscription in self.subscriptions.get(user_id, ()):
+            subscription.push((event, data))
+
+    def publish_all(self, events):
+        for user_id, event, data in events:
+            self.publish(user_id, event, data)
+
+
+def goal_event(goal):
+    user_id = goal.get("user_id")
+    return user_id, GOAL_EVENT, jsonable_encoder(GoalResponse.from_mongo(dict(goal)))
+
+
+def deleted_event(tombstone):
+    return tombstone.get("user_id"), DELETED_EVENT, {"id": str(tombstone["_id"])}
+
+
+def last_written(bucket):
+    # Cada escritura sella con un solo seq: las metas con el mayor son las que cambiaron
+    goals = bucket.get("goals") or []
+    last_seq = max((goal.get("seq", 0) for goal in goals), default=0)
+    return [goal for goal in goals if goal.get("seq", 0) == last_seq]
+
+
+class PollingFeed:
+    """Publishes the goals and tombstones with a `seq` above the last seen.
+
+    Stand-in for the change stream when there is no replica set (and in
+    tests); every worker polls on its own. A seq is taken before its write
+    commits, so the cursor only passes the changes older than `lag`
+    seconds, like the sync watermark: the newer ones are read again on the
+    next polls and published once.
+    """
+
+    def __init__(self, broker, repository, interval=1.0, lag=5.0):
+        self.broker = broker
+        self.repository = repository
+        self.interval = interval
+        self.lag = lag
+        self.last_seq = None
+        self.published = set()
+        self.task = None
+
+    def poll(self, now=None):
+        if self.last_seq is None:
+            # No se repite la historia: se arranca desde el ultimo seq
+            self.last_seq = self.repository.last_seq()
+            return []
+
+        settled_before = (now or datetime.now(timezone.utc)) - timedelta(
+            seconds=self.lag
+        )
+        changes = [
+            (GOAL_EVENT, goal_event, goal)
+            for goal in self.repository.find_all_changed_since(self.last_seq)
+        ] + [
+            (DELETED_EVENT, deleted_event, tombstone)
+            for tombstone in self.repository.find_all_deleted_since(self.last_seq)
+        ]
+
+        events, published = [], set()
+        for kind, to_event, doc in changes:
+            key = (kind, doc["_id"], doc.get("seq", 0))
+            if key not in self.published:
+                events.append(to_event(doc))
+            if is_settled(doc, settled_before):
+                self.last_seq = max(self.last_seq, doc.get("seq", 0))
+            else:
+                published.add(key)
+        self.published = published
+        return events
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self.broker.publish_all(await loop.run_in_executor(None, self.poll))
+            except Exception as e:
+                logger.error(f'Goal events polling failed: {e}')
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
+class ChangeStreamFeed:
+    """Publishes goal changes read from a Mongo change stream.
+
+    The stream is read in a thread and the events are handed to the event
+    loop, so every worker fans out the writes of all the workers.
+    """
+
+    def __init__(self, broker, database, collection_name):
+        self.broker = broker
+        self.database = database
+        self.collection_name = collection_name
+        self.resume_token = None
+        self._stop = threading.Event()
+
+    def to_events(self, change):
+        doc = change.get("fullDocument")
+        if not doc:
+            return []
+        if change["ns"]["coll"] == TOMBSTONES_COLLECTION:
+            return [deleted_event(doc)]
+        if self.collection_name == BucketGoalRepository.collection_name:
+            return [goal_event(goal) for goal in last_written(doc)]
+        return [goal_event(doc)]
+
+    def watch(self, loop):
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": [self.collection_name, TOMBSTONES_COLLECTION]},
+                    "operationType": {"$in": ["insert", "update", "replace"]},
+                }
+            }
+        ]
+        while not self._stop.is_set():
+            try:
+                with self.database.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    resume_after=self.resume_token,
+                    max_await_time_ms=1000,
+                ) as stream:
+                    while not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        self.resume_token = stream.resume_token
+                        loop.call_soon_threadsafe(
+                            self.broker.publish_all, self.to_events(change)
+                        )
+            except PyMongoError as e:
+                logger.error(f'Goal events change stream failed: {e}')
+                self._stop.wait(1)
+
+    def start(self, loop):
+        thread = threading.Thread(
+            target=self.watch, args=(loop,), name="goal-events", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def format_sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def sse_stream(broker, subscription, is_disconnected, keepalive):
+    """Yields the events of a subscription as Server-Sent Events.
+
+    Each event is sent only after the previous one was written, so a slow
+    client fills its own bounded queue instead of the memory of the worker.
+    """
+    try:
+        yield format_sse("ready", {})
+        while not await is_disconnected():
+            try:
+                event, data = await subscription.next(keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(event, data)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+goal_event_broker = GoalEventBroker(
+    max_queue=app_settings.GOAL_EVENTS_QUEUE_SIZE,
+    max_per_user=app_settings.GOAL_EVENTS_MAX_PER_USER,
+)
+
+
+def start_goal_events_feed(database, settings):
+    repository_class = get_goal_repository_class()
+    if settings.GOAL_EVENTS_FEED == "change_stream":
+        feed = ChangeStreamFeed(
+            goal_event_broker, database, repository_class.collection_name
+        )
+        feed.start(asyncio.get_running_loop())
+    elif settings.GOAL_EVENTS_FEED == "polling":
+        feed = PollingFeed(
+            goal_event_broker,
+            repository_class(database[repository_class.collection_name]),
+            settings.GOAL_EVENTS_POLL_SECONDS,
+            settings.GOALS_SYNC_LAG_SECONDS,
+        )
+        feed.start()
+    else:
+        raise ValueError(f'Unknown goal events feed: {settings.GOAL_EVENTS_FEED}')
+    return feed
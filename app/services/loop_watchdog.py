@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from app.config.config import logger, get_settings
+from app.services.metrics import metrics
+
+app_settings = get_settings()
+
+loop_lag = metrics.histogram(
+    "event_loop_lag_seconds",
+    "Delay of the event loop in running a scheduled callback",
+    [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5],
+)
+loop_blocked = metrics.counter(
+    "event_loop_blocked_total", "Event loop stalls above the threshold by route"
+)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NO_ROUTE = "<no request>"
+
+
+def blocking_call(frame):
+    """Innermost frame of the app code in a stack: the call that blocks."""
+    while frame is not None:
+        if frame.f_code.co_filename.startswith(APP_DIR):
+            code = frame.f_code
+            file_name = os.path.relpath(code.co_filename, os.path.dirname(APP_DIR))
+            return f'{code.co_name} ({file_name}:{frame.f_lineno})'
+        frame = frame.f_back
+    return None
+
+
+def route_name(scope):
+    route = scope.get("route")
+    return f'{scope["method"]} {route.path if route is not None else scope["path"]}'
+
+
+class LoopWatchdog:
+    """Measures the scheduling lag of the event loop and reports its stalls.
+
+    A task sleeps `interval` seconds and records how late it woke up. A
+    thread checks that the task keeps ticking: when the loop is stuck for
+    more than `threshold` seconds it captures the stack of the loop thread
+    while it is still blocked, and the route of the request being run.
+    """
+
+    def __init__(self, interval=0.1, threshold=0.25, max_reports=100):
+        self.interval = interval
+        self.threshold = threshold
+        self.active = {}
+        self.reports = deque(maxlen=max_reports)
+        self.last_tick = time.perf_counter()
+        self.reported_tick = None
+        self.loop = None
+        self.thread_id = None
+        self._stop = threading.Event()
+
+    def track(self, scope):
+        self.active[asyncio.current_task()] = scope
+
+    def untrack(self):
+        self.active.pop(asyncio.current_task(), None)
+
+    def report(self, stalled):
+        frame = sys._current_frames().get(self.thread_id)
+        scope = self.active.get(asyncio.current_task(self.loop))
+        route = route_name(scope) if scope is not None else NO_ROUTE
+        call = blocking_call(frame)
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+
+        loop_blocked.inc(route=route)
+        self.reports.append(
+            {"route": route, "call": call, "stalled": stalled, "stack": stack}
+        )
+        logger.warning(
+            f'Event loop blocked for {stalled:.3f}s in {route} at {call}\n{stack}'
+        )
+
+    def watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            last_tick = self.last_tick
+            stalled = time.perf_counter() - last_tick - self.interval
+            # Un solo reporte por bloqueo
+            if stalled > self.threshold and self.reported_tick != last_tick:
+                self.reported_tick = last_tick
+                try:
+                    self.report(stalled)
+                except Exception as e:
+                    logger.error(f'Could not report event loop stall: {e}')
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.last_tick = time.perf_counter()
+        self._stop.clear()
+        thread = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        thread.start()
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                loop_lag.observe(max(0.0, now - self.last_tick - self.interval))
+                self.last_tick = now
+        finally:
+            self._stop.set()
+
+
+class LoopWatchdogMiddleware:
+    """Records which request each task runs, for the stall reports."""
+
+    def __init__(self, app, watchdog):
+        self.app = app
+        self.watchdog = watchdog
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        self.watchdog.track(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.watchdog.untrack()
+
+
+loop_watchdog = LoopWatchdog(
+    interval=app_settings.LOOP_WATCHDOG_INTERVAL_SECONDS,
+    threshold=app_settings.LOOP_WATCHDOG_THRESHOLD_SECONDS,
+)
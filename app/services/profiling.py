@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from app.auth.auth_utils import is_admin_token
+from app.config.config import logger
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_OUTPUT_HEADER = b"x-profile-output"
+INLINE_OUTPUT = b"inline"
+# Hoja de las muestras en que la tarea esta suspendida (Mongo async, httpx, sleep)
+AWAIT_FRAME = "<await>"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+def frame_key(code):
+    return (
+        getattr(code, "co_qualname", code.co_name),
+        code.co_filename,
+        code.co_firstlineno,
+    )
+
+
+def frame_stack(frame):
+    stack = []
+    while frame is not None:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def await_stack(coro):
+    """Codes of the coroutine chain of a suspended task, outermost first."""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(frame.f_code)
+        awaited = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if awaited is None or not (
+            hasattr(awaited, "cr_frame") or hasattr(awaited, "gi_frame")
+        ):
+            stack.append(AWAIT_FRAME)
+            break
+        coro = awaited
+    return stack
+
+
+class Sampler:
+    """Samples the stack of one asyncio task from a background thread.
+
+    While the task runs, the stack of the event loop thread is recorded
+    (blocking Mongo calls included); while it is suspended, its chain of
+    awaits, so the time spent waiting on downstream services shows up too.
+    Stacks are cut at `root`, the code of the frame that started profiling.
+    """
+
+    def __init__(self, task, root, interval):
+        self.task = task
+        self.loop = task.get_loop()
+        self.thread_id = threading.get_ident()
+        self.root = root
+        self.interval = interval
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def stack(self):
+        if asyncio.current_task(self.loop) is self.task:
+            stack = frame_stack(sys._current_frames().get(self.thread_id))
+        else:
+            stack = await_stack(self.task.get_coro())
+        if self.root in stack:
+            stack = stack[stack.index(self.root) :]
+        return stack
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            try:
+                stack = self.stack()
+            except Exception:
+                # La tarea cambio mientras se recorria: se descarta la muestra
+                continue
+            finally:
+                elapsed, last = now - last, now
+            self.samples.append(stack)
+            self.weights.append(elapsed)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def to_speedscope(self, name):
+        frames, index = [], {}
+        samples = []
+        for stack in self.samples:
+            sample = []
+            for code in stack:
+                key = code if isinstance(code, str) else frame_key(code)
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append(
+                        {"name": key}
+                        if isinstance(key, str)
+                        else {"name": key[0], "file": key[1], "line": key[2]}
+                    )
+                sample.append(index[key])
+            samples.append(sample)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration,
+                    "samples": samples,
+                    "weights": self.weights,
+                }
+            ],
+            "name": name,
+            "exporter": "goals-microservice",
+        }
+
+
+def get_header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+class ProfilingMiddleware:
+    """Profiles single requests selected by an admin token or by sampling.
+
+    `X-Profile: <admin JWT>` profiles that request; `X-Profile-Output:
+    inline` returns the speedscope profile instead of the response body.
+    Otherwise the profile is written to `output_dir` and its path is sent
+    in the `X-Profile-File` header. Sampled requests keep their response
+    untouched: their profile is only written to `output_dir`. Requests
+    that are not selected pay one header lookup.
+    """
+
+    def __init__(self, app, sample_rate=0.0, interval=0.001, output_dir="profiles"):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = get_header(scope, PROFILE_HEADER)
+        if token is not None:
+            if not is_admin_token(token.decode("latin-1")):
+                logger.warning(f'Invalid profiling token for {scope["path"]}')
+                return await self.app(scope, receive, send)
+            admin = True
+        elif not self.sample_rate or random.random() >= self.sample_rate:
+            return await self.app(scope, receive, send)
+        else:
+            admin = False
+
+        # Solo un admin cambia la respuesta; el muestreo solo escribe a disco
+        inline = admin and get_header(scope, PROFILE_OUTPUT_HEADER) == INLINE_OUTPUT
+        await self.profile(scope, receive, send, inline, admin)
+
+    async def profile(self, scope, receive, send, inline, admin=True):
+        name = f'{scope["method"]} {scope["path"]}'
+        path = None
+        if not inline:
+            file_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+            path = os.path.join(
+                self.output_dir, f'{time.time_ns()}-{file_name}.speedscope.json'
+            )
+
+        messages = []
+
+        async def send_profiled(message):
+            if inline:
+                messages.append(message)
+                return
+            if admin and message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-file", path.encode())
+                ]
+            await send(message)
+
+        sampler = Sampler(
+            asyncio.current_task(), ProfilingMiddleware.profile.__code__, self.interval
+        )
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            sampler.stop()
+            profile = sampler.to_speedscope(name)
+            if path is not None:
+                # El archivo se escribe fuera del event loop
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.write, path, profile
+                )
+
+        if inline:
+            start = next(m for m in messages if m["type"] == "http.response.start")
+            body = json.dumps(profile).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"x-profile-status", str(start["status"]).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+
+    def write(self, path, profile):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path, "w") as file:
+                json.dump(profile, file)
+            logger.info(f'Profile written to {path}')
+        except OSError as e:
+            logger.error(f'Could not write profile {path}: {e}')
@@ -0,0 +1,142 @@
+import asyncio
+from collections import Counter
+from datetime import timedelta
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import CollectionInvalid
+
+from app.config.config import logger, get_settings
+
+app_settings = get_settings()
+
+SAMPLES_COLLECTION = "progress_samples"
+ROLLUPS_COLLECTION = "progress_rollups"
+
+RAW = "raw"
+HOUR = "hour"
+DAY = "day"
+
+
+def truncate(ts, granularity):
+    if granularity == HOUR:
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class ProgressHistory:
+    """History of the steps reported by each user.
+
+    `record` only appends to an in-memory buffer; a background task
+    flushes it with one insert_many into the `progress_samples` time-series
+    collection and one bulk of `$inc` upserts into the hourly and daily
+    rollups. Samples are stored in steps, per user: the history of a goal
+    is the steps of its user while it was started.
+    """
+
+    def __init__(self, enabled=True, max_buffer=10000):
+        self.enabled = enabled
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.dropped = 0
+
+    @staticmethod
+    def create_collections(database):
+        try:
+            database.create_collection(
+                SAMPLES_COLLECTION,
+                timeseries={
+                    "timeField": "ts",
+                    "metaField": "meta",
+                    "granularity": "minutes",
+                },
+            )
+        except CollectionInvalid:
+            pass
+        database[ROLLUPS_COLLECTION].create_index(
+            [("user_id", ASCENDING), ("granularity", ASCENDING), ("start", ASCENDING)],
+            unique=True,
+        )
+
+    def record(self, user_id, steps, ts):
+        if not self.enabled:
+            return
+        if len(self.buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self.buffer.append({"ts": ts, "meta": {"user_id": user_id}, "steps": steps})
+
+    def flush(self, database):
+        samples, self.buffer = self.buffer, []
+        if not samples:
+            return 0
+
+        rollups = Counter()
+        for sample in samples:
+            for granularity in (HOUR, DAY):
+                start = truncate(sample["ts"], granularity)
+                rollups[(sample["meta"]["user_id"], granularity, start)] += sample[
+                    "steps"
+                ]
+
+        database[SAMPLES_COLLECTION].insert_many(samples, ordered=False)
+        database[ROLLUPS_COLLECTION].bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": user_id, "granularity": granularity, "start": start},
+                    {"$inc": {"steps": steps}},
+                    upsert=True,
+                )
+                for (user_id, granularity, start), steps in rollups.items()
+            ],
+            ordered=False,
+        )
+        return len(samples)
+
+    async def run(self, get_database, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.flush, get_database())
+            except Exception as e:
+                logger.error(f'Progress history flush failed: {e}')
+            if self.dropped:
+                logger.warning(f'Progress history dropped {self.dropped} samples')
+                self.dropped = 0
+
+    @staticmethod
+    def granularity_for(start, end):
+        if end - start <= timedelta(days=1):
+            return RAW
+        if end - start <= timedelta(days=14):
+            return HOUR
+        return DAY
+
+    def query(self, samples, rollups, user_id, start, end):
+        """Return (granularity, [(start, steps)]) for the range [start, end).
+
+        Short ranges read the raw samples, longer ones the hourly or daily
+        rollups, so a chart never reads more than a few hundred documents.
+        """
+        granularity = self.granularity_for(start, end)
+        if granularity == RAW:
+            samples = samples.find(
+                {"meta.user_id": user_id, "ts": {"$gte": start, "$lt": end}},
+                {"ts": 1, "steps": 1},
+            ).sort("ts", ASCENDING)
+            return granularity, [(sample["ts"], sample["steps"]) for sample in samples]
+
+        rollups = rollups.find(
+            {
+                "user_id": user_id,
+                "granularity": granularity,
+                "start": {"$gte": truncate(start, granularity), "$lt": end},
+            }
+        ).sort("start", ASCENDING)
+        return granularity, [(rollup["start"], rollup["steps"]) for rollup in rollups]
+
+
+progress_history = ProgressHistory(
+    enabled=app_settings.PROGRESS_HISTORY_ENABLED,
+    max_buffer=app_settings.PROGRESS_HISTORY_MAX_BUFFER,
+)
@@ -0,0 +1,175 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from app.config.config import logger, get_settings
+from app.models.goal import State, to_utc
+
+app_settings = get_settings()
+
+ACTIVE_STATES = [State.NOT_INIT.value, State.INIT.value]
+
+
+class TimerWheel:
+    """Hashed timing wheel with one slot per `resolution` seconds.
+
+    Scheduling and cancelling are O(1); advancing only visits the slots
+    elapsed since the previous call.
+    """
+
+    def __init__(self, resolution=60):
+        self.resolution = resolution
+        self._slots = defaultdict(dict)
+        self._ticks = {}
+        self._current = None
+
+    def __len__(self):
+        return len(self._ticks)
+
+    def __contains__(self, key):
+        return key in self._ticks
+
+    def schedule(self, key, when, payload):
+        self.cancel(key)
+        tick = int(when // self.resolution)
+        if self._current is not None:
+            tick = max(tick, self._current)
+        self._slots[tick][key] = payload
+        self._ticks[key] = tick
+
+    def cancel(self, key):
+        tick = self._ticks.pop(key, None)
+        if tick is None:
+            return
+        slot = self._slots[tick]
+        slot.pop(key, None)
+        if not slot:
+            del self._slots[tick]
+
+    def advance(self, now):
+        target = int(now // self.resolution)
+        if self._current is None:
+            self._current = min(self._slots, default=target)
+
+        due = []
+        while self._current <= target:
+            for key, payload in self._slots.pop(self._current, {}).items():
+                del self._ticks[key]
+                due.append(payload)
+            self._current += 1
+        return due
+
+
+class ReminderScheduler:
+    """Reminders before the `limit` of active goals.
+
+    Only the deadlines inside a sliding window are kept in memory. Every
+    tick re-reads the active goals of the window with a range query on the
+    indexed `limit` field, so the goals created, moved, finished or deleted
+    by other workers are picked up before anything is sent. Run it in a
+    single worker (REMINDERS_ENABLED), otherwise every worker sends the
+    same reminders.
+    """
+
+    def __init__(self, offsets, window, resolution=60, batch_size=100):
+        self.offsets = sorted(offsets, reverse=True)
+        self.window = window
+        self.batch_size = batch_size
+        self.wheel = TimerWheel(resolution)
+        self.loaded_until = None
+        self.loaded_at = None
+        # Limite con el que se programo cada meta y de cada aviso ya enviado
+        self.limits = {}
+        self.sent = {}
+
+    def _reminder_keys(self, id_goal):
+        return [(str(id_goal), offset) for offset in self.offsets]
+
+    def schedule(self, goal, now=None):
+        """Add or refresh the reminders of a goal that was created or updated."""
+        self.cancel(goal["_id"])
+        limit = goal.get("limit")
+        if self.loaded_until is None or limit is None:
+            return
+        limit = to_utc(limit)
+        if limit >= self.loaded_until or goal.get("state") not in ACTIVE_STATES:
+            return
+
+        now = now or datetime.now(timezone.utc)
+        self.limits[str(goal["_id"])] = limit
+        for key, offset in zip(self._reminder_keys(goal["_id"]), self.offsets):
+            fire_at = limit - offset
+            # La rueda puede adelantar un aviso hasta `resolution` segundos
+            if fire_at > now and self.sent.get(key) != limit:
+                payload = {
+                    "id_receiver": goal["user_id"],
+                    "id_goal": str(goal["_id"]),
+                    "title_goal": goal.get("title"),
+                    "hours_left": int(offset.total_seconds() // 3600),
+                }
+                self.wheel.schedule(key, fire_at.timestamp(), (key, limit, payload))
+
+    def cancel(self, id_goal):
+        self.limits.pop(str(id_goal), None)
+        for key in self._reminder_keys(id_goal):
+            self.wheel.cancel(key)
+
+    def load(self, repository, now):
+        """Re-read the active goals of the window; returns how many there are."""
+        self.loaded_until = now + self.window + self.offsets[0]
+        # Los avisos que vencieron desde la lectura anterior tambien se envian
+        since, self.loaded_at = self.loaded_at or now, now
+        found = set()
+        for goal in repository.find_by_limit_range(
+            now, self.loaded_until, ACTIVE_STATES
+        ):
+            found.add(str(goal["_id"]))
+            self.schedule(goal, since)
+
+        # Terminadas, borradas o movidas fuera de la ventana en otro proceso
+        for id_goal in set(self.limits) - found:
+            self.cancel(id_goal)
+        self.sent = {key: limit for key, limit in self.sent.items() if limit > now}
+        return len(found)
+
+    def due(self, now):
+        reminders = []
+        for key, limit, payload in self.wheel.advance(now.timestamp()):
+            self.sent[key] = limit
+            reminders.append(payload)
+        return reminders
+
+    async def tick(self, repository, now):
+        self.load(repository, now)
+        if reminders := self.due(now):
+            await self.dispatch(reminders)
+
+    async def dispatch(self, reminders):
+        # Import diferido: services importa app.main, que importa las rutas
+        from app.services.services import NotificationService
+
+        for start in range(0, len(reminders), self.batch_size):
+            batch = reminders[start : start + self.batch_size]
+            try:
+                await NotificationService.send_reminders(batch)
+            except Exception as e:
+                logger.error(f'Could not send {len(batch)} goal reminders: {e}')
+
+    async def run(self, get_repository, interval):
+        while True:
+            try:
+                await self.tick(get_repository(), datetime.now(timezone.utc))
+            except Exception as e:
+                logger.error(f'Reminder scheduler iteration failed: {e}')
+            await asyncio.sleep(interval)
+
+
+reminder_scheduler = ReminderScheduler(
+    offsets=[
+        timedelta(hours=float(hours))
+        for hours in app_settings.REMINDER_OFFSETS_HOURS.split(",")
+    ],
+    window=timedelta(seconds=app_settings.REMINDER_WINDOW_SECONDS),
+    resolution=app_settings.REMINDER_RESOLUTION_SECONDS,
+    batch_size=app_settings.REMINDER_BATCH_SIZE,
+)
@@ -1,24 +1,48 @@
 from fastapi import HTTPException
-import httpx
-from app.config.config import Settings
+from app.config.config import get_settings
 import app.main as main
+from app.services.cache import SingleFlightCache
+from app.services.tracing import client_span, inject_headers
 from starlette import status
 
-app_settings = Settings()
+app_settings = get_settings()
+
+# Los atletas de un entrenamiento se piden en cada asignacion y consulta de
+# stats. No se sirven vencidos: validan a quien se le asigna una meta
+training_cache = SingleFlightCache(
+    "training-service",
+    ttl=app_settings.TRAINING_CACHE_TTL_SECONDS,
+    negative_ttl=app_settings.TRAINING_CACHE_NEGATIVE_TTL_SECONDS,
+    max_entries=app_settings.CACHE_MAX_ENTRIES,
+    is_cacheable=lambda response: response.status_code
+    in (status.HTTP_200_OK, status.HTTP_404_NOT_FOUND),
+    is_negative=lambda response: response.status_code == status.HTTP_404_NOT_FOUND,
+)
+
+
+def http_client():
+    # httpx es de lo mas lento de importar: se carga en la primera llamada a
+    # otro servicio y no en el arranque
+    import httpx
+
+    return httpx.AsyncClient()
 
 
 class ServiceUsers:
     @staticmethod
-    async def get(path):
+    async def patch(path, json, headers):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    app_settings.USER_SERVICE_URL + path + '?map_trainings=false'
-                )
+            url = f"{app_settings.USER_SERVICE_URL}{path}"
+            with client_span("user-service", "PATCH", url) as span:
+                async with http_client() as client:
+                    response = await client.patch(
+                        url, json=json, headers=inject_headers(headers)
+                    )
+                span.set_attribute("http.status_code", response.status_code)
                 return response
         except Exception:
             main.logger.error(
-                f'User service cannot be accessed for {app_settings.USER_SERVICE_URL + path}'
+                f'User service cannot be accessed for {app_settings.USER_SERVICE_URL}{path}'
             )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -26,54 +50,83 @@ class ServiceUsers:
             )
 
     @staticmethod
-    async def patch(path, json, headers):
+    async def post(path, json, headers):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.patch(
-                    f"{app_settings.USER_SERVICE_URL}{path}",
-                    json=json,
-                    headers=headers,
-                )
+            url = f"{app_settings.USER_SERVICE_URL}{path}"
+            with client_span("user-service", "POST", url) as span:
+                async with http_client() as client:
+                    response = await client.post(
+                        url, json=json, headers=inject_headers(headers)
+                    )
+                span.set_attribute("http.status_code", response.status_code)
                 return response
-        except Exception:
+        except Exception as e:
             main.logger.error(
-                f'User service cannot be accessed for {app_settings.USER_SERVICE_URL}{path}'
+                f'User service cannot be accessed for {app_settings.USER_SERVICE_URL}{path} with error: {e}'
             )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='User service cannot be accessed',
             )
 
+
+class ServiceTrainers:
     @staticmethod
-    async def post(path, json, headers):
+    async def get(path, headers):
+        # La respuesta depende del token (rutas /me): va en la clave
+        key = (path, tuple(sorted(headers.items())))
+        return await training_cache.get(
+            key, lambda: ServiceTrainers.fetch(path, headers)
+        )
+
+    @staticmethod
+    async def fetch(path, headers):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{app_settings.USER_SERVICE_URL}{path}",
-                    json=json,
-                    headers=headers,
-                )
+            url = f"{app_settings.TRAINING_SERVICE_URL}{path}"
+            with client_span("training-service", "GET", url) as span:
+                async with http_client() as client:
+                    response = await client.get(url, headers=inject_headers(headers))
+                span.set_attribute("http.status_code", response.status_code)
                 return response
-        except Exception as e:
+        except Exception:
             main.logger.error(
-                f'User service cannot be accessed for {app_settings.USER_SERVICE_URL}{path} with error: {e}'
+                f'Training service cannot be accessed for {app_settings.TRAINING_SERVICE_URL}{path}'
             )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail='User service cannot be accessed',
+                detail='Training service cannot be accessed',
             )
 
-
-class ServiceTrainers:
     @staticmethod
     async def patch(path, json, headers):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.patch(
-                    f"{app_settings.TRAINING_SERVICE_URL}{path}",
-                    json=json,
-                    headers=headers,
-                )
+            url = f"{app_settings.TRAINING_SERVICE_URL}{path}"
+            with client_span("training-service", "PATCH", url) as span:
+                async with http_client() as client:
+                    response = await client.patch(
+                        url, json=json, headers=inject_headers(headers)
+                    )
+                span.set_attribute("http.status_code", response.status_code)
+                return response
+        except Exception:
+            main.logger.error(
+                f'Training service cannot be accessed for {app_settings.TRAINING_SERVICE_URL}{path}'
+            )
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Training service cannot be accessed',
+            )
+
+    @staticmethod
+    async def post(path, json, headers):
+        try:
+            url = f"{app_settings.TRAINING_SERVICE_URL}{path}"
+            with client_span("training-service", "POST", url) as span:
+                async with http_client() as client:
+                    response = await client.post(
+                        url, json=json, headers=inject_headers(headers)
+                    )
+                span.set_attribute("http.status_code", response.status_code)
                 return response
         except Exception:
             main.logger.error(
@@ -101,3 +154,17 @@ class NotificationService:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Error in system notification',
             )
+
+    async def send_reminders(reminders):
+        response = await ServiceUsers.post(
+            '/notifications/goal/reminders/send',
+            json={"reminders": reminders},
+            headers={},
+        )
+
+        if response.status_code != 200:
+            main.logger.error(f'Error sending {len(reminders)} goal reminders')
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Error in system notification',
+            )
@@ -0,0 +1,340 @@
+import json
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+from app.config.config import logger
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+def get_current_span():
+    return _current_span.get()
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "kind",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "sampled",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "status",
+        "_processor",
+    )
+
+    def __init__(self, name, kind, trace_id, parent_id, sampled, processor):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = 0
+        self._processor = processor
+
+    @property
+    def is_recording(self):
+        return self.sampled and self._processor is not None
+
+    def set_attribute(self, key, value):
+        if self.is_recording:
+            self.attributes[key] = value
+
+    def set_error(self, error):
+        if self.is_recording:
+            self.status = 2
+            self.attributes["error.type"] = type(error).__name__
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.is_recording:
+            self._processor.on_end(self)
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-{"01" if self.sampled else "00"}'
+
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id, sampled) or None if invalid."""
+    match = TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+class Tracer:
+    """Minimal W3C-compatible tracer with head-based ratio sampling."""
+
+    def __init__(self, processor=None, sample_ratio=1.0):
+        self.processor = None
+        self.configure(processor, sample_ratio)
+
+    def configure(self, processor, sample_ratio):
+        if self.processor is not None and self.processor is not processor:
+            self.processor.shutdown()
+        self.processor = processor
+        self.sample_ratio = sample_ratio
+        self._bound = int(max(0.0, min(1.0, sample_ratio)) * (2**64 - 1))
+
+    def _should_sample(self, trace_id):
+        # Igual que TraceIdRatioBased: la decision depende solo del trace id
+        return int(trace_id[16:], 16) <= self._bound if self._bound else False
+
+    def start_span(self, name, kind=SPAN_KIND_INTERNAL, traceparent=None):
+        parent = _current_span.get()
+        remote = parse_traceparent(traceparent) if traceparent else None
+        if remote:
+            trace_id, parent_id, sampled = remote
+        elif parent is not None:
+            trace_id, parent_id, sampled = (
+                parent.trace_id,
+                parent.span_id,
+                parent.sampled,
+            )
+        else:
+            trace_id = f'{random.getrandbits(128):032x}'
+            parent_id, sampled = None, self._should_sample(trace_id)
+        return Span(name, kind, trace_id, parent_id, sampled, self.processor)
+
+    @contextmanager
+    def start_as_current_span(self, name, kind=SPAN_KIND_INTERNAL, traceparent=None):
+        span = self.start_span(name, kind, traceparent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def shutdown(self):
+        if self.processor is not None:
+            self.processor.shutdown()
+
+
+def to_otlp(spans, service_name="goals-microservice"):
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [attribute("service.name", service_name)]},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "app.services.tracing"},
+                        "spans": [
+                            {
+                                "traceId": span.trace_id,
+                                "spanId": span.span_id,
+                                "parentSpanId": span.parent_id or "",
+                                "name": span.name,
+                                "kind": span.kind,
+                                "startTimeUnixNano": str(span.start_ns),
+                                "endTimeUnixNano": str(span.end_ns),
+                                "attributes": [
+                                    attribute(k, v) for k, v in span.attributes.items()
+                                ],
+                                "status": {"code": span.status},
+                            }
+                            for span in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class FileSpanExporter:
+    """Appends one OTLP/JSON payload per exported batch to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(to_otlp(spans)) + "\n")
+
+
+class OTLPHttpSpanExporter:
+    def __init__(self, endpoint, timeout=5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, spans):
+        import httpx
+
+        try:
+            httpx.post(self.url, json=to_otlp(spans), timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f'Could not export {len(spans)} spans to {self.url}: {e}')
+
+
+class SimpleSpanProcessor:
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def on_end(self, span):
+        self.exporter.export([span])
+
+    def force_flush(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class BatchSpanProcessor:
+    """Exports finished spans from a background thread, off the request path."""
+
+    def __init__(self, exporter, max_batch=512, delay=2.0, max_queue=4096):
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.delay = delay
+        self._queue = queue.Queue(max_queue)
+        self._flush = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def on_end(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # Se descartan spans antes que bloquear el request
+        if self._queue.qsize() >= self.max_batch:
+            self._flush.set()
+
+    def _drain(self):
+        spans = []
+        while len(spans) < self.max_batch:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _run(self):
+        while not self._stopped:
+            self._flush.wait(self.delay)
+            self._flush.clear()
+            self._export_pending()
+
+    def _export_pending(self):
+        while spans := self._drain():
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                logger.warning(f'Span export failed: {e}')
+
+    def force_flush(self):
+        self._export_pending()
+
+    def shutdown(self):
+        self._stopped = True
+        self._flush.set()
+        self._thread.join(timeout=self.delay + 1)
+        self._export_pending()
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Creates a child span of the active span for every Mongo command."""
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        if _current_span.get() is None:
+            return
+        span = tracer.start_span(f'mongodb.{event.command_name}', SPAN_KIND_CLIENT)
+        if span.is_recording:
+            span.set_attribute("db.system", "mongodb")
+            span.set_attribute("db.name", event.database_name)
+            span.set_attribute("db.operation", event.command_name)
+            collection = event.command.get(event.command_name)
+            if isinstance(collection, str):
+                span.set_attribute("db.mongodb.collection", collection)
+            self._spans[(event.connection_id, event.request_id)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.status = 2
+            span.set_attribute("error.type", event.failure.get("codeName", "error"))
+            span.end()
+
+
+tracer = Tracer()
+
+
+def build_exporter(settings):
+    if settings.TRACING_EXPORTER == "file":
+        return FileSpanExporter(settings.TRACING_FILE_PATH)
+    if settings.TRACING_EXPORTER == "otlp":
+        return OTLPHttpSpanExporter(settings.TRACING_OTLP_ENDPOINT)
+    if settings.TRACING_EXPORTER == "none":
+        return None
+    raise ValueError(f'Unknown tracing exporter: {settings.TRACING_EXPORTER}')
+
+
+def configure_tracing(settings):
+    exporter = build_exporter(settings)
+    processor = BatchSpanProcessor(exporter) if exporter else None
+    tracer.configure(processor, settings.TRACING_SAMPLE_RATIO)
+    return tracer
+
+
+def inject_headers(headers):
+    """Add the W3C traceparent of the active span to outgoing headers."""
+    span = _current_span.get()
+    if span is None:
+        return headers
+    return {**headers, "traceparent": span.traceparent}
+
+
+@contextmanager
+def client_span(service, method, url):
+    with tracer.start_as_current_span(
+        f'{service} {method}', kind=SPAN_KIND_CLIENT
+    ) as span:
+        span.set_attribute("http.method", method)
+        span.set_attribute("http.url", url)
+        span.set_attribute("peer.service", service)
+        yield span
@@ -0,0 +1,268 @@
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+from starlette import status
+
+from app.auth.auth_utils import generate_token_with_role
+from app.config.config import logger, get_settings
+from app.models.goal import UserRoles
+from app.services.metrics import metrics
+
+app_settings = get_settings()
+
+COMPLETIONS_PATH = "/athletes/trainings/complete/batch"
+DEAD_LETTERS_COLLECTION = "training_completions_dead"
+SERVICE_ID = "goals-microservice"
+RETRY_STATUS = (status.HTTP_408_REQUEST_TIMEOUT, status.HTTP_429_TOO_MANY_REQUESTS)
+
+dead_completions = metrics.counter(
+    "training_completions_dead_total",
+    "Training completions rejected by the training service, by status",
+)
+dropped_completions = metrics.counter(
+    "training_completions_dropped_total",
+    "Training completions dropped because the queue was full",
+)
+
+
+def completion_id(goal_id, training_id):
+    # Una meta se completa una sola vez: el id es el mismo en cada reintento
+    return f'{goal_id}:{training_id}'
+
+
+def is_retryable(status_code):
+    return status_code in RETRY_STATUS or status_code >= 500
+
+
+def service_headers():
+    # Credencial del servicio y no el token del atleta, que puede vencer
+    # mientras la completitud espera en la cola
+    token = app_settings.TRAINING_SERVICE_TOKEN or generate_token_with_role(
+        SERVICE_ID, UserRoles.ADMIN
+    )
+    return {"authorization": f'Bearer {token}'}
+
+
+async def post_completions(completions):
+    # Import diferido: services importa app.main, que importa las rutas
+    from app.services.services import ServiceTrainers
+
+    return await ServiceTrainers.post(
+        COMPLETIONS_PATH,
+        json={"completions": completions},
+        headers=service_headers(),
+    )
+
+
+async def patch_completion(completion):
+    from app.services.services import ServiceTrainers
+
+    return await ServiceTrainers.patch(
+        f'/athletes/{completion["athlete_id"]}/trainings/'
+        f'{completion["training_id"]}/complete',
+        json={"id": completion["id"], "completed_at": completion["completed_at"]},
+        headers=service_headers(),
+    )
+
+
+class TrainingCompletions:
+    """Completions of training-linked goals, reported in batches.
+
+    `add` only appends to an in-memory queue; a background task posts it
+    to the batch endpoint of the training service every `interval` seconds,
+    or as soon as `batch_size` completions are waiting, with the service
+    credential. When the training service has no batch endpoint (404/405)
+    each completion is sent with the per-athlete PATCH instead.
+
+    Only network errors, 408, 429 and 5xx are retried, with backoff: the
+    completion stays queued and later completions of the same training
+    wait behind it, so they arrive in order. Any other 4xx is permanent:
+    the completion is logged, counted and moved to the
+    `training_completions_dead` collection, and the queue goes on. Each
+    completion carries an id derived from its goal that the training
+    service can use to ignore the ones already applied. The queue is lost
+    if the process dies before it is flushed.
+    """
+
+    def __init__(self, batch_size=100, max_buffer=10000, max_backoff=60):
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.max_backoff = max_backoff
+        self.queue = []
+        self.failures = 0
+        self.dropped = 0
+        self.batch_supported = True
+        self._wakeup = None
+
+    def add(self, user_id, training_id, goal_id, completed_at):
+        if len(self.queue) >= self.max_buffer:
+            self.dropped += 1
+            dropped_completions.inc()
+            return
+        self.queue.append(
+            {
+                "id": completion_id(goal_id, training_id),
+                "athlete_id": str(user_id),
+                "training_id": str(training_id),
+                "goal_id": str(goal_id),
+                "completed_at": completed_at.isoformat(),
+            }
+        )
+        if len(self.queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def send_each(self, batch, send_one):
+        """Send a batch one completion at a time.
+
+        Returns (unsent, rejected): the completions to retry and the
+        (completion, status) pairs rejected for good.
+        """
+        rejected = []
+        for index, completion in enumerate(batch):
+            try:
+                response = await send_one(completion)
+            except Exception as e:
+                logger.error(
+                    f'Could not send training completion {completion["id"]}: {e}'
+                )
+                return batch[index:], rejected
+            if response.status_code < status.HTTP_400_BAD_REQUEST:
+                continue
+            if is_retryable(response.status_code):
+                logger.warning(
+                    f'Training service answered {response.status_code} to '
+                    f'completion {completion["id"]}, retrying'
+                )
+                return batch[index:], rejected
+            rejected.append((completion, response.status_code))
+        return [], rejected
+
+    async def send_batch(self, batch, send, send_one):
+        """Send one batch; return (unsent, rejected) like `send_each`."""
+        if not self.batch_supported:
+            return await self.send_each(batch, send_one)
+        try:
+            response = await send(batch)
+        except Exception as e:
+            logger.error(f'Could not send {len(batch)} training completions: {e}')
+            return batch, []
+
+        if response.status_code in (
+            status.HTTP_404_NOT_FOUND,
+            status.HTTP_405_METHOD_NOT_ALLOWED,
+        ):
+            logger.warning(
+                f'Training service has no batch endpoint ({response.status_code}), '
+                'sending completions one by one'
+            )
+            self.batch_supported = False
+            return await self.send_each(batch, send_one)
+        if response.status_code < status.HTTP_400_BAD_REQUEST:
+            return [], []
+        if is_retryable(response.status_code):
+            logger.warning(
+                f'Training service answered {response.status_code} to '
+                f'{len(batch)} completions, retrying'
+            )
+            return batch, []
+        # Rechazo permanente: uno por uno, asi solo las invalidas van a dead letters
+        logger.warning(
+            f'Training service rejected a batch of {len(batch)} completions '
+            f'({response.status_code}), sending them one by one'
+        )
+        return await self.send_each(batch, send_one)
+
+    async def dead_letter(self, rejected, database):
+        for completion, status_code in rejected:
+            dead_completions.inc(status=str(status_code))
+            logger.error(
+                f'Training service rejected completion {completion["id"]} '
+                f'({status_code}), moved to {DEAD_LETTERS_COLLECTION}: {completion}'
+            )
+        if not rejected or database is None:
+            return
+        failed_at = datetime.now(timezone.utc)
+        writes = [
+            ReplaceOne(
+                {"_id": completion["id"]},
+                {**completion, "status": status_code, "failed_at": failed_at},
+                upsert=True,
+            )
+            for completion, status_code in rejected
+        ]
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, database[DEAD_LETTERS_COLLECTION].bulk_write, writes
+            )
+        except Exception as e:
+            logger.error(
+                f'Could not store {len(writes)} dead training completions: {e}'
+            )
+
+    async def flush(
+        self, send=post_completions, send_one=patch_completion, database=None
+    ):
+        """Send the queued completions; return the number delivered."""
+        queue, self.queue = self.queue, []
+        kept, blocked, sent = [], set(), 0
+
+        def batches():
+            batch = []
+            for completion in queue:
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+                if completion["training_id"] in blocked:
+                    # Espera detras de una completitud anterior que fallo
+                    kept.append(completion)
+                    continue
+                batch.append(completion)
+            if batch:
+                yield batch
+
+        for batch in batches():
+            unsent, rejected = await self.send_batch(batch, send, send_one)
+            sent += len(batch) - len(unsent) - len(rejected)
+            kept.extend(unsent)
+            blocked.update(completion["training_id"] for completion in unsent)
+            await self.dead_letter(rejected, database)
+
+        # Lo que llego mientras se enviaba va despues de lo que quedo pendiente
+        self.queue = kept + self.queue
+        self.failures = self.failures + 1 if blocked else 0
+        return sent
+
+    def delay(self, interval):
+        if not self.failures:
+            return interval
+        return min(interval * 2**self.failures, self.max_backoff)
+
+    async def run(
+        self,
+        interval,
+        get_database=None,
+        send=post_completions,
+        send_one=patch_completion,
+    ):
+        self._wakeup = asyncio.Event()
+        while True:
+            if self.failures:
+                await asyncio.sleep(self.delay(interval))
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            database = get_database() if get_database is not None else None
+            await self.flush(send, send_one, database)
+            if self.dropped:
+                logger.warning(f'Dropped {self.dropped} training completions')
+                self.dropped = 0
+
+
+training_completions = TrainingCompletions(
+    batch_size=app_settings.TRAINING_COMPLETIONS_BATCH_SIZE,
+    max_buffer=app_settings.TRAINING_COMPLETIONS_MAX_BUFFER,
+)
@@ -0,0 +1,137 @@
+"""Startup budget: import time per module and time to the first served request.
+
+    $ python -m benchmarks.bench_cold_start --runs 5 --budget-ms 600
+    $ BENCH_MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.bench_cold_start --serve
+
+Every run imports `--module` in a fresh interpreter with `-X importtime`
+and the median of the runs is reported per module, like `importtime`:
+`self` is the module alone, `cumulative` includes what it imports. The
+slowest modules by cumulative time are listed; with `--budget-ms` the
+exit status is 1 when the total import time is over budget.
+
+`--serve` also starts uvicorn with `app.main:app` and times from the
+process start until the first response to `--path`, startup included
+(indexes are created on `BENCH_MONGODB_URI`).
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+IMPORTTIME_PREFIX = "import time:"
+
+
+def parse_importtime(output):
+    """(module, self_us, cumulative_us, depth) for each line of `-X importtime`."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        self_us, cumulative_us, name = line[len(IMPORTTIME_PREFIX) :].split("|")
+        if not self_us.strip().isdigit():
+            # Linea de encabezado
+            continue
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((module, int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def import_times(module, runs=5):
+    """Median self and cumulative import time of every module, in microseconds."""
+    samples = defaultdict(list)
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f'import {module}'],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for name, self_us, cumulative_us, _ in parse_importtime(result.stderr):
+            samples[name].append((self_us, cumulative_us))
+    return {
+        name: (
+            statistics.median(self_us for self_us, _ in values),
+            statistics.median(cumulative_us for _, cumulative_us in values),
+        )
+        for name, values in samples.items()
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(path, env, timeout=60):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}{path}'
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'uvicorn exited with {process.returncode}')
+            try:
+                with urlopen(url, timeout=timeout) as response:
+                    response.read()
+                return time.perf_counter() - start
+            except HTTPError:
+                # Un error tambien es una respuesta servida
+                return time.perf_counter() - start
+            except OSError:
+                if time.perf_counter() - start > timeout:
+                    raise
+                time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--module", default="app.main")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--top", type=int, default=25)
+    arg_parser.add_argument("--budget-ms", type=float, default=None)
+    arg_parser.add_argument("--serve", action="store_true")
+    arg_parser.add_argument("--path", default="/metrics")
+    args = arg_parser.parse_args()
+
+    times = import_times(args.module, args.runs)
+    print(f'{"self [ms]":>10} | {"cumulative [ms]":>15} | module')
+    slowest = sorted(times.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f'{self_us / 1000:>10.1f} | {cumulative_us / 1000:>15.1f} | {name}')
+    total_ms = times[args.module][1] / 1000
+    print(f'import {args.module}: {total_ms:.1f} ms (median of {args.runs})')
+
+    if args.serve:
+        env = dict(os.environ)
+        env["MONGODB_URI"] = env.get("BENCH_MONGODB_URI", "mongodb://localhost:27017")
+        elapsed = [time_to_first_request(args.path, env) for _ in range(args.runs)]
+        print(
+            f'first request to {args.path}: '
+            f'{statistics.median(elapsed) * 1000:.0f} ms (median of {args.runs})'
+        )
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f'Over budget: {total_ms:.1f} ms > {args.budget_ms:.1f} ms')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Time and memory of the create_goal pipeline, without the database.
+
+    $ python -m benchmarks.bench_create_goal --creates 20000
+
+Both pipelines start from the GoalCreate parsed by FastAPI and end with the
+JSON-ready response body. `legacy` is the baseline path: Goal object,
+jsonable_encoder to a dict for Mongo, the dates formatted by it parsed
+back with dateutil, a separate GoalResponse and FastAPI's serialization
+of it. `compact` is Goal.to_document() plus goal_response_content() over
+the same dict. Both check the limit against the current time.
+"""
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import dateutil.parser as parser
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.models.goal import (
+    Goal,
+    GoalCreate,
+    GoalResponse,
+    GoalTypes,
+    State,
+    goal_response_content,
+)
+
+
+def build_payload():
+    return GoalCreate(
+        title="Benchmark goal",
+        description="Walk a lot",
+        quantity_steps=1500,
+        metric=GoalTypes.KILOMETERS.value,
+        training_id="6480f1e7e5a1c0a1b2c3d4e5",
+        limit_time=datetime.now(timezone.utc) + timedelta(days=30),
+    )
+
+
+def new_goal(goal, user_id, time_now):
+    new_goal = Goal(
+        user_id=user_id,
+        title=goal.title,
+        description=goal.description,
+        metric=goal.metric,
+        limit=goal.limit_time,
+        state=goal.state,
+        quantity_steps=goal.quantity_steps,
+    )
+    if goal.training_id is not None:
+        new_goal.training_id = goal.training_id
+        new_goal.state = State.INIT.value
+        new_goal.date_init = time_now
+    return new_goal
+
+
+def legacy(goal, user_id, time_now):
+    goal_obj = new_goal(goal, user_id, time_now)
+    # Goal ya no tiene __dict__: esto es lo que jsonable_encoder leia con vars()
+    res_json = jsonable_encoder(
+        {slot: getattr(goal_obj, slot) for slot in Goal.__slots__}
+    )
+    # El ida y vuelta por string de dateutil del create_goal original
+    if res_json["limit"] is not None:
+        res_json["limit"] = parser.parse(res_json["limit"]).replace(tzinfo=timezone.utc)
+        if res_json["limit"] < time_now:
+            return None
+    if res_json["date_init"]:
+        res_json["date_init"] = parser.parse(res_json["date_init"]).replace(
+            tzinfo=timezone.utc
+        )
+    res_json["_id"] = ObjectId()
+    response = GoalResponse(
+        id=str(res_json["_id"]),
+        user_id=goal_obj.user_id,
+        training_id=goal_obj.training_id,
+        title=goal_obj.title,
+        description=goal_obj.description,
+        metric=goal_obj.metric,
+        limit_time=goal_obj.limit,
+        date_init=goal_obj.date_init,
+        date_complete=None,
+        state=goal_obj.state,
+        quantity_steps=goal_obj.quantity_steps,
+        progress_steps=goal_obj.progress_steps,
+    )
+    # Lo que hace FastAPI con el response_model
+    return jsonable_encoder(GoalResponse.validate(response))
+
+
+def compact(goal, user_id, time_now):
+    doc = new_goal(goal, user_id, time_now).to_document()
+    if doc["limit"] is not None and doc["limit"] < time_now:
+        return None
+    doc["_id"] = ObjectId()
+    return goal_response_content(doc)
+
+
+def measure(pipeline, goal, creates):
+    user_id, time_now = str(ObjectId()), datetime.now(timezone.utc)
+
+    start = time.perf_counter()
+    for _ in range(creates):
+        pipeline(goal, user_id, time_now)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    pipeline(goal, user_id, time_now)
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return {"us_per_create": elapsed / creates * 1e6, "peak_bytes": peak}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--creates", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    goal = build_payload()
+    for pipeline in (legacy, compact):
+        measure(pipeline, goal, 100)  # calentamiento
+        result = measure(pipeline, goal, args.creates)
+        print(
+            f'{pipeline.__name__:8} {result["us_per_create"]:8.1f} us/create'
+            f'  {result["peak_bytes"]:7d} bytes peak'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Progress sync and goal listing: document layout vs bucket layout.
+
+Needs a real mongod (array filters are not supported by mongomock):
+
+    $ BENCH_MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.bench_goal_layout
+
+Both layouts are loaded with the same goals and then receive the same
+sequence of progress syncs for random users.
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from os import environ
+
+import pymongo
+
+from app.models.goal import GoalTypes, State
+from app.repositories.goals import BucketGoalRepository, DocumentGoalRepository
+
+METRICS = [metric.value for metric in GoalTypes]
+
+
+def build_goals(users, goals_per_user, seed):
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    for user in users:
+        for index in range(goals_per_user):
+            yield {
+                "user_id": user,
+                "title": f'Goal {index}',
+                "description": "Benchmark goal",
+                "metric": rnd.choice(METRICS),
+                "quantity_steps": 10**9,
+                "progress_steps": 0,
+                "training_id": None,
+                "state": rnd.choice([State.INIT.value, State.NOT_INIT.value]),
+                "limit": now + timedelta(days=rnd.randint(-5, 60)),
+                "date_init": now,
+            }
+
+
+def timed(operation, calls):
+    samples = []
+    for args in calls:
+        start = time.perf_counter()
+        operation(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p99_ms": samples[int(len(samples) * 0.99) - 1],
+    }
+
+
+def run(database, repository_class, users, goals_per_user, syncs, seed):
+    collection = database[repository_class.collection_name]
+    collection.drop()
+    repository_class.create_indexes(database)
+    repository = repository_class(collection)
+    for goal in build_goals(users, goals_per_user, seed):
+        repository.insert(goal)
+
+    rnd = random.Random(seed)
+    increments = {metric: 10 for metric in METRICS}
+    sync_calls = [
+        (rnd.choice(users), increments, datetime.now(timezone.utc))
+        for _ in range(syncs)
+    ]
+    list_calls = [(rnd.choice(users),) for _ in range(syncs)]
+    return {
+        "progress_sync": timed(repository.apply_progress, sync_calls),
+        "list_goals": timed(
+            lambda user: list(repository.find_by_user(user)), list_calls
+        ),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--users", type=int, default=200)
+    arg_parser.add_argument("--goals-per-user", type=int, default=50)
+    arg_parser.add_argument("--syncs", type=int, default=500)
+    arg_parser.add_argument("--seed", type=int, default=7)
+    args = arg_parser.parse_args()
+
+    client = pymongo.MongoClient(
+        environ.get("BENCH_MONGODB_URI", "mongodb://localhost:27017")
+    )
+    database = client["goals_benchmark"]
+    users = [f'user-{index}' for index in range(args.users)]
+
+    for repository_class in (DocumentGoalRepository, BucketGoalRepository):
+        results = run(
+            database,
+            repository_class,
+            users,
+            args.goals_per_user,
+            args.syncs,
+            args.seed,
+        )
+        for operation, result in results.items():
+            print(
+                f'{repository_class.collection_name:14} {operation:14} '
+                + " ".join(f'{key}={value:.3f}' for key, value in result.items())
+            )
+
+
+if __name__ == "__main__":
+    main()
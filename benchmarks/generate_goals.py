@@ -0,0 +1,209 @@
+"""Bulk-load a synthetic, reproducible goals dataset for scale testing.
+
+    $ BENCH_MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.generate_goals \\
+        --users 100000 --goals 5000000 --seed 1 --now 2023-06-01
+
+Goals per user follow a Zipf distribution (`--skew`), so a few users own
+most goals. Metrics, states and training-linked goals are mixed, and
+`limit` dates are spread around `--now`, with the state consistent with
+the limit. Every user is generated from its own random stream derived
+from `--seed`, so the same arguments always produce the same documents,
+whatever the number of `--workers` writing them in parallel. The goals go
+through the repository of `--mode`, in chunked `insert_many` calls.
+
+Goal stats are not generated: run `reconcile_goal_stats --fix` after.
+"""
+
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from os import environ
+
+import pymongo
+from bson import ObjectId
+
+from app.config.database import DATABASE_NAME
+from app.models.goal import GoalTypes, State
+from app.repositories.goals import DOCUMENT_MODE, get_goal_repository_class
+
+METRICS = {
+    GoalTypes.STEPS.value: (0.5, 1000, 20000),
+    GoalTypes.KILOMETERS.value: (0.3, 1, 100),
+    GoalTypes.CALORIES.value: (0.2, 100, 5000),
+}
+# Estados de las metas con limite por venir y de las vencidas
+FUTURE_STATES = {
+    State.NOT_INIT.value: 0.3,
+    State.INIT.value: 0.5,
+    State.STOP.value: 0.1,
+    State.COMPLETE.value: 0.1,
+}
+PAST_STATES = {
+    State.EXPIRED.value: 0.6,
+    State.COMPLETE.value: 0.3,
+    State.STOP.value: 0.1,
+}
+
+
+def object_id(rnd, when):
+    """An ObjectId created at `when`, with its other bytes taken from `rnd`."""
+    return ObjectId(
+        int(when.timestamp()).to_bytes(4, "big")
+        + rnd.getrandbits(64).to_bytes(8, "big")
+    )
+
+
+def goal_counts(users, goals, skew):
+    """Split `goals` among `users` with Zipf weights, largest remainder first."""
+    weights = [1 / rank**skew for rank in range(1, users + 1)]
+    total = sum(weights)
+    shares = [goals * weight / total for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(
+        range(users), key=lambda index: shares[index] - counts[index], reverse=True
+    )
+    for index in by_remainder[: goals - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+
+def choose(rnd, weights):
+    return rnd.choices(list(weights), list(weights.values()))[0]
+
+
+def build_user(seed, index, count, trainings, training_ratio, now):
+    rnd = random.Random(f'{seed}:{index}')
+    user_id = str(object_id(rnd, now - timedelta(days=rnd.uniform(30, 730))))
+    goals = []
+    for number in range(count):
+        created = now - timedelta(days=rnd.uniform(0, 365))
+        limit = now + timedelta(days=rnd.uniform(-90, 90))
+        metric = choose(rnd, {metric: spec[0] for metric, spec in METRICS.items()})
+        _, low, high = METRICS[metric]
+        quantity = rnd.randint(low, high)
+        training_id = (
+            rnd.choice(trainings)
+            if trainings and rnd.random() < training_ratio
+            else None
+        )
+        state = choose(rnd, FUTURE_STATES if limit > now else PAST_STATES)
+
+        goal = {
+            "_id": object_id(rnd, min(created, limit)),
+            "user_id": user_id,
+            "training_id": training_id,
+            "title": f'Goal {number}',
+            "description": "Synthetic goal",
+            "metric": metric,
+            "quantity_steps": quantity,
+            "progress_steps": 0,
+            "state": state,
+            "limit": limit,
+            "date_init": None,
+            "date_complete": None,
+            "date_stop": None,
+        }
+        if state != State.NOT_INIT.value:
+            started = min(created + timedelta(days=rnd.uniform(0, 7)), limit, now)
+            goal["date_init"] = started
+            goal["progress_steps"] = rnd.uniform(0, 0.95) * quantity
+        if state == State.COMPLETE.value:
+            goal["progress_steps"] = quantity
+            goal["date_complete"] = started + (min(limit, now) - started) * rnd.random()
+        elif state == State.STOP.value:
+            goal["date_stop"] = started + (min(limit, now) - started) * rnd.random()
+        goals.append(goal)
+    return goals
+
+
+def generate_goals(
+    database,
+    users,
+    goals,
+    seed=0,
+    skew=1.1,
+    trainings=1000,
+    training_ratio=0.3,
+    workers=4,
+    chunk_size=1000,
+    mode=DOCUMENT_MODE,
+    now=None,
+):
+    """Insert the dataset and return the number of goals written."""
+    now = now or datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    repository_class = get_goal_repository_class(mode)
+    repository_class.create_indexes(database)
+    repository = repository_class(database[repository_class.collection_name])
+
+    rnd = random.Random(seed)
+    training_ids = [str(object_id(rnd, now)) for _ in range(trainings)]
+    counts = goal_counts(users, goals, skew)
+    # Los usuarios con mas metas no quedan todos en el mismo lote
+    order = list(range(users))
+    rnd.shuffle(order)
+
+    def load(indexes):
+        batch, written = [], 0
+        for index in indexes:
+            batch.extend(
+                build_user(
+                    seed, index, counts[index], training_ids, training_ratio, now
+                )
+            )
+            if len(batch) >= chunk_size:
+                written += len(batch) - len(repository.insert_many(batch, chunk_size))
+                batch = []
+        if batch:
+            written += len(batch) - len(repository.insert_many(batch, chunk_size))
+        return written
+
+    slices = [order[start::workers] for start in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(load, slices))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--users", type=int, default=10000)
+    arg_parser.add_argument("--goals", type=int, default=500000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--skew", type=float, default=1.1)
+    arg_parser.add_argument("--trainings", type=int, default=1000)
+    arg_parser.add_argument("--training-ratio", type=float, default=0.3)
+    arg_parser.add_argument("--workers", type=int, default=4)
+    arg_parser.add_argument("--chunk-size", type=int, default=1000)
+    arg_parser.add_argument("--mode", default=DOCUMENT_MODE)
+    arg_parser.add_argument("--now", type=datetime.fromisoformat, default=None)
+    arg_parser.add_argument("--drop", action="store_true")
+    args = arg_parser.parse_args()
+
+    uri = environ.get("BENCH_MONGODB_URI", "mongodb://localhost:27017")
+    database = pymongo.MongoClient(uri, tz_aware=True)[DATABASE_NAME]
+    if args.drop:
+        database.drop_collection(get_goal_repository_class(args.mode).collection_name)
+
+    now = args.now.replace(tzinfo=args.now.tzinfo or timezone.utc) if args.now else None
+    start = time.perf_counter()
+    written = generate_goals(
+        database,
+        args.users,
+        args.goals,
+        args.seed,
+        args.skew,
+        args.trainings,
+        args.training_ratio,
+        args.workers,
+        args.chunk_size,
+        args.mode,
+        now,
+    )
+    elapsed = time.perf_counter() - start
+    print(f'{written} goals in {elapsed:.1f}s ({written / elapsed:,.0f} goals/s)')
+
+
+if __name__ == "__main__":
+    main()
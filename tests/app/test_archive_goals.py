@@ -0,0 +1,62 @@
+import mongomock
+import pytest
+
+from datetime import datetime, timedelta, timezone
+from app.auth.auth_utils import generate_token_with_role
+from app.jobs.archive_goals import archive_goals
+from app.models.goal import State, UserRoles
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+now = datetime.now(timezone.utc)
+old_complete_id = ObjectId()
+old_stop_id = ObjectId.from_datetime(now - timedelta(days=200))
+recent_complete_id = ObjectId()
+started_id = ObjectId()
+
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    db.goals.insert_many([
+        {"_id": old_complete_id, "user_id": athlete_id_example_mock_1, "title": "Old complete",
+         "state": State.COMPLETE.value, "date_complete": now - timedelta(days=100)},
+        {"_id": old_stop_id, "user_id": athlete_id_example_mock_1, "title": "Old stop",
+         "state": State.STOP.value},
+        {"_id": recent_complete_id, "user_id": athlete_id_example_mock_1, "title": "Recent complete",
+         "state": State.COMPLETE.value, "date_complete": now - timedelta(days=1)},
+        {"_id": started_id, "user_id": athlete_id_example_mock_1, "title": "Started",
+         "state": State.INIT.value, "limit": now - timedelta(days=100)},
+    ])
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    return db
+
+
+def test_archive_moves_only_old_terminal_goals(mongo_mock):
+    assert archive_goals(mongo_mock, timedelta(days=90), batch_size=1, now=now) == 2
+    assert {goal["_id"] for goal in mongo_mock.goals.find()} == {recent_complete_id, started_id}
+    assert {goal["_id"] for goal in mongo_mock.goals_archive.find()} == {old_complete_id, old_stop_id}
+    assert archive_goals(mongo_mock, timedelta(days=90), now=now) == 0
+
+
+def test_read_endpoints_include_archived_goals_only_when_asked(mongo_mock):
+    archive_goals(mongo_mock, timedelta(days=90), now=now)
+
+    response = client.get("/athletes/me/goals/", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert len(response.json()) == 2
+    response = client.get("/athletes/me/goals/?include_archived=true&fields=id,title",
+                          headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert len(response.json()) == 4
+
+    response = client.get(f"/athletes/me/goals/{old_complete_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 404
+    response = client.get(f"/athletes/me/goals/{old_complete_id}?include_archived=true",
+                          headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Old complete"
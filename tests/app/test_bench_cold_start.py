@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import app.main
+import app.repositories.goals as goal_repositories
+from app.config.config import get_settings
+from benchmarks.bench_cold_start import import_times, parse_importtime
+
+OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     _json
+import time:       900 |       1020 |   json.decoder
+import time:       300 |       1320 | json
+"""
+
+
+def test_parse_importtime_reads_self_cumulative_and_depth():
+    assert parse_importtime(OUTPUT) == [
+        ("_json", 120, 120, 2),
+        ("json.decoder", 900, 1020, 1),
+        ("json", 300, 1320, 0),
+    ]
+
+
+def test_import_times_runs_a_fresh_interpreter():
+    times = import_times("json", runs=1)
+    self_us, cumulative_us = times["json"]
+    assert 0 < self_us <= cumulative_us
+
+
+def test_settings_are_loaded_once():
+    assert app.main.app_settings is get_settings()
+    assert goal_repositories.app_settings is get_settings()
+
+
+def test_httpx_is_not_imported_at_startup():
+    code = "import sys, app.main; print('httpx' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
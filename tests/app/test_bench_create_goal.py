@@ -0,0 +1,11 @@
+from datetime import datetime, timezone
+
+from benchmarks.bench_create_goal import build_payload, compact, legacy
+
+
+def test_both_pipelines_build_the_same_response():
+    goal, time_now = build_payload(), datetime.now(timezone.utc)
+    legacy_response = legacy(goal, "user", time_now)
+    compact_response = compact(goal, "user", time_now)
+    assert legacy_response.pop("id") != compact_response.pop("id")
+    assert legacy_response == compact_response
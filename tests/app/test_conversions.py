@@ -0,0 +1,106 @@
+import mongomock
+import pytest
+
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import Calibration, GoalTypes, State, UserRoles
+from app.services.conversions import ConversionRegistry, conversions
+from app.services.progress_history import progress_history
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+
+calibration = Calibration(stride_length_m=0.8, weight_kg=84)
+
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    monkeypatch.setattr(progress_history, "buffer", [])
+    return db
+
+
+@pytest.fixture(params=["python", "numpy"])
+def vectorized(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr("app.services.conversions.load_numpy", lambda: None)
+
+
+def auth_headers():
+    user_id = str(ObjectId())
+    return user_id, {"Authorization": f"Bearer {generate_token_with_role(user_id, UserRoles.ATLETA)}"}
+
+
+def test_default_calibration_keeps_the_previous_factors():
+    assert conversions.convert(GoalTypes.KILOMETERS.value, 1210) == 1210 * 0.76 / 1000
+    assert conversions.convert(GoalTypes.CALORIES.value, 1210) == 1210 * 0.04
+    assert conversions.convert(GoalTypes.STEPS.value, 1210) == 1210
+
+
+def test_calibration_changes_the_conversion():
+    assert conversions.convert(GoalTypes.KILOMETERS.value, 1000, calibration) == pytest.approx(0.8)
+    assert conversions.convert(GoalTypes.CALORIES.value, 1000, calibration) == pytest.approx(48)
+
+
+def test_batch_conversion_matches_one_by_one(vectorized):
+    steps = [100, 2500, 0, 730.5]
+    calibrations = [calibration, Calibration(), calibration, Calibration(weight_kg=50)]
+    converted = conversions.convert_many(GoalTypes.CALORIES.value, steps, calibrations)
+    assert list(converted) == pytest.approx(
+        [conversions.convert(GoalTypes.CALORIES.value, value, each) for value, each in zip(steps, calibrations)]
+    )
+    totals = conversions.totals(steps, calibration)
+    assert totals[GoalTypes.STEPS.value] == pytest.approx(sum(steps))
+    assert totals[GoalTypes.KILOMETERS.value] == pytest.approx(sum(steps) * 0.8 / 1000)
+    assert all(type(total) is float for total in totals.values())
+
+
+def test_new_metric_only_needs_a_registered_conversion(vectorized):
+    registry = ConversionRegistry()
+
+    @registry.register("Meters")
+    def step_to_meter(steps, stride_length_m):
+        return steps * stride_length_m
+
+    assert registry.totals([100, 200], calibration) == {"Meters": pytest.approx(240)}
+
+
+def test_progress_uses_the_calibration_of_the_user(mongo_mock):
+    user_id, headers = auth_headers()
+    assert client.get("/athletes/me/goals/calibration", headers=headers).json() == Calibration().dict()
+    response = client.put("/athletes/me/goals/calibration", json={"stride_length_m": 0.8}, headers=headers)
+    assert response.status_code == 200
+    assert client.get("/athletes/me/goals/calibration", headers=headers).json()["stride_length_m"] == 0.8
+
+    goal_id = mongo_mock.goals.insert_one({"user_id": user_id, "title": "Run", "metric": GoalTypes.KILOMETERS.value,
+                                           "quantity_steps": 10, "progress_steps": 0,
+                                           "state": State.INIT.value}).inserted_id
+    client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 1000}, headers=headers)
+    assert mongo_mock.goals.find_one({"_id": goal_id})["progress_steps"] == pytest.approx(0.8)
+
+
+def test_invalid_calibration_is_rejected(mongo_mock):
+    _, headers = auth_headers()
+    response = client.put("/athletes/me/goals/calibration", json={"weight_kg": 0}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_batch_of_samples_is_applied_in_one_call(mongo_mock):
+    user_id, headers = auth_headers()
+    goal_id = mongo_mock.goals.insert_one({"user_id": user_id, "title": "Burn", "metric": GoalTypes.CALORIES.value,
+                                           "quantity_steps": 1000, "progress_steps": 0,
+                                           "state": State.INIT.value}).inserted_id
+    samples = [{"progress_steps": 500, "ts": "2023-06-01T10:00:00Z"},
+               {"progress_steps": 700, "ts": "2023-06-01T11:00:00Z"},
+               {"progress_steps": 300}]
+
+    response = client.patch("/athletes/me/goals/progress_steps/batch", json={"samples": samples}, headers=headers)
+    assert response.status_code == 200
+    assert mongo_mock.goals.find_one({"_id": goal_id})["progress_steps"] == pytest.approx(1500 * 0.04)
+    assert [sample["steps"] for sample in progress_history.buffer] == [500, 700, 300]
+    assert progress_history.buffer[0]["ts"].hour == 10
@@ -0,0 +1,101 @@
+import mongomock
+import pytest
+
+from app.auth.auth_utils import generate_token_with_role
+from app.config.database import (
+    build_read_preference,
+    get_read_collection,
+    get_write_collection,
+)
+from app.models.goal import GoalTypes, UserRoles
+from app.services.conversions import calibration_cache
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from starlette.requests import Request
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+goal_mock_1 = {
+    "title": "Meta en secundario",
+    "description": "Solo existe en la replica de lectura",
+    "metric": GoalTypes.STEPS.value,
+    "quantity_steps": 1500,
+    "user_id": athlete_id_example_mock_1
+}
+
+@pytest.fixture()
+def replica_mock(monkeypatch):
+    # Dos bases distintas como stand-in del primario y de un secundario
+    primary = mongomock.MongoClient().get_database("goals_microservice")
+    secondary = mongomock.MongoClient().get_database("goals_microservice")
+    secondary.get_collection("goals").insert_one(goal_mock_1)
+
+    app.logger = logger
+    monkeypatch.setattr(app, "database", primary, raising=False)
+    monkeypatch.setattr(app, "read_database", secondary, raising=False)
+    return primary, secondary
+
+
+def make_request():
+    return Request({"type": "http", "app": app, "headers": []})
+
+
+def test_build_read_preference_with_max_staleness():
+    read_preference = build_read_preference("secondaryPreferred", 120)
+    assert isinstance(read_preference, SecondaryPreferred)
+    assert read_preference.max_staleness == 120
+    assert isinstance(build_read_preference("primary", 120), Primary)
+
+
+def test_build_read_preference_unknown_raises():
+    with pytest.raises(ValueError):
+        build_read_preference("tertiary")
+
+
+def test_get_goals_is_served_from_read_database(replica_mock):
+    response = client.get("/athletes/me/goals", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert response.json()[0]["title"] == goal_mock_1["title"]
+
+
+def test_post_goal_is_written_to_primary(replica_mock):
+    primary, secondary = replica_mock
+    response = client.post("/athletes/me/goals/",
+                           json={"title": "Test Goal Steps",
+                                 "description": "This is a test of Goal Step",
+                                 "metric": GoalTypes.STEPS.value,
+                                 "quantity_steps": 1500},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert primary.goals.find_one({"_id": ObjectId(response.json()["id"])})["title"] == "Test Goal Steps"
+    # El secundario solo tiene la meta sembrada por el fixture
+    assert [goal["title"] for goal in secondary.goals.find()] == [goal_mock_1["title"]]
+
+
+def test_calibration_is_read_from_the_primary_after_it_is_saved(replica_mock):
+    primary, secondary = replica_mock
+    headers = {"Authorization": f"Bearer {access_token_athlete_example_mock_1}"}
+    calibration_cache.clear()
+
+    response = client.put("/athletes/me/goals/calibration", json={"stride_length_m": 0.9}, headers=headers)
+    assert response.status_code == 200
+    # El secundario todavia no tiene la calibracion: no se lee de ahi
+    assert secondary.user_calibrations.count_documents({}) == 0
+    assert client.get("/athletes/me/goals/calibration", headers=headers).json()["stride_length_m"] == 0.9
+    calibration_cache.clear()
+    assert client.get("/athletes/me/goals/calibration", headers=headers).json()["stride_length_m"] == 0.9
+    calibration_cache.clear()
+
+
+def test_reads_after_write_in_same_request_go_to_primary(replica_mock):
+    primary, secondary = replica_mock
+    request = make_request()
+    assert get_read_collection(request).database is secondary
+
+    get_write_collection(request)
+    assert get_read_collection(request).database is primary
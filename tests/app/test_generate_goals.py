@@ -0,0 +1,46 @@
+import mongomock
+
+from collections import Counter
+from datetime import datetime, timezone
+from app.models.goal import State
+from benchmarks.generate_goals import generate_goals, goal_counts
+
+now = datetime(2023, 6, 1, tzinfo=timezone.utc)
+
+
+def load(seed, workers):
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    written = generate_goals(db, users=50, goals=2000, seed=seed, trainings=10,
+                             workers=workers, chunk_size=100, now=now)
+    assert written == 2000
+    return {goal["_id"]: {key: value for key, value in goal.items() if key not in ("seq", "updated_at")}
+            for goal in db.goals.find()}
+
+
+def test_goal_counts_are_skewed_and_add_up():
+    counts = goal_counts(100, 10000, skew=1.1)
+    assert sum(counts) == 10000
+    assert counts == sorted(counts, reverse=True)
+    assert counts[0] > 20 * counts[50]
+
+
+def test_dataset_is_deterministic_from_seed():
+    goals = load(seed=7, workers=3)
+    assert load(seed=7, workers=1) == goals
+    assert load(seed=8, workers=3).keys() != goals.keys()
+
+
+def test_dataset_mixes_states_metrics_and_trainings():
+    goals = list(load(seed=1, workers=2).values())
+
+    assert len(Counter(goal["metric"] for goal in goals)) == 3
+    assert len(Counter(goal["state"] for goal in goals)) == 5
+    assert 0.2 < sum(goal["training_id"] is not None for goal in goals) / len(goals) < 0.4
+    for goal in goals:
+        if goal["state"] == State.EXPIRED.value:
+            assert goal["limit"] < now
+        if goal["state"] in (State.NOT_INIT.value, State.INIT.value):
+            assert goal["limit"] > now
+        if goal["state"] == State.COMPLETE.value:
+            assert goal["progress_steps"] == goal["quantity_steps"]
+            assert goal["date_init"] <= goal["date_complete"] <= now
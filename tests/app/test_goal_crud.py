@@ -250,4 +250,58 @@ def test_patch_goal_expired_then_resets_the_goal(mongo_mock):
     response = client.get(f"/athletes/me/goals/{goal_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
     assert response.json()["state"] == State.NOT_INIT.value
     assert response.json()["date_init"] is None
-    
\ No newline at end of file
+        
+def test_get_goals_with_fields_returns_only_requested_fields(mongo_mock):
+    response = client.get("/athletes/me/goals?fields=id,title,state,progress_steps", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert set(response.json()[0].keys()) == {"id", "title", "state", "progress_steps"}
+    assert response.json()[0]["title"] == goal_mock_1["title"]
+    
+def test_get_especific_goal_with_fields(mongo_mock):
+    response = client.post("/athletes/me/goals/", 
+                           json={"title": "Test Goal Steps",
+                                 "description": "This is a test of Goal Step",
+                                 "metric": GoalTypes.STEPS.value,
+                                 "quantity_steps": 1500},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    goal_id = response.json()["id"]
+    
+    response = client.get(f"/athletes/me/goals/{goal_id}?fields=title,quantity_steps", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json() == {"title": "Test Goal Steps", "quantity_steps": 1500}
+    
+def test_get_goals_with_unknown_fields_returns_bad_request(mongo_mock):
+    response = client.get("/athletes/me/goals?fields=title,password", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 400
+    assert response.json()["message"] == "Invalid fields: password"
+    
+def test_get_goal_returns_limit_time(mongo_mock):
+    limit = datetime.now(timezone.utc) + timedelta(days=1)
+    response = client.post("/athletes/me/goals/", 
+                           json={"title": "Test Goal Steps",
+                                 "description": "This is a test of Goal Step",
+                                 "metric": GoalTypes.STEPS.value,
+                                 "quantity_steps": 1500,
+                                 "limit_time": str(limit)},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    goal_id = response.json()["id"]
+    
+    response = client.get(f"/athletes/me/goals/{goal_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert abs(parser.parse(response.json()["limit_time"]).replace(tzinfo=timezone.utc) - limit) < timedelta(milliseconds=1)
+
+
+def test_post_goal_response_is_built_from_stored_goal(mongo_mock):
+    response = client.post("/athletes/me/goals/",
+                           json={"title": "Test Goal Steps",
+                                 "description": "This is a test of Goal Step",
+                                 "quantity_steps": 1500,
+                                 "limit_time": "2100-01-01T10:00:00+03:00"},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["limit_time"] == "2100-01-01T07:00:00+00:00"
+
+    response_get = client.get(f"/athletes/me/goals/{response.json()['id']}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response_get.json()["title"] == response.json()["title"]
+    assert response_get.json()["quantity_steps"] == response.json()["quantity_steps"]
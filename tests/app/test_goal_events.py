@@ -0,0 +1,107 @@
+import asyncio
+import mongomock
+
+from datetime import datetime, timedelta, timezone
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import State, UserRoles
+from app.repositories.goals import DocumentGoalRepository, next_seq
+from app.services.goal_events import (
+    DELETED_EVENT,
+    GOAL_EVENT,
+    RESYNC_EVENT,
+    ChangeStreamFeed,
+    GoalEventBroker,
+    PollingFeed,
+    sse_stream,
+)
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+
+def test_slow_subscription_is_bounded_and_asked_to_resync():
+    async def run():
+        broker = GoalEventBroker(max_queue=2, max_per_user=1)
+        subscription = broker.subscribe("user")
+        assert broker.subscribe("user") is None
+        for index in range(5):
+            broker.publish("user", GOAL_EVENT, {"index": index})
+        assert subscription.queue.qsize() == 1
+        assert (await subscription.next(1))[0] == RESYNC_EVENT
+        broker.publish("user", GOAL_EVENT, {"index": 5})
+        assert await subscription.next(1) == (GOAL_EVENT, {"index": 5})
+
+    asyncio.run(run())
+
+
+def test_polling_feed_publishes_goal_writes_and_deletes():
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    repository = DocumentGoalRepository(db.goals)
+    feed = PollingFeed(GoalEventBroker(), repository)
+    old_id = repository.insert({"user_id": athlete_id_example_mock_1, "title": "Old"})
+    assert feed.poll() == []
+
+    goal_id = repository.insert({"user_id": athlete_id_example_mock_1, "title": "New", "state": State.NOT_INIT.value})
+    repository.update(goal_id, {"state": State.INIT.value})
+    repository.delete(old_id)
+
+    events = feed.poll()
+    assert [(event, data.get("id")) for _, event, data in events] == [(GOAL_EVENT, str(goal_id)), (DELETED_EVENT, str(old_id))]
+    assert events[0][2]["state"] == State.INIT.value
+    assert feed.poll() == []
+
+
+def test_polling_feed_does_not_skip_a_write_committed_out_of_order():
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    repository = DocumentGoalRepository(db.goals)
+    feed = PollingFeed(GoalEventBroker(), repository, lag=60)
+    feed.poll()
+
+    # Otro worker tomo el seq N y escribe despues que N+1
+    in_flight_seq = next_seq(db)
+    visible_id = repository.insert({"user_id": athlete_id_example_mock_1, "title": "Visible"})
+    assert [data["id"] for _, _, data in feed.poll()] == [str(visible_id)]
+
+    late_id = ObjectId()
+    db.goals.insert_one({"_id": late_id, "user_id": athlete_id_example_mock_1, "title": "Late",
+                         "seq": in_flight_seq, "updated_at": datetime.now(timezone.utc)})
+    assert [data["id"] for _, _, data in feed.poll()] == [str(late_id)]
+
+    later = datetime.now(timezone.utc) + timedelta(minutes=2)
+    assert feed.poll(later) == []
+    assert feed.last_seq == in_flight_seq + 1
+    assert feed.published == set()
+
+
+def test_change_stream_feed_sends_only_last_written_goals_of_a_bucket():
+    feed = ChangeStreamFeed(GoalEventBroker(), None, "goal_buckets")
+    bucket = {"user_id": "user", "goals": [{"_id": ObjectId(), "user_id": "user", "seq": 3},
+                                           {"_id": ObjectId(), "user_id": "user", "seq": 7}]}
+    events = feed.to_events({"ns": {"coll": "goal_buckets"}, "fullDocument": bucket})
+    assert [data["id"] for _, _, data in events] == [str(bucket["goals"][1]["_id"])]
+
+
+def test_sse_stream_formats_events_until_disconnect():
+    async def run():
+        broker = GoalEventBroker()
+        subscription = broker.subscribe("user")
+        broker.publish("user", GOAL_EVENT, {"id": "1"})
+        checks = iter([False, False, True])
+
+        async def is_disconnected():
+            return next(checks)
+
+        chunks = [chunk async for chunk in sse_stream(broker, subscription, is_disconnected, 0.01)]
+        assert chunks == ['event: ready\ndata: {}\n\n', 'event: goal\ndata: {"id": "1"}\n\n', ': keepalive\n\n']
+        assert "user" not in broker.subscriptions
+
+    asyncio.run(run())
+
+
+def test_events_endpoint_disabled_without_feed():
+    response = client.get("/athletes/me/goals/events", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 503
@@ -0,0 +1,155 @@
+import mongomock
+import pymongo
+import pytest
+
+from datetime import datetime, timedelta, timezone
+from os import environ
+from app.auth.auth_utils import generate_token_with_role
+from app.jobs.migrate_goal_layout import buckets_to_documents, documents_to_buckets
+from app.models.goal import GoalTypes, State, UserRoles
+from app.repositories import goals as goal_repositories
+from app.repositories.goals import BucketGoalRepository
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+@pytest.fixture()
+def bucket_mode(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    monkeypatch.setattr(goal_repositories.app_settings, "GOALS_STORAGE_MODE", "bucket")
+    return db
+
+
+def post_goal(title="Test Goal Steps"):
+    response = client.post("/athletes/me/goals/",
+                           json={"title": title,
+                                 "description": "This is a test of Goal Step",
+                                 "metric": GoalTypes.STEPS.value,
+                                 "quantity_steps": 1500},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_bucket_mode_keeps_goals_of_user_in_one_bucket(bucket_mode):
+    post_goal("First")
+    post_goal("Second")
+    assert bucket_mode.goal_buckets.count_documents({}) == 1
+    assert bucket_mode.goals.count_documents({}) == 0
+
+    response = client.get("/athletes/me/goals/", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert [goal["title"] for goal in response.json()] == ["First", "Second"]
+
+
+def test_bucket_spills_over_when_full():
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    repository = BucketGoalRepository(db.goal_buckets, bucket_size=2)
+    for index in range(5):
+        repository.insert({"user_id": "user", "title": str(index)})
+    assert [bucket["count"] for bucket in db.goal_buckets.find()] == [2, 2, 1]
+    assert len(repository.find_by_user("user")) == 5
+    assert len(repository.find_by_user("user", limit=3)) == 3
+
+
+def test_bucket_mode_state_transitions_and_delete(bucket_mode):
+    goal_id = post_goal()
+    response = client.patch(f"/athletes/me/goals/{goal_id}/start", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+
+    response = client.get(f"/athletes/me/goals/{goal_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.json()["state"] == State.INIT.value
+
+    response = client.patch(f"/athletes/me/goals/{goal_id}", json={"title": "Patched"}, headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    response = client.get(f"/athletes/me/goals/{goal_id}?fields=title", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.json() == {"title": "Patched"}
+
+    response = client.delete(f"/athletes/me/goals/{goal_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    response = client.get(f"/athletes/me/goals/{goal_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 404
+
+
+def test_migration_between_layouts_keeps_every_goal():
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    db.goals.insert_many([{"user_id": f"user-{index % 3}", "title": str(index)} for index in range(10)])
+
+    assert documents_to_buckets(db, bucket_size=2) == 10
+    assert db.goals.count_documents({}) == 0
+    assert db.goal_buckets.count_documents({}) == 6
+
+    assert buckets_to_documents(db) == 10
+    assert db.goal_buckets.count_documents({}) == 0
+    assert sorted(goal["title"] for goal in db.goals.find()) == sorted(str(index) for index in range(10))
+
+
+class RecordingCollection:
+    """mongomock collection that records the update_many calls instead of applying them."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.updates = []
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def update_many(self, query, update, array_filters=None):
+        self.updates.append((query, update, array_filters))
+
+
+def test_bucket_progress_sync_builds_a_single_update():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    collection = RecordingCollection(db.goal_buckets)
+    repository = BucketGoalRepository(collection)
+    now = datetime.now(timezone.utc)
+    started = [repository.insert({"user_id": "user", "state": State.INIT.value, "metric": GoalTypes.STEPS.value,
+                                  "progress_steps": 0, "quantity_steps": 100, "limit": None,
+                                  "date_init": now - timedelta(days=days)}) for days in (1, 2)]
+    expired = repository.insert({"user_id": "user", "state": State.INIT.value, "metric": GoalTypes.STEPS.value,
+                                 "progress_steps": 0, "quantity_steps": 100, "limit": now - timedelta(days=1)})
+    repository.insert({"user_id": "user", "state": State.COMPLETE.value, "metric": GoalTypes.STEPS.value,
+                       "progress_steps": 100, "quantity_steps": 100, "limit": now - timedelta(days=1)})
+
+    _, delta = repository.apply_progress("user", {GoalTypes.STEPS.value: 150}, now)
+    assert delta.progress[GoalTypes.STEPS.value] == 300
+    # La meta completada y vencida no cuenta como vencida
+    assert delta.states[State.EXPIRED.name] == 1
+    assert delta.states[State.COMPLETE.name] == 0
+
+    # Una sola escritura: las metas de la misma metrica comparten el filtro
+    [(query, update, array_filters)] = collection.updates
+    assert query == {"user_id": "user"}
+    assert update["$inc"]["goals.$[p0].progress_steps"] == 150
+    assert update["$set"]["goals.$[expired].state"] == State.EXPIRED.value
+    assert array_filters[0]["expired.state"] == {"$nin": [State.COMPLETE.value, State.EXPIRED.value]}
+    assert [sorted(f) for f in array_filters] == [["expired.limit", "expired.state"], ["$or", "p0._id", "p0.state"]]
+    assert sorted(array_filters[1]["p0._id"]["$in"]) == sorted(started)
+    assert expired not in array_filters[1]["p0._id"]["$in"]
+
+
+@pytest.mark.skipif("MONGODB_TEST_URI" not in environ, reason="array filters need a real mongod")
+def test_bucket_progress_sync_is_a_single_update():
+    db = pymongo.MongoClient(environ["MONGODB_TEST_URI"]).get_database("goals_microservice_test")
+    db.goal_buckets.drop()
+    repository = BucketGoalRepository(db.goal_buckets)
+    now = datetime.now(timezone.utc)
+    started = repository.insert({"user_id": "user", "state": State.INIT.value, "metric": GoalTypes.STEPS.value,
+                                 "progress_steps": 0, "quantity_steps": 100, "limit": None})
+    expired = repository.insert({"user_id": "user", "state": State.INIT.value, "metric": GoalTypes.STEPS.value,
+                                 "progress_steps": 0, "quantity_steps": 100, "limit": now - timedelta(days=1)})
+
+    completed = repository.insert({"user_id": "user", "state": State.COMPLETE.value, "metric": GoalTypes.STEPS.value,
+                                   "progress_steps": 100, "quantity_steps": 100, "limit": now - timedelta(days=1)})
+
+    reached, delta = repository.apply_progress("user", {GoalTypes.STEPS.value: 150}, now)
+    assert [goal["_id"] for goal in reached] == [started]
+    assert delta.progress[GoalTypes.STEPS.value] == 150
+    assert repository.find(completed)["state"] == State.COMPLETE.value
+    assert repository.find(expired)["state"] == State.EXPIRED.value
+    assert repository.find(expired)["progress_steps"] == 0
@@ -4,7 +4,8 @@ import pytest
 from datetime import datetime, timedelta, timezone
 from fastapi import Response
 from app.auth.auth_utils import generate_token_with_role
-from app.models.goal import GoalTypes, State, UserRoles
+from app.models.goal import GoalTypes, State, UserRoles, goal_pace, pace_weight, to_utc
+from app.repositories.goals import pace_groups, progress_update
 from app.routes.goal_states import step_to_calorie, step_to_kilometer
 from bson import ObjectId
 from fastapi.testclient import TestClient
@@ -460,4 +461,202 @@ def test_progress_steps_with_goals_completed_is_not_increased(mock_vars):
     assert response.json()["state"] == State.COMPLETE.value
     assert response.json()["quantity_steps"] == 1500
     assert response.json()["progress_steps"] == 1502
-    
\ No newline at end of file
+    
+
+def pace_after_daily_progress(days, steps_per_day, since):
+    pace = {"since": since, "sum": 0, "samples": 0}
+    for day in range(1, days + 1):
+        inc, _ = progress_update(steps_per_day, since, since + timedelta(days=day))
+        pace["sum"] += inc["pace.sum"]
+        pace["samples"] += inc["pace.samples"]
+    return pace
+
+
+def test_goal_pace_projects_eta_from_recent_rate():
+    since = datetime(2023, 6, 1, tzinfo=timezone.utc)
+    now = since + timedelta(days=10)
+    goal = {"state": State.INIT.value, "date_init": since, "quantity_steps": 2000, "progress_steps": 1000,
+            "limit": now + timedelta(days=15), "pace": pace_after_daily_progress(10, 100, since)}
+
+    eta, on_track = goal_pace(goal, now)
+    assert abs((eta - now) - timedelta(days=10)) < timedelta(days=1)
+    assert on_track is True
+
+    eta, on_track = goal_pace({**goal, "limit": now + timedelta(days=5)}, now)
+    assert on_track is False
+
+    # Sin progreso por un tiempo, el ritmo cae y la ETA se aleja
+    later_eta, _ = goal_pace(goal, now + timedelta(days=7))
+    assert later_eta - (now + timedelta(days=7)) > timedelta(days=15)
+
+
+def test_goal_pace_of_goals_not_in_progress():
+    now = datetime(2023, 6, 1, tzinfo=timezone.utc)
+    assert goal_pace({"state": State.NOT_INIT.value}, now) == (None, None)
+    assert goal_pace({"state": State.EXPIRED.value}, now) == (None, False)
+    assert goal_pace({"state": State.COMPLETE.value, "date_complete": now}, now) == (now, True)
+    assert goal_pace({"state": State.INIT.value, "date_init": now - timedelta(days=1), "quantity_steps": 10,
+                      "limit": now + timedelta(days=1)}, now) == (None, None)
+
+
+def test_goals_of_a_metric_started_at_different_times_share_one_update():
+    now = datetime(2023, 6, 1, tzinfo=timezone.utc)
+    goals = [{"_id": index, "metric": GoalTypes.STEPS.value, "date_init": now - timedelta(days=index)}
+             for index in range(3)]
+    goals.append({"_id": 3, "metric": GoalTypes.CALORIES.value, "date_init": now})
+
+    groups = pace_groups(goals, {GoalTypes.STEPS.value: 100, GoalTypes.CALORIES.value: 4}, now)
+    assert sorted(ids for ids in groups.values()) == [[0, 1, 2], [3]]
+
+
+def insert_slow_goal(**extra):
+    # 30 dias a 10 pasos por dia: 1200 pasos faltantes no llegan al limite
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=30)
+    goal = {"user_id": athlete_id_example_mock_1, "title": "Slow", "metric": GoalTypes.STEPS.value,
+            "state": State.INIT.value, "date_init": since, "limit": now + timedelta(days=10),
+            "quantity_steps": 1500, "progress_steps": 300, "pace": pace_after_daily_progress(30, 10, since), **extra}
+    return str(app.database.goals.insert_one(goal).inserted_id)
+
+
+def get_pace(goal_id):
+    response = client.get(f"/athletes/me/goals/{goal_id}?fields=eta,on_track",
+                          headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    return response.json()
+
+
+def test_restarting_a_goal_starts_a_new_pace(mock_vars):
+    goal_id = insert_slow_goal()
+    assert get_pace(goal_id)["on_track"] is False
+
+    headers = {"Authorization": f"Bearer {access_token_athlete_example_mock_1}"}
+    assert client.patch(f"/athletes/me/goals/{goal_id}/stop", headers=headers).status_code == 200
+    assert client.patch(f"/athletes/me/goals/{goal_id}/start", headers=headers).status_code == 200
+    # El progreso de antes no cuenta para el nuevo inicio: no hay ETA hasta la primera muestra
+    assert get_pace(goal_id) == {"eta": None, "on_track": None}
+
+    client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 100}, headers=headers)
+    pace = app.database.goals.find_one({"_id": ObjectId(goal_id)})["pace"]
+    assert pace["samples"] == 1
+    assert pace["sum"] == pytest.approx(100 * pace_weight(to_utc(pace["since"]), to_utc(pace["at"])))
+
+
+def test_reset_of_an_expired_goal_starts_a_new_pace(mock_vars):
+    goal_id = insert_slow_goal(state=State.EXPIRED.value)
+    headers = {"Authorization": f"Bearer {access_token_athlete_example_mock_1}"}
+
+    response = client.patch(f"/athletes/me/goals/{goal_id}", json={"title": "Slow again"}, headers=headers)
+    assert response.status_code == 200
+    assert client.patch(f"/athletes/me/goals/{goal_id}/start", headers=headers).status_code == 200
+    assert get_pace(goal_id) == {"eta": None, "on_track": None}
+
+
+def test_overdue_completed_goal_stays_completed(mock_vars):
+    now = datetime.now(timezone.utc)
+    goal_id = app.database.goals.insert_one({"user_id": athlete_id_example_mock_1, "title": "Done",
+                                             "metric": GoalTypes.STEPS.value, "state": State.COMPLETE.value,
+                                             "date_complete": now - timedelta(days=2), "limit": now - timedelta(days=1),
+                                             "quantity_steps": 100, "progress_steps": 100}).inserted_id
+    headers = {"Authorization": f"Bearer {access_token_athlete_example_mock_1}"}
+
+    response = client.patch(f"/athletes/me/goals/{goal_id}/start", headers=headers)
+    assert response.status_code == 400
+    assert response.json() == f"Goal {goal_id} already completed"
+
+    client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 100}, headers=headers)
+    goal = app.database.goals.find_one({"_id": goal_id})
+    assert goal["state"] == State.COMPLETE.value
+    assert goal["progress_steps"] == 100
+
+
+def test_completed_goal_is_not_started_again(mock_vars):
+    goal_id = app.database.goals.insert_one({"user_id": athlete_id_example_mock_1, "title": "Done",
+                                             "metric": GoalTypes.STEPS.value, "state": State.COMPLETE.value,
+                                             "quantity_steps": 100, "progress_steps": 100}).inserted_id
+    response = client.patch(f"/athletes/me/goals/{goal_id}/start",
+                            headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 400
+    assert app.database.goals.find_one({"_id": goal_id})["state"] == State.COMPLETE.value
+
+
+def test_progress_keeps_pace_in_the_same_write(mock_vars):
+    response = client.post("/athletes/me/goals/",
+                           json={"title": "Test Goal Steps",
+                                 "description": "This is a test of Goal Step",
+                                 "metric": GoalTypes.STEPS.value,
+                                 "quantity_steps": 1500,
+                                 "training_id": str(ObjectId()),
+                                 "limit_time": (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    goal_id = response.json()["id"]
+    assert response.json()["eta"] is None
+
+    for _ in range(2):
+        client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 100},
+                     headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+
+    goal = app.database.goals.find_one({"_id": ObjectId(goal_id)})
+    assert goal["progress_steps"] == 200
+    assert goal["pace"]["samples"] == 2
+    assert goal["pace"]["sum"] >= 200
+
+    response = client.get(f"/athletes/me/goals/{goal_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.json()["eta"] is not None
+    assert response.json()["on_track"] is True
+
+    response = client.get(f"/athletes/me/goals/{goal_id}?fields=id,on_track", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.json() == {"id": goal_id, "on_track": True}
+
+
+def create_goal_for_bulk(**extra):
+    goal = {"user_id": athlete_id_example_mock_1, "title": "Bulk", "description": "Bulk goal",
+            "metric": GoalTypes.STEPS.value, "quantity_steps": 1500, "progress_steps": 0,
+            "state": State.NOT_INIT.value, "limit": None, **extra}
+    return str(app.database.goals.insert_one(goal).inserted_id)
+
+
+def test_bulk_state_transition_reports_each_goal(mock_vars):
+    not_init = create_goal_for_bulk()
+    started = create_goal_for_bulk(state=State.INIT.value)
+    overdue = create_goal_for_bulk(limit=datetime.now(timezone.utc) - timedelta(days=1))
+    other_user = str(app.database.goals.insert_one({"user_id": str(ObjectId()), "state": State.NOT_INIT.value}).inserted_id)
+
+    response = client.patch("/athletes/me/goals/state",
+                            json={"ids": [not_init, started, overdue, other_user, "bad-id", not_init],
+                                  "state": State.INIT.value},
+                            headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["updated"] == 2
+    assert response.json()["results"] == [
+        {"id": not_init, "status": "updated"},
+        {"id": started, "status": "invalid_transition"},
+        {"id": overdue, "status": "expired"},
+        {"id": other_user, "status": "not_found"},
+        {"id": "bad-id", "status": "not_found"},
+    ]
+    goal = app.database.goals.find_one({"_id": ObjectId(not_init)})
+    assert goal["state"] == State.INIT.value
+    assert goal["date_init"] is not None
+    assert app.database.goals.find_one({"_id": ObjectId(overdue)})["state"] == State.EXPIRED.value
+    assert app.database.goals.find_one({"_id": ObjectId(other_user)})["state"] == State.NOT_INIT.value
+
+    stats = client.get("/athletes/me/goals/stats", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert stats.json()["states"]["INIT"] == 1
+    assert stats.json()["states"]["EXPIRED"] == 1
+
+
+def test_bulk_stop_follows_single_goal_rules(mock_vars):
+    not_init = create_goal_for_bulk()
+    started = create_goal_for_bulk(state=State.INIT.value)
+    completed = create_goal_for_bulk(state=State.COMPLETE.value)
+
+    response = client.patch("/athletes/me/goals/state",
+                            json={"ids": [not_init, started, completed], "state": State.STOP.value},
+                            headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert [result["status"] for result in response.json()["results"]] == ["invalid_transition", "updated", "invalid_transition"]
+    assert app.database.goals.find_one({"_id": ObjectId(started)})["date_stop"] is not None
+
+    response = client.patch("/athletes/me/goals/state",
+                            json={"ids": [started], "state": State.COMPLETE.value},
+                            headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 400
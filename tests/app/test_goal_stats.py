@@ -0,0 +1,95 @@
+import mongomock
+import pytest
+
+from fastapi import Response
+from app.auth.auth_utils import generate_token_with_role
+from app.jobs.reconcile_goal_stats import reconcile_goal_stats
+from app.models.goal import GoalTypes, State, UserRoles
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+
+async def mock_send_notifications(*args, **kwargs):
+    response = Response()
+    response.status_code = 200
+    return response
+
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    monkeypatch.setattr("app.services.services.NotificationService.send_notification_completed", mock_send_notifications)
+    return db
+
+
+def post_goal(metric, quantity_steps):
+    response = client.post("/athletes/me/goals/",
+                           json={"title": f"Goal {metric}",
+                                 "description": "This is a test of Goal stats",
+                                 "metric": metric,
+                                 "quantity_steps": quantity_steps},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def get_stats():
+    response = client.get("/athletes/me/goals/stats", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def expected_stats(completion_rate=0.0, progress=None, **states):
+    return {
+        "total": sum(states.values()),
+        "states": {state.name: states.get(state.name, 0) for state in State},
+        "completion_rate": completion_rate,
+        "progress": {GoalTypes.KILOMETERS.value: 0, GoalTypes.STEPS.value: 0, GoalTypes.CALORIES.value: 0,
+                     **(progress or {})},
+    }
+
+
+def test_stats_follow_state_transitions_and_progress(mongo_mock):
+    headers = {"Authorization": f"Bearer {access_token_athlete_example_mock_1}"}
+    steps_id = post_goal(GoalTypes.STEPS.value, 1500)
+    calories_id = post_goal(GoalTypes.CALORIES.value, 1000)
+    deleted_id = post_goal(GoalTypes.KILOMETERS.value, 10)
+    assert get_stats() == expected_stats(NOT_INIT=3)
+
+    client.delete(f"/athletes/me/goals/{deleted_id}", headers=headers)
+    assert get_stats() == expected_stats(NOT_INIT=2)
+
+    client.patch(f"/athletes/me/goals/{steps_id}/start", headers=headers)
+    assert get_stats() == expected_stats(NOT_INIT=1, INIT=1)
+    client.patch(f"/athletes/me/goals/{calories_id}/start", headers=headers)
+    assert get_stats() == expected_stats(INIT=2)
+
+    client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 2000}, headers=headers)
+    assert get_stats() == expected_stats(
+        completion_rate=0.5, progress={GoalTypes.STEPS.value: 2000, GoalTypes.CALORIES.value: 80}, INIT=1, COMPLETE=1
+    )
+
+    client.patch(f"/athletes/me/goals/{calories_id}/stop", headers=headers)
+    assert get_stats() == expected_stats(
+        completion_rate=0.5, progress={GoalTypes.STEPS.value: 2000, GoalTypes.CALORIES.value: 80}, COMPLETE=1, STOP=1
+    )
+
+    assert reconcile_goal_stats(mongo_mock) == []
+
+
+def test_reconcile_reports_and_fixes_drift(mongo_mock):
+    post_goal(GoalTypes.STEPS.value, 1500)
+    mongo_mock.goal_stats.update_one({"_id": athlete_id_example_mock_1}, {"$inc": {"states.NOT_INIT": 3}})
+    mongo_mock.goal_stats.insert_one({"_id": "ghost", "states": {"INIT": 1}})
+
+    assert sorted(reconcile_goal_stats(mongo_mock, fix=True)) == sorted([athlete_id_example_mock_1, "ghost"])
+    assert reconcile_goal_stats(mongo_mock) == []
+    assert get_stats() == expected_stats(NOT_INIT=1)
+    assert mongo_mock.goal_stats.find_one({"_id": "ghost"}) is None
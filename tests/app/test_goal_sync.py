@@ -0,0 +1,101 @@
+import mongomock
+import pytest
+
+from datetime import datetime, timedelta, timezone
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import GoalTypes, UserRoles
+from app.repositories import goals as goal_repositories
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+headers = {"Authorization": f"Bearer {access_token_athlete_example_mock_1}"}
+
+
+@pytest.fixture(params=["document", "bucket"])
+def mongo_mock(request, monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    monkeypatch.setattr(goal_repositories.app_settings, "GOALS_STORAGE_MODE", request.param)
+    monkeypatch.setattr(goal_repositories.app_settings, "GOALS_SYNC_LAG_SECONDS", 0)
+    return db
+
+
+def post_goal(title):
+    response = client.post("/athletes/me/goals/",
+                           json={"title": title,
+                                 "description": "This is a test of Goal sync",
+                                 "metric": GoalTypes.STEPS.value,
+                                 "quantity_steps": 1500},
+                           headers=headers)
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_sync_returns_only_changes_since_watermark(mongo_mock):
+    unchanged_id = post_goal("Unchanged")
+    updated_id = post_goal("Updated")
+    deleted_id = post_goal("Deleted")
+
+    response = client.get("/athletes/me/goals/sync", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["full"] is True
+    assert len(response.json()["goals"]) == 3
+    watermark = response.json()["watermark"]
+
+    client.patch(f"/athletes/me/goals/{updated_id}", json={"title": "Patched"}, headers=headers)
+    client.delete(f"/athletes/me/goals/{deleted_id}")
+    created_id = post_goal("Created")
+
+    response = client.get(f"/athletes/me/goals/sync?watermark={watermark}", headers=headers)
+    assert response.json()["full"] is False
+    assert sorted(goal["id"] for goal in response.json()["goals"]) == sorted([updated_id, created_id])
+    assert response.json()["deleted"] == [deleted_id]
+    assert unchanged_id not in [goal["id"] for goal in response.json()["goals"]]
+
+    response = client.get(f"/athletes/me/goals/sync?watermark={response.json()['watermark']}", headers=headers)
+    assert response.json()["goals"] == []
+    assert response.json()["deleted"] == []
+
+
+def test_sync_with_old_or_invalid_watermark(mongo_mock):
+    post_goal("Goal")
+    issued_at = int((datetime.now(timezone.utc) - timedelta(days=365)).timestamp())
+    response = client.get(f"/athletes/me/goals/sync?watermark=1.{issued_at}", headers=headers)
+    assert response.json()["full"] is True
+    assert len(response.json()["goals"]) == 1
+
+    response = client.get("/athletes/me/goals/sync?watermark=nope", headers=headers)
+    assert response.status_code == 400
+
+
+def test_watermark_trails_writes_still_in_flight(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    monkeypatch.setattr(app, "database", db, raising=False)
+    monkeypatch.setattr(goal_repositories.app_settings, "GOALS_STORAGE_MODE", "document")
+    monkeypatch.setattr(goal_repositories.app_settings, "GOALS_SYNC_LAG_SECONDS", 60)
+
+    settled_id = post_goal("Settled")
+    db.goals.update_one({"_id": ObjectId(settled_id)},
+                        {"$set": {"updated_at": datetime.now(timezone.utc) - timedelta(minutes=2)}})
+    settled_seq = db.goals.find_one({"_id": ObjectId(settled_id)})["seq"]
+    # Otro worker tomo el seq N pero todavia no escribio; N+1 ya es visible
+    in_flight_seq = goal_repositories.next_seq(db)
+    visible_id = post_goal("Visible")
+
+    response = client.get("/athletes/me/goals/sync", headers=headers)
+    assert len(response.json()["goals"]) == 2
+    watermark = response.json()["watermark"]
+    assert int(watermark.split(".")[0]) == settled_seq
+
+    late_id = ObjectId()
+    db.goals.insert_one({"_id": late_id, "user_id": athlete_id_example_mock_1, "title": "Late",
+                         "description": "Late", "metric": GoalTypes.STEPS.value, "quantity_steps": 10,
+                         "progress_steps": 0, "state": 1, "seq": in_flight_seq,
+                         "updated_at": datetime.now(timezone.utc)})
+    response = client.get(f"/athletes/me/goals/sync?watermark={watermark}", headers=headers)
+    assert sorted(goal["id"] for goal in response.json()["goals"]) == sorted([visible_id, str(late_id)])
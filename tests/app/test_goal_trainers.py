@@ -0,0 +1,238 @@
+import mongomock
+import pytest
+
+from fastapi import Response
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import GoalTypes, State, UserRoles
+from app.repositories.goal_stats import GoalStatsRepository, StatsDelta, TrainingStatsRepository
+from app.repositories.goals import DocumentGoalRepository
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+trainer_id_example_mock_1 = str(ObjectId())
+access_token_trainer_example_mock_1 = generate_token_with_role(trainer_id_example_mock_1, UserRoles.TRAINER)
+athlete_id_example_mock_1 = str(ObjectId())
+athlete_id_example_mock_2 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+goal_template = {
+    "title": "Meta del entrenamiento",
+    "description": "Caminar con todo el grupo",
+    "metric": GoalTypes.STEPS.value,
+    "quantity_steps": 1500,
+}
+
+
+async def mock_training_athletes(path, headers):
+    response = Response()
+    response.status_code = 200
+    response.json = lambda: [{"id": athlete_id_example_mock_1}, {"id": athlete_id_example_mock_2}]
+    return response
+
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    return db
+
+
+def test_trainer_assigns_goal_to_athletes(monkeypatch, mongo_mock):
+    monkeypatch.setattr("app.services.services.ServiceTrainers.get", mock_training_athletes)
+    response = client.post("/trainers/me/goals/assign",
+                           json={"goal": goal_template, "training_id": str(ObjectId()),
+                                 "athlete_ids": [athlete_id_example_mock_1, athlete_id_example_mock_1]},
+                           headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["assigned"] == 1
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created"]
+
+    response = client.get(f"/athletes/me/goals/{results[0]['id']}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["user_id"] == athlete_id_example_mock_1
+    assert response.json()["state"] == State.INIT.value
+
+
+def test_assign_goal_rejects_athletes_not_enrolled_in_the_training(monkeypatch, mongo_mock):
+    monkeypatch.setattr("app.services.services.ServiceTrainers.get", mock_training_athletes)
+    stranger_id = str(ObjectId())
+    response = client.post("/trainers/me/goals/assign",
+                           json={"goal": goal_template, "training_id": str(ObjectId()),
+                                 "athlete_ids": [athlete_id_example_mock_1, stranger_id, "not-an-id"]},
+                           headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+    assert response.status_code == 403
+    assert response.json()["athlete_ids"] == [stranger_id, "not-an-id"]
+    assert mongo_mock.goals.count_documents({}) == 0
+
+    response = client.post("/trainers/me/goals/assign",
+                           json={"goal": goal_template, "athlete_ids": [athlete_id_example_mock_1]},
+                           headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+    assert response.status_code == 422
+    assert mongo_mock.goals.count_documents({}) == 0
+
+
+def test_trainer_assigns_goal_to_training(monkeypatch, mongo_mock):
+    monkeypatch.setattr("app.services.services.ServiceTrainers.get", mock_training_athletes)
+    training_id = str(ObjectId())
+    response = client.post("/trainers/me/goals/assign",
+                           json={"goal": goal_template, "training_id": training_id},
+                           headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["assigned"] == 2
+    goals = list(mongo_mock.goals.find({"training_id": training_id}))
+    assert {goal["user_id"] for goal in goals} == {athlete_id_example_mock_1, athlete_id_example_mock_2}
+    assert all(goal["state"] == State.INIT.value for goal in goals)
+
+
+def test_assign_goal_requires_trainer_and_athletes(mongo_mock):
+    response = client.post("/trainers/me/goals/assign",
+                           json={"goal": goal_template, "athlete_ids": [athlete_id_example_mock_1]},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 403
+
+    response = client.post("/trainers/me/goals/assign",
+                           json={"goal": goal_template},
+                           headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+    assert response.status_code == 422
+
+
+def test_insert_many_reports_failed_goals_by_index():
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    repository = DocumentGoalRepository(db.goals)
+    duplicated = ObjectId()
+    db.goals.insert_one({"_id": duplicated})
+    goals = [{"user_id": str(index)} for index in range(5)]
+    goals[3]["_id"] = duplicated
+
+    errors = repository.insert_many(goals, chunk_size=2)
+    assert list(errors) == [3]
+    assert db.goals.count_documents({}) == 5
+
+
+async def mock_ok(*args, **kwargs):
+    response = Response()
+    response.status_code = 200
+    return response
+
+
+def test_training_stats_are_materialized_and_kept_incrementally(monkeypatch, mongo_mock):
+    monkeypatch.setattr("app.services.services.ServiceTrainers.get", mock_training_athletes)
+    monkeypatch.setattr("app.services.services.ServiceTrainers.patch", mock_ok)
+    monkeypatch.setattr("app.services.services.NotificationService.send_notification_completed", mock_ok)
+    training_id = str(ObjectId())
+    client.post("/trainers/me/goals/assign",
+                json={"goal": goal_template, "training_id": training_id},
+                headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+
+    response = client.get(f"/trainers/me/goals/trainings/{training_id}/stats",
+                          headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["athletes"] == 2
+    assert response.json()["distribution"][0]["goals"] == 2
+
+    client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 750},
+                 headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    stats = client.get(f"/trainers/me/goals/trainings/{training_id}/stats",
+                       headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"}).json()
+    assert stats["distribution"][5]["goals"] == 1
+    assert stats["completion_ratio"] == 0
+
+    client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 750},
+                 headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    stats = client.get(f"/trainers/me/goals/trainings/{training_id}/stats",
+                       headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"}).json()
+    assert stats["completion_ratio"] == 0.5
+    assert stats["percentiles"]["p90"] == 1.0
+
+    rebuilt = client.get(f"/trainers/me/goals/trainings/{training_id}/stats?refresh=true",
+                         headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"}).json()
+    assert rebuilt == stats
+
+
+async def mock_not_my_training(path, headers):
+    response = Response()
+    response.status_code = 404
+    return response
+
+
+def test_training_stats_require_the_trainer_of_the_training(monkeypatch, mongo_mock):
+    monkeypatch.setattr("app.services.services.ServiceTrainers.get", mock_not_my_training)
+    training_id = str(ObjectId())
+    mongo_mock.goals.insert_one({"user_id": athlete_id_example_mock_1, "training_id": training_id,
+                                 "state": State.INIT.value, "quantity_steps": 10, "progress_steps": 0})
+
+    response = client.get(f"/trainers/me/goals/trainings/{training_id}/stats",
+                          headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"})
+    assert response.status_code == 403
+    assert mongo_mock.training_stats.count_documents({}) == 0
+
+
+def training_goal(seq, state=State.INIT.value, training_id="t1"):
+    return {"_id": ObjectId(), "user_id": athlete_id_example_mock_1, "training_id": training_id,
+            "state": state, "quantity_steps": 10, "progress_steps": 0, "seq": seq}
+
+
+def test_training_stats_rebuild_keeps_a_document_created_concurrently(mongo_mock):
+    trainings = TrainingStatsRepository(mongo_mock.training_stats)
+    goal = training_goal(1)
+    # Otro request lo materializo y ya le aplico un delta
+    trainings.rebuild("t1", lambda: [goal], lambda: 1)
+    mongo_mock.training_stats.update_one({"_id": "t1"}, {"$inc": {"goals": 1}})
+
+    stats = trainings.rebuild("t1", lambda: [goal], lambda: 1)
+    assert stats["goals"] == 2
+    assert trainings.rebuild("t1", lambda: [goal], lambda: 1, replace=True)["goals"] == 1
+
+
+def test_training_stats_deltas_already_in_the_rebuild_are_skipped(mongo_mock):
+    stats = GoalStatsRepository(mongo_mock.goal_stats, mongo_mock.training_stats)
+    trainings = TrainingStatsRepository(mongo_mock.training_stats)
+    goal = training_goal(5)
+    trainings.rebuild("t1", lambda: [goal], lambda: 6)
+
+    completed = {**goal, "state": State.COMPLETE.value}
+    # La escritura 6 ya estaba en la foto; la 7 llego despues
+    stats.apply(athlete_id_example_mock_1, StatsDelta.change(goal, completed, 6))
+    assert trainings.get("t1")["states"] == {"INIT": 1}
+    stats.apply(athlete_id_example_mock_1, StatsDelta.change(goal, completed, 7))
+    assert trainings.get("t1")["states"] == {"INIT": 0, "COMPLETE": 1}
+
+
+def test_training_stats_are_rebuilt_when_a_goal_changes_during_the_rebuild(mongo_mock):
+    trainings = TrainingStatsRepository(mongo_mock.training_stats)
+    goal = training_goal(5)
+    # Una escritura con seq 6 pedido antes de la marca llega despues de la foto
+    reads = [[goal], [{**goal, "state": State.STOP.value, "seq": 6}]]
+
+    def read_goals():
+        return reads.pop(0) if len(reads) > 1 else reads[0]
+
+    stats = trainings.rebuild("t1", read_goals, lambda: 6)
+    assert stats["states"] == {"STOP": 1}
+    assert trainings.get("t1")["states"] == {"STOP": 1}
+
+
+def test_training_stats_that_never_settle_are_not_kept(mongo_mock):
+    trainings = TrainingStatsRepository(mongo_mock.training_stats)
+    seqs = iter(range(1, 100))
+    stats = trainings.rebuild("t1", lambda: [training_goal(next(seqs))], lambda: 100)
+    assert stats["goals"] == 1
+    assert trainings.get("t1") is None
+
+
+def test_training_stats_count_archived_goals(monkeypatch, mongo_mock):
+    monkeypatch.setattr("app.services.services.ServiceTrainers.get", mock_training_athletes)
+    training_id = str(ObjectId())
+    live = training_goal(1, training_id=training_id)
+    archived = training_goal(2, State.COMPLETE.value, training_id)
+    mongo_mock.goals.insert_one(live)
+    mongo_mock.goals_archive.insert_many([archived, live])
+
+    stats = client.get(f"/trainers/me/goals/trainings/{training_id}/stats",
+                       headers={"Authorization": f"Bearer {access_token_trainer_example_mock_1}"}).json()
+    assert stats["goals"] == 2
+    assert stats["completion_ratio"] == 0.5
\ No newline at end of file
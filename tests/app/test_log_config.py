@@ -0,0 +1,78 @@
+import json
+import logging
+import queue
+import mongomock
+import pytest
+
+from app.auth.auth_utils import generate_token_with_role
+from app.config.log_config import (
+    AsyncQueueHandler,
+    JsonFormatter,
+    RateLimitFilter,
+    RequestIdFilter,
+    SamplingFilter,
+    request_id_var,
+)
+from app.models.goal import UserRoles
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+
+
+def make_record(level=logging.INFO, msg="Goal found: %s", args=({"title": "meta"},), lineno=10):
+    return logging.LogRecord("app", level, "goal_crud.py", lineno, msg, args, None)
+
+
+def test_rate_limit_filter_limits_each_call_site():
+    rate_limit = RateLimitFilter(rate=0.001, burst=2)
+    results = [rate_limit.filter(make_record()) for _ in range(5)]
+    assert results == [True, True, False, False, False]
+    assert rate_limit.filter(make_record(lineno=11))
+    assert rate_limit.filter(make_record(level=logging.ERROR))
+
+
+def test_sampling_filter_never_drops_warnings():
+    sampling = SamplingFilter(rate=0.0)
+    assert not sampling.filter(make_record())
+    assert sampling.filter(make_record(level=logging.WARNING))
+
+
+def test_json_formatter_includes_request_id():
+    token = request_id_var.set("abc123")
+    try:
+        record = make_record()
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+    log = json.loads(JsonFormatter().format(record))
+    assert log["request_id"] == "abc123"
+    assert log["message"] == "Goal found: {'title': 'meta'}"
+    assert log["level"] == "INFO"
+
+
+def test_queue_handler_resolves_message_before_args_are_mutated():
+    goal = {"title": "meta"}
+    handler = AsyncQueueHandler(queue.Queue(1))
+    handler.handle(make_record(args=(goal,)))
+    goal.pop("title")
+    handler.handle(make_record(args=(goal,)))
+
+    assert handler.queue.get_nowait().getMessage() == "Goal found: {'title': 'meta'}"
+    assert handler.dropped == 1
+
+
+def test_response_returns_request_id(mongo_mock):
+    response = client.get("/athletes/me/goals/", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}",
+                                                          "X-Request-ID": "req-1"})
+    assert response.status_code == 200
+    assert response.headers["X-Request-ID"] == "req-1"
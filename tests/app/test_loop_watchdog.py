@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from app.services.loop_watchdog import (
+    LoopWatchdog,
+    LoopWatchdogMiddleware,
+    loop_lag,
+)
+
+
+def blocking_handler():
+    # Como un find de pymongo dentro de una ruta async
+    time.sleep(0.3)
+
+
+async def blocking_app(scope, receive, send):
+    blocking_handler()
+
+
+def run_with_watchdog(watchdog, requests):
+    async def run():
+        task = asyncio.create_task(watchdog.run())
+        await asyncio.sleep(0.05)
+        for scope in requests:
+            await LoopWatchdogMiddleware(blocking_app, watchdog)(scope, None, None)
+            await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+
+
+def test_watchdog_reports_blocking_frame_and_route():
+    watchdog = LoopWatchdog(interval=0.01, threshold=0.1)
+    lag_count = loop_lag.count
+    scope = {"type": "http", "method": "PATCH", "path": "/athletes/me/goals/progress_steps"}
+
+    run_with_watchdog(watchdog, [scope])
+
+    assert len(watchdog.reports) == 1
+    report = watchdog.reports[0]
+    assert report["route"] == "PATCH /athletes/me/goals/progress_steps"
+    assert report["stalled"] > 0.1
+    assert "blocking_handler" in report["stack"]
+    assert watchdog.active == {}
+    assert loop_lag.count > lag_count
+
+
+def test_watchdog_does_not_report_short_lags():
+    watchdog = LoopWatchdog(interval=0.01, threshold=1)
+    run_with_watchdog(watchdog, [{"type": "http", "method": "GET", "path": "/"}])
+    assert len(watchdog.reports) == 0
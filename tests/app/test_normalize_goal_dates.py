@@ -0,0 +1,41 @@
+import mongomock
+
+from datetime import datetime, timezone
+from app.jobs.checkpoints import load_checkpoint
+from app.jobs.normalize_goal_dates import JOB_NAME, normalize_goal_dates
+from app.models.goal import to_utc
+
+
+def test_to_utc_converts_offsets_instead_of_replacing_them():
+    assert to_utc("2030-01-01T03:00:00+03:00") == datetime(2030, 1, 1, tzinfo=timezone.utc)
+    assert to_utc(datetime(2030, 1, 1)) == datetime(2030, 1, 1, tzinfo=timezone.utc)
+    assert to_utc(None) is None
+
+
+def test_backfill_fixes_strings_and_legacy_field_name():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    string_id = db.goals.insert_one({"limit": "2030-01-01T00:00:00", "date_init": "2029-12-01T00:00:00+00:00"}).inserted_id
+    legacy_id = db.goals.insert_one({"limit_time": "2030-02-01T00:00:00"}).inserted_id
+    ok_id = db.goals.insert_one({"limit": datetime(2030, 3, 1, tzinfo=timezone.utc)}).inserted_id
+
+    assert normalize_goal_dates(db, batch_size=1) == 2
+
+    assert db.goals.find_one({"_id": string_id})["limit"] == datetime(2030, 1, 1, tzinfo=timezone.utc)
+    assert db.goals.find_one({"_id": string_id})["date_init"] == datetime(2029, 12, 1, tzinfo=timezone.utc)
+    legacy = db.goals.find_one({"_id": legacy_id})
+    assert "limit_time" not in legacy
+    assert legacy["limit"] == datetime(2030, 2, 1, tzinfo=timezone.utc)
+    assert db.goals.find_one({"_id": ok_id})["limit"] == datetime(2030, 3, 1, tzinfo=timezone.utc)
+
+
+def test_backfill_resumes_from_checkpoint():
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    first_id = db.goals.insert_one({"limit": "2030-01-01T00:00:00"}).inserted_id
+    assert normalize_goal_dates(db) == 1
+    assert load_checkpoint(db, JOB_NAME) == first_id
+
+    # Lo anterior al checkpoint no se vuelve a recorrer
+    db.goals.insert_one({"_id": first_id.__class__("000000000000000000000001"), "limit": "2030-01-01"})
+    db.goals.insert_one({"limit": "2030-01-01T00:00:00"})
+    assert normalize_goal_dates(db) == 1
+    assert normalize_goal_dates(db, restart=True) == 1
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import mongomock
+import pytest
+
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import UserRoles
+from app.services.profiling import ProfilingMiddleware
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+access_token_admin_example_mock_1 = generate_token_with_role(str(ObjectId()), UserRoles.ADMIN)
+
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    return db
+
+
+async def wait_downstream():
+    await asyncio.sleep(0.05)
+
+
+async def slow_app(scope, receive, send):
+    await wait_downstream()
+    await send({"type": "http.response.start", "status": 201, "headers": []})
+    await send({"type": "http.response.body", "body": b"done"})
+
+
+def frame_names(profile):
+    frames = profile["shared"]["frames"]
+    return {frames[index]["name"] for sample in profile["profiles"][0]["samples"] for index in sample}
+
+
+def test_admin_header_returns_profile_inline(mongo_mock):
+    response = client.get("/athletes/me/goals/",
+                          headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}",
+                                   "X-Profile": access_token_admin_example_mock_1,
+                                   "X-Profile-Output": "inline"})
+    assert response.status_code == 200
+    assert response.headers["x-profile-status"] == "200"
+    profile = response.json()
+    assert profile["profiles"][0]["type"] == "sampled"
+    assert profile["profiles"][0]["name"] == "GET /athletes/me/goals/"
+
+
+def test_non_admin_header_is_not_profiled(mongo_mock):
+    response = client.get("/athletes/me/goals/",
+                          headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}",
+                                   "X-Profile": access_token_athlete_example_mock_1,
+                                   "X-Profile-Output": "inline"})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "x-profile-status" not in response.headers
+
+
+def test_sampled_request_writes_profile_with_awaits(tmp_path):
+    profiled_client = TestClient(ProfilingMiddleware(slow_app, sample_rate=1.0, interval=0.001, output_dir=str(tmp_path)))
+    response = profiled_client.get("/slow", headers={"X-Profile-Output": "inline"})
+    assert response.status_code == 201
+    assert response.text == "done"
+    assert "x-profile-file" not in response.headers
+    assert "x-profile-status" not in response.headers
+
+    [path] = tmp_path.iterdir()
+    with open(path) as file:
+        profile = json.load(file)
+    names = frame_names(profile)
+    assert "wait_downstream" in names
+    assert "<await>" in names
+    assert sum(profile["profiles"][0]["weights"]) > 0.04
+
+
+def test_non_admin_inline_request_gets_its_body(mongo_mock, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "middleware_stack", ProfilingMiddleware(app.build_middleware_stack(), sample_rate=1.0,
+                                                                     output_dir=str(tmp_path)))
+    response = client.get("/athletes/me/goals/",
+                          headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}",
+                                   "X-Profile-Output": "inline"})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "x-profile-status" not in response.headers
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_admin_header_returns_profile_file(tmp_path):
+    profiled_client = TestClient(ProfilingMiddleware(slow_app, output_dir=str(tmp_path)))
+    response = profiled_client.get("/slow", headers={"X-Profile": access_token_admin_example_mock_1})
+    assert response.status_code == 201
+    assert response.text == "done"
+    with open(response.headers["x-profile-file"]) as file:
+        assert json.load(file)["profiles"][0]["name"] == "GET /slow"
@@ -0,0 +1,125 @@
+import mongomock
+import pytest
+
+from datetime import datetime, timedelta, timezone
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import GoalTypes, State, UserRoles
+from app.services.progress_history import (
+    DAY,
+    HOUR,
+    RAW,
+    ROLLUPS_COLLECTION,
+    SAMPLES_COLLECTION,
+    ProgressHistory,
+    progress_history,
+)
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+start = datetime(2023, 6, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    monkeypatch.setattr(progress_history, "buffer", [])
+    return db
+
+
+def test_flush_writes_samples_and_incremental_rollups():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    history = ProgressHistory()
+    for minutes in (0, 30, 90):
+        history.record("user", 100, start + timedelta(minutes=minutes))
+    assert history.flush(db) == 3
+    history.record("user", 50, start + timedelta(hours=2))
+    history.flush(db)
+
+    assert db[SAMPLES_COLLECTION].count_documents({}) == 4
+    hours = [(rollup["start"].hour, rollup["steps"]) for rollup in db[ROLLUPS_COLLECTION].find({"granularity": HOUR})]
+    assert hours == [(0, 200), (1, 100), (2, 50)]
+    assert db[ROLLUPS_COLLECTION].find_one({"granularity": DAY})["steps"] == 350
+
+
+def test_query_picks_resolution_by_range():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    history = ProgressHistory()
+    for day in range(30):
+        history.record("user", 10, start + timedelta(days=day, hours=12))
+    history.flush(db)
+
+    granularity, points = history.query(db[SAMPLES_COLLECTION], db[ROLLUPS_COLLECTION], "user",
+                                        start, start + timedelta(hours=20))
+    assert (granularity, len(points)) == (RAW, 1)
+    granularity, points = history.query(db[SAMPLES_COLLECTION], db[ROLLUPS_COLLECTION], "user",
+                                        start, start + timedelta(days=7))
+    assert (granularity, len(points)) == (HOUR, 7)
+    granularity, points = history.query(db[SAMPLES_COLLECTION], db[ROLLUPS_COLLECTION], "user",
+                                        start, start + timedelta(days=30))
+    assert (granularity, len(points)) == (DAY, 30)
+
+
+def test_goal_history_endpoint_converts_to_goal_metric(mongo_mock):
+    response = client.post("/athletes/me/goals/",
+                           json={"title": "Test Goal Kilometers",
+                                 "description": "This is a test of Goal Kilometers",
+                                 "metric": GoalTypes.KILOMETERS.value,
+                                 "quantity_steps": 10},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    goal_id = response.json()["id"]
+    client.patch(f"/athletes/me/goals/{goal_id}/start", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    response = client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 1000},
+                            headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    progress_history.flush(mongo_mock)
+
+    response = client.get(f"/athletes/me/goals/{goal_id}/history", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert response.json()["granularity"] == RAW
+    assert [point["progress"] for point in response.json()["points"]] == [0.76]
+
+
+def test_goal_history_is_only_visible_to_its_owner(mongo_mock):
+    goal_id = mongo_mock.goals.insert_one({"user_id": athlete_id_example_mock_1, "title": "Walk",
+                                           "metric": GoalTypes.STEPS.value, "state": State.INIT.value,
+                                           "date_init": start}).inserted_id
+
+    response = client.get(f"/athletes/me/goals/{goal_id}/history")
+    assert response.status_code == 403
+
+    other_token = generate_token_with_role(str(ObjectId()), UserRoles.ATLETA)
+    response = client.get(f"/athletes/me/goals/{goal_id}/history", headers={"Authorization": f"Bearer {other_token}"})
+    assert response.status_code == 404
+
+
+def test_goal_history_only_has_the_steps_of_the_goal_period(mongo_mock):
+    mongo_mock.goals.insert_many([
+        {"_id": ObjectId(), "user_id": athlete_id_example_mock_1, "title": "Stopped", "metric": GoalTypes.STEPS.value,
+         "state": State.STOP.value, "date_init": start + timedelta(hours=1), "date_stop": start + timedelta(hours=3)},
+        {"_id": ObjectId(), "user_id": athlete_id_example_mock_1, "title": "Never started",
+         "metric": GoalTypes.STEPS.value, "state": State.NOT_INIT.value},
+    ])
+    stopped, not_started = [goal["_id"] for goal in mongo_mock.goals.find()]
+    for hours in range(5):
+        progress_history.record(athlete_id_example_mock_1, 100 + hours, start + timedelta(hours=hours, minutes=30))
+    progress_history.flush(mongo_mock)
+
+    headers = {"Authorization": f"Bearer {access_token_athlete_example_mock_1}"}
+    response = client.get(f"/athletes/me/goals/{stopped}/history", headers=headers)
+    assert [point["progress"] for point in response.json()["points"]] == [101, 102]
+
+    # Un rango mas amplio se recorta al periodo de la meta
+    response = client.get(f"/athletes/me/goals/{stopped}/history", headers=headers,
+                          params={"start": start.isoformat(), "end": (start + timedelta(hours=2)).isoformat()})
+    assert [point["progress"] for point in response.json()["points"]] == [101]
+
+    response = client.get(f"/athletes/me/goals/{not_started}/history", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["points"] == []
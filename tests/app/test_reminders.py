@@ -0,0 +1,143 @@
+import asyncio
+import mongomock
+import pytest
+
+from datetime import datetime, timedelta, timezone
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import GoalTypes, State, UserRoles
+from app.repositories.goals import DocumentGoalRepository
+from app.services.reminders import ReminderScheduler, TimerWheel, reminder_scheduler
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+now = datetime.now(timezone.utc)
+
+@pytest.fixture()
+def goals_repository():
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    return DocumentGoalRepository(db.goals)
+
+
+@pytest.fixture()
+def loaded_scheduler(monkeypatch, goals_repository):
+    app.logger = logger
+    monkeypatch.setattr(app, "database", goals_repository.collection.database, raising=False)
+    monkeypatch.setattr(reminder_scheduler, "loaded_until", now + timedelta(hours=26))
+    monkeypatch.setattr(reminder_scheduler, "wheel", TimerWheel(60))
+    monkeypatch.setattr(reminder_scheduler, "limits", {})
+    monkeypatch.setattr(reminder_scheduler, "sent", {})
+    monkeypatch.setattr(reminder_scheduler, "loaded_at", None)
+    return reminder_scheduler
+
+
+def insert_goal(repository, limit, state=State.INIT.value):
+    return repository.insert({"user_id": athlete_id_example_mock_1, "title": "Meta", "limit": limit, "state": state})
+
+
+def test_timer_wheel_returns_due_entries_once():
+    wheel = TimerWheel(resolution=10)
+    wheel.schedule("a", 100, "first")
+    wheel.schedule("b", 125, "second")
+    wheel.schedule("c", 300, "third")
+    wheel.cancel("c")
+
+    assert wheel.advance(105) == ["first"]
+    assert wheel.advance(110) == []
+    assert wheel.advance(200) == ["second"]
+    assert len(wheel) == 0
+
+
+def test_scheduler_loads_only_the_window(goals_repository):
+    scheduler = ReminderScheduler([timedelta(hours=24), timedelta(hours=1)], window=timedelta(hours=1))
+    insert_goal(goals_repository, now + timedelta(hours=2))
+    insert_goal(goals_repository, now + timedelta(hours=24, minutes=30))
+    insert_goal(goals_repository, now + timedelta(days=10))
+    insert_goal(goals_repository, now + timedelta(hours=3), state=State.COMPLETE.value)
+
+    assert scheduler.load(goals_repository, now) == 2
+    # 2h: solo el aviso de 1h; 24h30m: los avisos de 24h y de 1h
+    assert len(scheduler.wheel) == 3
+    assert scheduler.load(goals_repository, now) == 2
+    assert len(scheduler.wheel) == 3
+
+
+def test_scheduler_dispatches_due_reminders_in_batches(monkeypatch, goals_repository):
+    sent = []
+
+    async def mock_send_reminders(reminders):
+        sent.append(reminders)
+
+    monkeypatch.setattr("app.services.services.NotificationService.send_reminders", mock_send_reminders)
+    scheduler = ReminderScheduler([timedelta(hours=1)], window=timedelta(hours=1), batch_size=2)
+    for _ in range(3):
+        insert_goal(goals_repository, now + timedelta(hours=1, minutes=30))
+    scheduler.load(goals_repository, now)
+
+    assert scheduler.due(now) == []
+    reminders = scheduler.due(now + timedelta(minutes=31))
+    asyncio.run(scheduler.dispatch(reminders))
+    assert [len(batch) for batch in sent] == [2, 1]
+    assert sent[0][0]["hours_left"] == 1
+    assert sent[0][0]["id_receiver"] == athlete_id_example_mock_1
+
+
+@pytest.fixture()
+def sent(monkeypatch):
+    sent = []
+
+    async def mock_send_reminders(reminders):
+        sent.extend(reminders)
+
+    monkeypatch.setattr("app.services.services.NotificationService.send_reminders", mock_send_reminders)
+    return sent
+
+
+def test_goal_completed_after_it_is_scheduled_gets_no_reminder(goals_repository, sent):
+    scheduler = ReminderScheduler([timedelta(hours=1)], window=timedelta(hours=1))
+    id_goal = insert_goal(goals_repository, now + timedelta(hours=1, minutes=30))
+    scheduler.load(goals_repository, now)
+    assert len(scheduler.wheel) == 1
+
+    # Otro proceso completa la meta
+    goals_repository.update(id_goal, {"state": State.COMPLETE.value})
+    asyncio.run(scheduler.tick(goals_repository, now + timedelta(minutes=31)))
+    assert sent == []
+    assert len(scheduler.wheel) == 0
+
+
+def test_goals_changed_by_other_processes_are_picked_up(goals_repository, sent):
+    scheduler = ReminderScheduler([timedelta(hours=1)], window=timedelta(hours=1))
+    moved = insert_goal(goals_repository, now + timedelta(hours=1, minutes=30))
+    asyncio.run(scheduler.tick(goals_repository, now))
+
+    # Creada y movida sin pasar por el scheduler
+    created = insert_goal(goals_repository, now + timedelta(hours=1, minutes=40))
+    goals_repository.update(moved, {"limit": now + timedelta(hours=1, minutes=50)})
+    asyncio.run(scheduler.tick(goals_repository, now + timedelta(minutes=42)))
+    assert [reminder["id_goal"] for reminder in sent] == [str(created)]
+
+    asyncio.run(scheduler.tick(goals_repository, now + timedelta(minutes=52)))
+    asyncio.run(scheduler.tick(goals_repository, now + timedelta(minutes=53)))
+    assert [reminder["id_goal"] for reminder in sent] == [str(created), str(moved)]
+
+
+def test_creating_and_deleting_goal_updates_reminders(loaded_scheduler):
+    response = client.post("/athletes/me/goals/",
+                           json={"title": "Test Goal Steps",
+                                 "description": "This is a test of Goal Step",
+                                 "metric": GoalTypes.STEPS.value,
+                                 "quantity_steps": 1500,
+                                 "limit_time": str(now + timedelta(hours=3))},
+                           headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    goal_id = response.json()["id"]
+    assert (goal_id, timedelta(hours=1)) in loaded_scheduler.wheel
+
+    response = client.delete(f"/athletes/me/goals/{goal_id}", headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}"})
+    assert response.status_code == 200
+    assert len(loaded_scheduler.wheel) == 0
@@ -0,0 +1,90 @@
+import mongomock
+
+from datetime import datetime, timedelta, timezone
+from app.jobs.checkpoints import load_checkpoint, save_checkpoint
+from app.jobs.repair_goals import EXPIRED, JOB_NAME, MODIFIED, STRING_LIMIT, plan_ranges, repair_goals
+from app.models.goal import State
+from bson import ObjectId
+
+now = datetime(2023, 6, 1, tzinfo=timezone.utc)
+future = now + timedelta(days=30)
+
+
+def goal_id(days_ago):
+    return ObjectId.from_datetime(now - timedelta(days=days_ago))
+
+
+def seed(db):
+    goals = {
+        "string_limit": {"_id": goal_id(40), "state": State.NOT_INIT.value, "limit": "2030-01-01T00:00:00+00:00"},
+        "overdue": {"_id": goal_id(30), "state": State.INIT.value, "limit": now - timedelta(days=1)},
+        "overdue_string": {"_id": goal_id(20), "state": State.STOP.value, "limit": "2020-01-01T00:00:00"},
+        "reached": {"_id": goal_id(10), "state": State.INIT.value, "limit": future,
+                    "progress_steps": 1500, "quantity_steps": 1500},
+        "completed_overdue": {"_id": goal_id(5), "state": State.COMPLETE.value, "limit": now - timedelta(days=1)},
+        "consistent": {"_id": goal_id(1), "state": State.INIT.value, "limit": future,
+                       "progress_steps": 10, "quantity_steps": 1500},
+    }
+    db.goals.insert_many(list(goals.values()))
+    return {name: goal["_id"] for name, goal in goals.items()}
+
+
+def test_plan_ranges_covers_all_ids():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    assert plan_ranges(db.goals, 4) == []
+    ids = seed(db)
+    ranges = plan_ranges(db.goals, 4)
+    assert len(ranges) == 4
+    assert ranges[0][0] is None and ranges[-1][1] is None
+    for goal_id_ in ids.values():
+        assert sum(1 for lower, upper in ranges
+                   if (lower is None or goal_id_ >= lower) and (upper is None or goal_id_ < upper)) == 1
+
+
+def test_dry_run_only_reports():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    seed(db)
+    before = list(db.goals.find())
+
+    report = repair_goals(lambda: db, workers=2, batch_size=1, dry_run=True, now=now)
+    assert report == {STRING_LIMIT: 2, EXPIRED: 2}
+    assert list(db.goals.find()) == before
+    assert load_checkpoint(db, JOB_NAME) is None
+
+
+def test_repair_applies_state_rules():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    ids = seed(db)
+
+    report = repair_goals(lambda: db, workers=2, batch_size=1, now=now)
+    assert report[MODIFIED] == 3
+
+    def goal(name):
+        return db.goals.find_one({"_id": ids[name]})
+
+    assert goal("string_limit")["limit"] == datetime(2030, 1, 1, tzinfo=timezone.utc)
+    assert goal("string_limit")["state"] == State.NOT_INIT.value
+    assert goal("overdue")["state"] == State.EXPIRED.value
+    assert goal("overdue_string")["state"] == State.EXPIRED.value
+    assert goal("overdue_string")["limit"] == datetime(2020, 1, 1, tzinfo=timezone.utc)
+    # Completar la meta queda para las rutas de progreso
+    assert goal("reached")["state"] == State.INIT.value
+    assert "date_complete" not in goal("reached")
+    assert goal("completed_overdue")["state"] == State.COMPLETE.value
+    assert "seq" not in goal("consistent")
+    assert load_checkpoint(db, JOB_NAME) is None
+
+    assert repair_goals(lambda: db, workers=2, now=now) == {}
+
+
+def test_repair_resumes_planned_ranges_from_checkpoints():
+    db = mongomock.MongoClient(tz_aware=True).get_database("goals_microservice")
+    ids = seed(db)
+    save_checkpoint(db, JOB_NAME, [[None, None]])
+    # El rango ya habia avanzado hasta "overdue"
+    save_checkpoint(db, f'{JOB_NAME}:0', {"last_id": ids["overdue"]})
+
+    report = repair_goals(lambda: db, workers=2, now=now)
+    assert report[MODIFIED] == 1
+    assert db.goals.find_one({"_id": ids["overdue"]})["state"] == State.INIT.value
+    assert load_checkpoint(db, f'{JOB_NAME}:0') is None
@@ -0,0 +1,146 @@
+import asyncio
+import httpx
+import mongomock
+import pytest
+
+from fastapi import FastAPI, Request, Response
+from app.routes.goal_trainers import get_training_athletes
+from app.services.cache import SingleFlightCache, cache_requests
+from app.services.services import training_cache
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def make_response(status_code):
+    response = Response()
+    response.status_code = status_code
+    return response
+
+
+@pytest.fixture()
+def mongo_mock(monkeypatch):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+    return db
+
+
+def test_concurrent_gets_share_one_fetch():
+    cache = SingleFlightCache("test-coalesce", ttl=30)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "user"
+
+    async def run():
+        return await asyncio.gather(*[cache.get("/users/1", fetch) for _ in range(10)])
+
+    assert asyncio.run(run()) == ["user"] * 10
+    assert len(calls) == 1
+    assert cache_requests.value(cache="test-coalesce", result="miss") == 1
+    assert cache_requests.value(cache="test-coalesce", result="coalesced") == 9
+
+    assert asyncio.run(cache.get("/users/1", fetch)) == "user"
+    assert len(calls) == 1
+    assert cache_requests.value(cache="test-coalesce", result="hit") == 1
+
+
+def test_stale_entry_is_served_while_refreshed():
+    clock = FakeClock()
+    cache = SingleFlightCache("test-stale", ttl=30, stale_ttl=60, clock=clock)
+    versions = iter(["v1", "v2", "v3"])
+
+    async def fetch():
+        return next(versions)
+
+    async def run():
+        first = await cache.get("/users/1", fetch)
+        clock.now = 40
+        stale = await cache.get("/users/1", fetch)
+        await asyncio.sleep(0)
+        refreshed = await cache.get("/users/1", fetch)
+        clock.now = 200
+        expired = await cache.get("/users/1", fetch)
+        return first, stale, refreshed, expired
+
+    assert asyncio.run(run()) == ("v1", "v1", "v2", "v3")
+    assert cache_requests.value(cache="test-stale", result="stale") == 1
+
+
+def test_not_found_is_cached_briefly_and_errors_are_not_cached():
+    clock = FakeClock()
+    cache = SingleFlightCache(
+        "test-negative",
+        ttl=30,
+        stale_ttl=60,
+        negative_ttl=5,
+        is_cacheable=lambda response: response.status_code in (200, 404),
+        is_negative=lambda response: response.status_code == 404,
+        clock=clock,
+    )
+    calls = []
+
+    def fetch_status(status_code):
+        async def fetch():
+            calls.append(status_code)
+            return make_response(status_code)
+        return fetch
+
+    async def run():
+        await cache.get("/users/missing", fetch_status(404))
+        await cache.get("/users/missing", fetch_status(404))
+        clock.now = 10
+        await cache.get("/users/missing", fetch_status(404))
+        await cache.get("/users/broken", fetch_status(500))
+        await cache.get("/users/broken", fetch_status(500))
+
+    asyncio.run(run())
+    assert calls == [404, 404, 500, 500]
+    assert cache_requests.value(cache="test-negative", result="negative_hit") == 1
+
+
+def test_concurrent_training_lookups_share_one_request(monkeypatch):
+    training_cache.clear()
+    stub = FastAPI()
+    calls = []
+
+    @stub.get("/trainers/me/trainings/{training_id}/athletes")
+    async def athletes(training_id: str, request: Request):
+        calls.append((training_id, request.headers.get("authorization")))
+        await asyncio.sleep(0.01)
+        return ["athlete_1", {"id": "athlete_2"}]
+
+    monkeypatch.setattr("app.services.services.http_client", lambda: httpx.AsyncClient(app=stub))
+
+    class FakeRequest:
+        def __init__(self, token):
+            self.headers = {"authorization": token}
+
+    coalesced = cache_requests.value(cache="training-service", result="coalesced")
+
+    async def run():
+        lookups = [get_training_athletes(FakeRequest("Bearer a"), "training_1") for _ in range(10)]
+        lookups.append(get_training_athletes(FakeRequest("Bearer b"), "training_1"))
+        return await asyncio.gather(*lookups)
+
+    assert asyncio.run(run()) == [["athlete_1", "athlete_2"]] * 11
+    # Un token distinto no comparte la respuesta
+    assert sorted(calls) == [("training_1", "Bearer a"), ("training_1", "Bearer b")]
+    assert cache_requests.value(cache="training-service", result="coalesced") == coalesced + 9
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'cache_requests_total{cache="training-service",result="coalesced"}' in response.text
+    training_cache.clear()
@@ -0,0 +1,84 @@
+import json
+import mongomock
+import pytest
+
+from app.auth.auth_utils import generate_token_with_role
+from app.models.goal import UserRoles
+from app.services.tracing import (
+    FileSpanExporter,
+    SimpleSpanProcessor,
+    Tracer,
+    inject_headers,
+    parse_traceparent,
+    tracer,
+)
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from app.main import app, logger
+
+client = TestClient(app)
+athlete_id_example_mock_1 = str(ObjectId())
+access_token_athlete_example_mock_1 = generate_token_with_role(athlete_id_example_mock_1, UserRoles.ATLETA)
+
+trace_id_example = "4bf92f3577b34da6a3ce929d0e0e4736"
+traceparent_example = f"00-{trace_id_example}-00f067aa0ba902b7-01"
+
+@pytest.fixture()
+def traces_file(monkeypatch, tmp_path):
+    mongo_client = mongomock.MongoClient()
+    db = mongo_client.get_database("goals_microservice")
+    app.logger = logger
+    monkeypatch.setattr(app, "database", db, raising=False)
+
+    path = tmp_path / "traces.jsonl"
+    tracer.configure(SimpleSpanProcessor(FileSpanExporter(str(path))), 1.0)
+    yield path
+    tracer.configure(None, 1.0)
+
+
+def read_spans(path):
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans.extend(scope["spans"])
+    return spans
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(traceparent_example) == (trace_id_example, "00f067aa0ba902b7", True)
+    assert parse_traceparent("00-xyz-00f067aa0ba902b7-01") is None
+    assert parse_traceparent(f"00-{'0' * 32}-00f067aa0ba902b7-01") is None
+
+
+def test_ratio_zero_does_not_record_but_propagates():
+    local_tracer = Tracer(SimpleSpanProcessor(FileSpanExporter("/dev/null")), 0.0)
+    with local_tracer.start_as_current_span("root") as span:
+        assert not span.is_recording
+        assert inject_headers({})["traceparent"] == span.traceparent
+        assert span.traceparent.endswith("-00")
+
+
+def test_request_span_continues_incoming_trace(traces_file):
+    response = client.get("/athletes/me/goals/",
+                          headers={"Authorization": f"Bearer {access_token_athlete_example_mock_1}",
+                                   "traceparent": traceparent_example})
+    assert response.status_code == 200
+
+    spans = read_spans(traces_file)
+    assert len(spans) == 1
+    assert spans[0]["traceId"] == trace_id_example
+    assert spans[0]["parentSpanId"] == "00f067aa0ba902b7"
+    assert spans[0]["name"] == "GET /athletes/me/goals/"
+    assert spans[0]["kind"] == 2
+
+
+def test_child_span_injects_traceparent(traces_file):
+    with tracer.start_as_current_span("parent") as parent:
+        with tracer.start_as_current_span("child") as child:
+            headers = inject_headers({"authorization": "Bearer x"})
+    assert headers["traceparent"] == child.traceparent
+    assert child.trace_id == parent.trace_id
+    spans = read_spans(traces_file)
+    assert [span["name"] for span in spans] == ["child", "parent"]
+    assert spans[0]["parentSpanId"] == parent.span_id
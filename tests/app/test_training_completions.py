@@ -0,0 +1,235 @@
+import asyncio
+import httpx
+import mongomock
+import pytest
+
+from bson import ObjectId
+from datetime import datetime, timezone
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from starlette.responses import JSONResponse
+from app.auth.auth_utils import generate_token_with_role
+from app.main import app
+from app.models.goal import GoalTypes, State, UserRoles
+from app.services.training_completions import (
+    COMPLETIONS_PATH,
+    DEAD_LETTERS_COLLECTION,
+    TrainingCompletions,
+    completion_id,
+    dead_completions,
+    patch_completion,
+    post_completions,
+    training_completions,
+)
+
+client = TestClient(app)
+now = datetime(2023, 6, 1, tzinfo=timezone.utc)
+
+
+class TrainingServiceStub:
+    """Training service applying each completion once, with or without a batch endpoint."""
+
+    def __init__(self, batch=True):
+        self.app = FastAPI()
+        self.batches = []
+        self.applied = []
+        self.statuses = []
+        self.one_statuses = []
+        self.tokens = []
+        if batch:
+            self.app.post(COMPLETIONS_PATH)(self.complete)
+        self.app.patch("/athletes/{athlete_id}/trainings/{training_id}/complete")(self.complete_one)
+
+    def apply(self, completions):
+        applied = {completion["id"] for completion in self.applied}
+        self.applied.extend(c for c in completions if c["id"] not in applied)
+
+    async def complete(self, request: Request):
+        completions = (await request.json())["completions"]
+        self.batches.append([completion["id"] for completion in completions])
+        self.tokens.append(request.headers.get("authorization"))
+        status_code = self.statuses.pop(0) if self.statuses else 200
+        if status_code >= 400 and status_code != 503:
+            return JSONResponse(status_code=status_code, content={})
+        self.apply(completions)
+        # Un 503 despues de aplicar: la respuesta se pierde y el lote se reenvia
+        return JSONResponse(status_code=status_code, content={})
+
+    async def complete_one(self, athlete_id: str, training_id: str, request: Request):
+        self.tokens.append(request.headers.get("authorization"))
+        status_code = self.one_statuses.pop(0) if self.one_statuses else 200
+        if status_code < 400:
+            self.apply([{**(await request.json()), "training_id": training_id}])
+        return JSONResponse(status_code=status_code, content={})
+
+
+def use_stub(monkeypatch, stub):
+    monkeypatch.setattr(
+        "app.services.services.http_client", lambda: httpx.AsyncClient(app=stub.app)
+    )
+    return stub
+
+
+@pytest.fixture()
+def stub(monkeypatch):
+    monkeypatch.setattr("app.services.training_completions.app_settings.TRAINING_SERVICE_TOKEN", "service-token")
+    return use_stub(monkeypatch, TrainingServiceStub())
+
+
+def add_completions(completions, trainings, goals_per_training):
+    goal_ids = {}
+    for number in range(goals_per_training):
+        for training_id in trainings:
+            goal_id = ObjectId()
+            goal_ids.setdefault(training_id, []).append(completion_id(goal_id, training_id))
+            completions.add(ObjectId(), training_id, goal_id, now)
+    return goal_ids
+
+
+def queued_trainings(completions):
+    return [completion["training_id"] for completion in completions.queue]
+
+
+def test_completions_are_sent_in_batches_keeping_order_per_training(stub):
+    completions = TrainingCompletions(batch_size=2)
+    ids = add_completions(completions, ["training-a", "training-b"], 3)
+
+    assert asyncio.run(completions.flush(post_completions)) == 6
+    assert [len(batch) for batch in stub.batches] == [2, 2, 2]
+    assert completions.queue == []
+    for training_id, expected in ids.items():
+        assert [c["id"] for c in stub.applied if c["training_id"] == training_id] == expected
+
+
+def test_failed_batch_is_retried_first_and_applied_once(stub):
+    completions = TrainingCompletions(batch_size=2)
+    add_completions(completions, ["training-a"], 3)
+    stub.statuses = [503]
+
+    assert asyncio.run(completions.flush(post_completions)) == 0
+    assert completions.failures == 1
+    assert len(completions.queue) == 3
+
+    assert asyncio.run(completions.flush(post_completions)) == 3
+    assert stub.batches[0] == stub.batches[1]
+    assert len(stub.applied) == 3
+    assert completions.failures == 0
+
+
+def test_rejected_batch_only_dead_letters_the_invalid_completions(stub):
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    completions = TrainingCompletions(batch_size=3)
+    ids = add_completions(completions, ["training-a"], 3)
+    stub.statuses = [400]
+    stub.one_statuses = [200, 422, 200]
+
+    assert asyncio.run(completions.flush(post_completions, patch_completion, db)) == 2
+    assert completions.queue == []
+    assert completions.failures == 0
+    assert [c["id"] for c in stub.applied] == [ids["training-a"][0], ids["training-a"][2]]
+    [dead] = db[DEAD_LETTERS_COLLECTION].find()
+    assert (dead["_id"], dead["status"]) == (ids["training-a"][1], 422)
+    # El endpoint de lotes existe: el proximo flush vuelve a usarlo
+    assert completions.batch_supported
+
+
+def test_failed_training_does_not_hold_back_the_others(stub):
+    completions = TrainingCompletions(batch_size=1)
+    add_completions(completions, ["training-a", "training-b"], 2)
+    stub.statuses = [503]
+
+    assert asyncio.run(completions.flush(post_completions)) == 2
+    assert queued_trainings(completions) == ["training-a", "training-a"]
+    assert [c["training_id"] for c in stub.applied] == ["training-a", "training-b", "training-b"]
+
+
+def test_completions_are_sent_with_the_service_credential(stub):
+    completions = TrainingCompletions(batch_size=10)
+    add_completions(completions, ["training-a"], 3)
+
+    assert asyncio.run(completions.flush(post_completions)) == 3
+    assert stub.tokens == ["Bearer service-token"]
+
+
+def test_unauthorized_completion_does_not_block_later_ones(monkeypatch):
+    stub = use_stub(monkeypatch, TrainingServiceStub(batch=False))
+    completions = TrainingCompletions(batch_size=10)
+    completions.batch_supported = False
+    ids = add_completions(completions, ["training-a", "training-b"], 2)
+    stub.one_statuses = [401]
+    dead = dead_completions.value(status="401")
+
+    assert asyncio.run(completions.flush(post_completions, patch_completion)) == 3
+    assert completions.queue == []
+    assert completions.failures == 0
+    assert dead_completions.value(status="401") == dead + 1
+    assert sorted(c["id"] for c in stub.applied) == sorted(ids["training-a"][1:] + ids["training-b"])
+
+
+def test_missing_batch_endpoint_falls_back_to_one_patch_per_goal(monkeypatch):
+    stub = use_stub(monkeypatch, TrainingServiceStub(batch=False))
+    completions = TrainingCompletions(batch_size=10)
+    add_completions(completions, ["training-a", "training-b"], 1)
+
+    assert asyncio.run(completions.flush(post_completions, patch_completion)) == 2
+    assert completions.queue == []
+    assert not completions.batch_supported
+    assert [c["training_id"] for c in stub.applied] == ["training-a", "training-b"]
+    assert len(stub.tokens) == 2
+
+
+def test_unreachable_service_keeps_the_queue():
+    async def fail(batch):
+        raise ConnectionError("down")
+
+    completions = TrainingCompletions()
+    add_completions(completions, ["training-a"], 2)
+    assert asyncio.run(completions.flush(fail)) == 0
+    assert len(completions.queue) == 2
+    assert completions.delay(1) == 2
+
+
+def test_full_batch_is_sent_before_the_interval(stub):
+    completions = TrainingCompletions(batch_size=2)
+
+    async def scenario():
+        task = asyncio.create_task(completions.run(60, None, post_completions))
+        await asyncio.sleep(0)
+        add_completions(completions, ["training-a"], 2)
+        for _ in range(100):
+            if stub.applied:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert len(stub.applied) == 2
+
+
+def test_completed_goal_with_training_is_queued(monkeypatch):
+    async def mock_ok(*args, **kwargs):
+        return None
+
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("single completion call")
+
+    db = mongomock.MongoClient().get_database("goals_microservice")
+    monkeypatch.setattr(app, "database", db, raising=False)
+    monkeypatch.setattr("app.services.services.NotificationService.send_notification_completed", mock_ok)
+    monkeypatch.setattr("app.services.services.ServiceTrainers.patch", unexpected)
+    monkeypatch.setattr(training_completions, "queue", [])
+    monkeypatch.setattr("app.routes.goal_states.app_settings.TRAINING_COMPLETIONS_BATCH_ENABLED", True)
+
+    user_id = str(ObjectId())
+    token = generate_token_with_role(user_id, UserRoles.ATLETA)
+    goal_id, training_id = ObjectId(), str(ObjectId())
+    db.goals.insert_one({"_id": goal_id, "user_id": user_id, "training_id": training_id, "title": "Goal",
+                         "description": "Goal", "metric": GoalTypes.STEPS.value, "quantity_steps": 100,
+                         "progress_steps": 0, "state": State.INIT.value, "limit": None})
+
+    response = client.patch("/athletes/me/goals/progress_steps", json={"progress_steps": 150},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert [(c["id"], c["athlete_id"]) for c in training_completions.queue] == [
+        (completion_id(goal_id, training_id), user_id)
+    ]